@@ -15,7 +15,7 @@ import streamlit as st
 from services.llm_coach.coach_service import CoachService
 from user_profile.loader import load_profile
 from infrastructure.llm_clients.base import LLModels
-from django.db import connection
+from django.db import close_old_connections, connection
 import structlog  # Assuming you use structlog for logging
 
 log = structlog.get_logger(__name__)
@@ -37,9 +37,8 @@ I can help you analyze your runs, create training plans, and provide expert guid
 
     if "user_profile_data" not in st.session_state:
         try:
-            # Ensure database connection is fresh
-            connection.close()
-            connection.connect()
+            # Drop the thread's connection if it is broken or past CONN_MAX_AGE
+            close_old_connections()
             
             # Load profile with retry mechanism
             max_retries = 3
@@ -53,8 +52,8 @@ I can help you analyze your runs, create training plans, and provide expert guid
                 except ValueError as ve:
                     # Handle specific ValueError from QuerySet evaluation
                     log.warning("QuerySet evaluation error, retrying...", exc_info=ve)
+                    # Reopened lazily by the next query
                     connection.close()
-                    connection.connect()
                     retry_count += 1
                     last_error = ve
                     if retry_count == max_retries:
@@ -264,10 +263,8 @@ def process_message(user_query: str):
 
             with st.status("Processing your request...", expanded=True) as status_box:
                 try:
-                    if not connection.is_usable():
-                        status_box.update(label="Reconnecting to database...", state="running")
-                        connection.close()
-                        connection.connect()
+                    # Streamlit reruns outside Django's request cycle, so expire connections here
+                    close_old_connections()
 
                     def status_cb(msg: str):
                         nonlocal thoughts_content, current_section, has_shown_initial_message
@@ -0,0 +1,334 @@
+import math
+from typing import Iterable, Optional
+
+import numpy as np
+
+# Compression of per-unit digests: a 100-phase curve keeps about 30 centroids
+# rather than every value; its exact quartiles are kept on the sketch instead
+UNIT_COMPRESSION = 64
+
+
+class TDigest():
+    """
+    Merging t-digest (Dunning) for mergeable quantile estimates.
+
+    Centroids stay exact (one per value) until there are more than
+    `compression` of them; beyond that they are merged with the k1 (arcsine)
+    scale function, which keeps the tails accurate.
+    """
+
+    def __init__(self, means=None, weights=None, compression: int = 100):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+
+    @classmethod
+    def from_sorted(cls, values: np.ndarray, compression: int = 100) -> "TDigest":
+        digest = cls(values, np.ones(len(values)), compression)
+        digest._compress()
+        return digest
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        return TDigest.merge_all([self, other])
+
+    @classmethod
+    def merge_all(cls, digests: Iterable["TDigest"]) -> "TDigest":
+        """Merge any number of digests with a single sort and compression pass."""
+        digests = list(digests)
+        if not digests:
+            return cls()
+
+        means = np.concatenate([digest.means for digest in digests])
+        weights = np.concatenate([digest.weights for digest in digests])
+        order = np.lexsort((weights, means))
+        digest = cls(means[order], weights[order], max(digest.compression for digest in digests))
+        digest._compress()
+        return digest
+
+    def _compress(self) -> None:
+        if len(self.means) <= self.compression:
+            return
+
+        # k1 scale of each centroid's centre: k spans [-compression / 4, compression / 4],
+        # and centroids within the same unit of k are merged in one vectorised pass
+        total = self.weights.sum()
+        centres = (np.cumsum(self.weights) - self.weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * centres - 1, -1, 1))
+        groups = np.floor(k + self.compression / 4).astype(np.int64)
+        starts = np.flatnonzero(np.diff(groups, prepend=-1))
+
+        weights = np.add.reduceat(self.weights, starts)
+        self.means = np.add.reduceat(self.means * self.weights, starts) / weights
+        self.weights = weights
+
+    def quantile(self, q, minimum: float, maximum: float):
+        """
+        Estimate quantile(s) q in [0, 1], interpolating linearly between centroid
+        centres like np.percentile does between order statistics.
+        """
+        if not len(self.means):
+            return np.full(np.shape(q), np.nan)
+
+        count = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2 - 0.5
+        positions = np.concatenate([[0.0], centres, [count - 1]])
+        values = np.concatenate([[minimum], self.means, [maximum]])
+        return np.interp(np.asarray(q) * (count - 1), positions, values)
+
+    def to_dict(self) -> dict:
+        return {
+            'compression': self.compression,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TDigest":
+        return cls(data['means'], data['weights'], data.get('compression', 100))
+
+    def to_bytes(self) -> bytes:
+        """Packed centroids: float32 means followed by float32 weights."""
+        return np.concatenate([self.means, self.weights]).astype('<f4').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, compression: int = 100) -> "TDigest":
+        packed = np.frombuffer(data, dtype='<f4').astype(np.float64)
+        half = len(packed) // 2
+        return cls(packed[:half], packed[half:], compression)
+
+
+class SummarySketch():
+    """
+    Mergeable summary of a series: count, mean and M2 (Welford / Chan et al.)
+    for exact mean and std, min/max, and a t-digest for quartiles. Merging is
+    associative and commutative, so combining units, runs or weeks gives the
+    same result in any order without touching raw phase rows.
+
+    A sketch built from raw values also keeps their exact quartiles, so a
+    single unit summarises as np.percentile does whatever its digest's
+    compression; merged sketches estimate them from the digest.
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 minimum: float = math.inf, maximum: float = -math.inf,
+                 digest: Optional[TDigest] = None, quartiles: Optional[tuple] = None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+        self.digest = digest if digest is not None else TDigest()
+        # Exact (q1, median, q3), or None once merged
+        self.quartiles = quartiles
+
+    @classmethod
+    def from_values(cls, values, compression: int = 100) -> "SummarySketch":
+        """
+        Build a sketch from raw values; NaN (null) values are ignored.
+        :param values: Iterable or array of numbers.
+        :return: A SummarySketch over the finite values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = np.sort(values[~np.isnan(values)])
+        if not values.size:
+            return cls()
+
+        mean = float(values.mean())
+        return cls(
+            count=int(values.size),
+            mean=mean,
+            m2=float(np.sum((values - mean) ** 2)),
+            minimum=float(values[0]),
+            maximum=float(values[-1]),
+            digest=TDigest.from_sorted(values, compression),
+            quartiles=tuple(np.percentile(values, [25, 50, 75]).tolist()),
+        )
+
+    def merge(self, other: "SummarySketch") -> "SummarySketch":
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return SummarySketch(
+            count=count,
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta ** 2 * self.count * other.count / count,
+            minimum=min(self.min, other.min),
+            maximum=max(self.max, other.max),
+            digest=self.digest.merge(other.digest),
+        )
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable["SummarySketch"]) -> "SummarySketch":
+        """
+        Merge any number of sketches in one pass; unlike chained merge() calls
+        the result does not depend on the order of the inputs.
+        """
+        sketches = [sketch for sketch in sketches if sketch.count]
+        if not sketches:
+            return cls()
+        if len(sketches) == 1:
+            return sketches[0]
+
+        counts = np.array([sketch.count for sketch in sketches], dtype=np.float64)
+        means = np.array([sketch.mean for sketch in sketches])
+        count = counts.sum()
+        mean = float(np.dot(counts, means) / count)
+        m2 = float(sum(sketch.m2 for sketch in sketches) + np.dot(counts, (means - mean) ** 2))
+        return cls(
+            count=int(count),
+            mean=mean,
+            m2=m2,
+            minimum=min(sketch.min for sketch in sketches),
+            maximum=max(sketch.max for sketch in sketches),
+            digest=TDigest.merge_all(sketch.digest for sketch in sketches),
+        )
+
+    @property
+    def std(self) -> float:
+        """Population standard deviation, as np.std."""
+        return math.sqrt(self.m2 / self.count) if self.count else math.nan
+
+    def quantile(self, q):
+        return self.digest.quantile(q, self.min, self.max)
+
+    def summary(self, percision = 4) -> dict:
+        """
+        Return the sketch in the shape produced by get_summary.
+        :param percision: Number of decimals to round to.
+        :return: Dictionary of min, q1, median, q3, max, mean and std.
+        """
+        if not self.count:
+            return {key: math.nan for key in ('min', 'q1', 'median', 'q3', 'max', 'mean', 'std')}
+
+        q1, median, q3 = self.quartiles or self.quantile([0.25, 0.5, 0.75])
+        summary = {
+            'min': self.min,
+            'q1': q1,
+            'median': median,
+            'q3': q3,
+            'max': self.max,
+            'mean': self.mean,
+            'std': self.std,
+        }
+        return {key: round(float(value), percision) for key, value in summary.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'min': self.min,
+            'max': self.max,
+            'digest': self.digest.to_dict(),
+            'quartiles': list(self.quartiles) if self.quartiles else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SummarySketch":
+        return cls(
+            count=data['count'],
+            mean=data['mean'],
+            m2=data['m2'],
+            minimum=data['min'],
+            maximum=data['max'],
+            digest=TDigest.from_dict(data['digest']),
+            quartiles=tuple(data['quartiles']) if data.get('quartiles') else None,
+        )
+
+
+def sketches_from_stack(stacked: np.ndarray, compression: int = UNIT_COMPRESSION) -> list:
+    """
+    Build sketches for many series at once.
+    :param stacked: Array of shape (groups, values, columns); NaN marks nulls.
+    :param compression: Digest compression; quartiles are exact regardless.
+    :return: Nested list [group][column] of SummarySketch.
+    """
+    stacked = np.asarray(stacked, dtype=np.float64)
+    valid = ~np.isnan(stacked)
+    counts = valid.sum(axis=1)
+    safe_counts = np.maximum(counts, 1)
+    means = np.where(valid, stacked, 0.0).sum(axis=1) / safe_counts
+    m2s = np.where(valid, (stacked - means[:, None, :]) ** 2, 0.0).sum(axis=1)
+    # NaNs sort last, so the first `count` values of each column are its data
+    ordered = np.sort(stacked, axis=1)
+    # Exact quartiles as np.percentile: linear between order statistics of each column's data
+    positions = np.array([0.25, 0.5, 0.75])[None, :, None] * (safe_counts[:, None, :] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, safe_counts[:, None, :] - 1)
+    fraction = positions - lower
+    below = np.take_along_axis(ordered, lower, axis=1)
+    above = np.take_along_axis(ordered, upper, axis=1)
+    # np.percentile's interpolation, from whichever neighbour is nearer
+    quartiles = np.where(
+        fraction >= 0.5, above - (above - below) * (1 - fraction), below + (above - below) * fraction,
+    )
+
+    sketches = []
+    for g in range(stacked.shape[0]):
+        row = []
+        for c in range(stacked.shape[2]):
+            count = int(counts[g, c])
+            if not count:
+                row.append(SummarySketch())
+                continue
+            values = ordered[g, :count, c]
+            row.append(SummarySketch(
+                count=count,
+                mean=float(means[g, c]),
+                m2=float(m2s[g, c]),
+                minimum=float(values[0]),
+                maximum=float(values[-1]),
+                digest=TDigest.from_sorted(values, compression),
+                quartiles=tuple(quartiles[g, :, c].tolist()),
+            ))
+        sketches.append(row)
+    return sketches
+
+
+class PhaseAccumulator():
+    """
+    Running per-phase mean and variance over whole gait cycles (Welford, with
+    Chan's batch update), so cycles can be folded in as they arrive without
+    being kept. Arrays are (channels, phases) float64.
+    """
+
+    def __init__(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        self.count = count
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    @classmethod
+    def empty(cls, channels: int, phases: int) -> "PhaseAccumulator":
+        return cls(0, np.zeros((channels, phases)), np.zeros((channels, phases)))
+
+    def update(self, cycles: np.ndarray) -> None:
+        """
+        Fold in a batch of cycles.
+        :param cycles: Array of shape (cycles, channels, phases).
+        """
+        cycles = np.asarray(cycles, dtype=np.float64)
+        n = cycles.shape[0]
+        if not n:
+            return
+        batch_mean = cycles.mean(axis=0)
+        batch_m2 = ((cycles - batch_mean) ** 2).sum(axis=0)
+
+        count = self.count + n
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n / count)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * n / count)
+        self.count = count
+
+    def std(self) -> np.ndarray:
+        """Sample standard deviation per phase, as in the offline Std curves (NaN below two cycles)."""
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return np.sqrt(self.m2 / (self.count - 1))
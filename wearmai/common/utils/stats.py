@@ -1,23 +1,79 @@
+from typing import NamedTuple, Optional
+import warnings
 import numpy as np
 
+SUMMARY_KEYS = ('min', 'q1', 'median', 'q3', 'max', 'mean', 'std')
+
+
+class BatchSummary(NamedTuple):
+    """
+    Statistics of many columns at once. Every field is an array with the
+    reduced axis removed; `columns` names the last axis.
+    """
+    columns: list
+    count: np.ndarray
+    min: np.ndarray
+    q1: np.ndarray
+    median: np.ndarray
+    q3: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    std: np.ndarray
+
+    def to_dict(self, percision = 4) -> dict:
+        """
+        Convert to the get_summary shape, keyed by column.
+        Only supported for a 2-D input reduced to one value per column.
+        :param percision: Number of decimals to round to.
+        :return: {column: {'min': ..., 'q1': ..., ..., 'std': ...}}
+        """
+        rounded = np.round(np.stack([getattr(self, key) for key in SUMMARY_KEYS]).astype(np.float64), percision)
+        return {
+            column: dict(zip(SUMMARY_KEYS, rounded[:, i].tolist()))
+            for i, column in enumerate(self.columns)
+        }
+
+
+def get_batch_summary(data, axis = 0, dtype = np.float64, columns: Optional[list] = None) -> BatchSummary:
+    """
+    This function returns the summary of every column of an array in one vectorized pass.
+    NaN values (e.g. null FloatFields) are ignored; all-NaN columns summarise to NaN.
+    :param data: An array reduced over `axis`, or a dict of equally long 1-D arrays.
+    :param axis: The axis holding the values to summarise.
+    :param dtype: Computation dtype, e.g. np.float32 to halve memory on large batches.
+    :param columns: Names of the last axis; defaults to dict keys or positions.
+    :return: A BatchSummary; values are not rounded.
+    """
+    if isinstance(data, dict):
+        columns = list(data.keys()) if columns is None else columns
+        data = np.column_stack([np.asarray(values, dtype=dtype) for values in data.values()])
+        axis = 0
+    else:
+        data = np.asarray(data, dtype=dtype)
+        if columns is None:
+            columns = list(range(data.shape[-1])) if data.ndim > 1 else [0]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        q1, median, q3 = np.nanpercentile(data, [25, 50, 75], axis=axis)
+        return BatchSummary(
+            columns=columns,
+            count=np.sum(~np.isnan(data), axis=axis),
+            min=np.nanmin(data, axis=axis),
+            q1=q1,
+            median=median,
+            q3=q3,
+            max=np.nanmax(data, axis=axis),
+            mean=np.nanmean(data, axis=axis),
+            std=np.nanstd(data, axis=axis),
+        )
+
+
 def get_summary(list, percision = 4):
     """
     This function returns the summary of a list.
     :param list: The list to get the summary of.
     :return: The summary of the list as a dictionary.
     """
-    summary = {
-        'min': round(min(list), percision),
-        'q1': round(np.percentile(list, 25), percision),
-        'median': round(np.percentile(list, 50), percision),
-        'q3': round(np.percentile(list, 75), percision),
-        'max': round(max(list), percision),
-        'mean': round(np.mean(list), percision),
-        'std': round(np.std(list), percision)
-    }
-
-    # Turn all into floats
-    for key, value in summary.items():
-        summary[key] = float(value)
-    
-    return summary
\ No newline at end of file
+    values = np.asarray(list, dtype=np.float64).reshape(-1, 1)
+    return get_batch_summary(values).to_dict(percision)[0]
@@ -6,7 +6,7 @@ from collections import defaultdict
 
 from .models import (
     UserProfile,
-    Run, Walk, Jump, Squat, Land, Lunge,
+    ExerciseSession, Run, Walk, Jump, Squat, Land, Lunge,
     ExerciseUnit, GaitPhase,
     Soleus, SoleusRightSide, SoleusLeftSide,
     TibialisAnterior, TibialisAnteriorRightSide, TibialisAnteriorLeftSide,
@@ -17,6 +17,7 @@ from .models import (
     Knee, KneeRightSide, KneeLeftSide,
     Pelvis, PelvisRightSide, PelvisLeftSide,
 )
+from .sharding import user_shard
 
 # ------------------------------
 # Inline Classes for GaitPhase within ExerciseUnit
@@ -304,11 +305,9 @@ class UserProfileAdmin(nested_admin.NestedModelAdmin):
         """
         Displays a list of exercises grouped by date with links to each exercise's admin page.
         """
-        # Collect all exercises related to the user
-        exercises = []
-        exercise_models = [Run, Walk, Jump, Squat, Land, Lunge]
-        for model in exercise_models:
-            exercises.extend(model.objects.filter(user=obj))
+        # Collect all exercises related to the user in one query
+        with user_shard(obj):
+            exercises = list(ExerciseSession.objects.filter(user=obj).order_by('date', 'exercise', 'id'))
 
         # Group exercises by date
         exercises_grouped = defaultdict(list)
@@ -323,14 +322,14 @@ class UserProfileAdmin(nested_admin.NestedModelAdmin):
         for date in sorted_dates:
             html += f"<h3>{date}</h3><ul>"
             for exercise in exercises_grouped[date]:
-                # Get the app_label and model_name dynamically
+                # Each exercise type has its own proxy model admin, e.g. core_run
                 app_label = exercise._meta.app_label
-                model_name = exercise._meta.model_name
+                model_name = exercise.exercise
 
                 # Reverse the admin change URL
                 url = reverse(f'admin:{app_label}_{model_name}_change', args=(exercise.id,))
                 # Display as "ExerciseType ID" e.g., "Run 1"
-                display_name = f"{exercise.__class__.__name__} {exercise.id}"
+                display_name = f"{exercise.exercise.capitalize()} {exercise.id}"
                 html += f'<li><a href="{url}">{display_name}</a></li>'
             html += "</ul>"
 
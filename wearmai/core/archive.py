@@ -0,0 +1,99 @@
+"""
+Cold-tier storage of gait curves.
+
+An archived unit keeps its ExerciseUnit row and its ExerciseUnitSummary rows;
+its curves leave the database for a per-user bundle file under
+settings.EXERCISE_ARCHIVE_DIR, and an ArchivedUnitCurves stub records where.
+A bundle is a concatenation of zstd frames, one per unit, each holding the
+float32 bit patterns of the curves delta-encoded along the phases, which is
+lossless and compresses about 10% better than the raw floats.
+
+core.curves.load_curves rehydrates archived units transparently.
+"""
+import os
+from itertools import groupby
+from typing import Dict, Tuple
+
+import numpy as np
+import zstandard
+from django.conf import settings
+
+from core.models import ArchivedUnitCurves, ExerciseUnitCurves
+
+
+def encode_curves(matrix: np.ndarray) -> bytes:
+    """:param matrix: (channels, phases) float32 curves."""
+    bits = np.ascontiguousarray(matrix, dtype='<f4').view('<u4')
+    # Unsigned arithmetic wraps, so the cumulative sum in decode_curves restores every bit pattern (NaNs included)
+    return np.diff(bits, axis=1, prepend=np.zeros((bits.shape[0], 1), dtype='<u4')).tobytes()
+
+
+def decode_curves(data: bytes, channel_count: int, phase_count: int) -> np.ndarray:
+    """:return: The (channels, phases) float32 curves encoded by encode_curves."""
+    deltas = np.frombuffer(data, dtype='<u4').reshape(channel_count, phase_count)
+    return np.cumsum(deltas, axis=1, dtype='<u4').view('<f4')
+
+
+def archive_path(relative_path: str) -> str:
+    return os.path.join(settings.EXERCISE_ARCHIVE_DIR, relative_path)
+
+
+class BundleWriter():
+    """Writes unit frames to a new bundle; it only appears under its name once closed."""
+
+    def __init__(self, relative_path: str, level: int = 10):
+        self.path = archive_path(relative_path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.size = 0
+        self._file = open(f"{self.path}.tmp", 'wb')
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def add(self, matrix: np.ndarray) -> Tuple[int, int]:
+        """:return: Offset and length of the unit's frame."""
+        return self.add_frame(self._compressor.compress(encode_curves(matrix)))
+
+    def add_frame(self, frame: bytes) -> Tuple[int, int]:
+        """Append an already compressed frame, e.g. copied from another bundle."""
+        offset = self.size
+        self._file.write(frame)
+        self.size += len(frame)
+        return offset, len(frame)
+
+    def close(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def discard(self) -> None:
+        self._file.close()
+        for path in (f"{self.path}.tmp", self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def rehydrate_curves(exercise_units) -> Dict[int, ExerciseUnitCurves]:
+    """
+    Read the curves of archived units back from their bundles, one file open per bundle.
+    :param exercise_units: ExerciseUnit instances, ids or a queryset; units not archived are skipped.
+    :return: ExerciseUnit id to an unsaved ExerciseUnitCurves.
+    """
+    stubs = (
+        ArchivedUnitCurves.objects.filter(exercise_unit__in=exercise_units)
+        .select_related('archive')
+        .order_by('archive_id', 'offset')
+    )
+    decompressor = zstandard.ZstdDecompressor()
+    curves = {}
+    for archive, group in groupby(stubs, key=lambda stub: stub.archive):
+        with open(archive_path(archive.path), 'rb') as f:
+            for stub in group:
+                f.seek(stub.offset)
+                matrix = decode_curves(decompressor.decompress(f.read(stub.length)), len(stub.channels), stub.phase_count)
+                curves[stub.exercise_unit_id] = ExerciseUnitCurves(
+                    exercise_unit_id=stub.exercise_unit_id,
+                    channels=stub.channels,
+                    phase_count=stub.phase_count,
+                    data=matrix.tobytes(),
+                )
+    return curves
@@ -0,0 +1,16 @@
+"""
+Curve channel naming, kept free of model imports so it can be used by
+parsing code running outside the Django app registry (e.g. worker processes).
+"""
+from typing import Tuple
+
+SIDES = ('left_side', 'right_side')
+
+
+def channel_key(body_part: str, side: str, column: str) -> str:
+    return f"{body_part}.{side}.{column}"
+
+
+def split_channel_key(key: str) -> Tuple[str, str, str]:
+    body_part, side, column = key.split('.')
+    return body_part, side, column
@@ -0,0 +1,197 @@
+"""
+Columnar storage helpers for gait curves.
+
+A channel is the 100-phase series of one side-table column, addressed as
+``"<body_part>.<side>.<column>"`` (e.g. ``"knee.right_side.angle_avg"``), which
+mirrors the ORM path ``gait_phase.knee.right_side.angle_avg``. Joint moment
+channels (TORQUE_CHANNELS) have no side table and only exist in ExerciseUnitCurves.
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+from django.db import models
+
+from core.archive import rehydrate_curves
+from core.channels import SIDES, channel_key, split_channel_key
+from core.sharding import instance_shard
+from core.models import (
+    ExerciseUnit, ExerciseUnitCurves, GaitPhase,
+    Pelvis, PelvisLeftSide, PelvisRightSide,
+    Hip, HipLeftSide, HipRightSide,
+    Knee, KneeLeftSide, KneeRightSide,
+    Ankle, AnkleLeftSide, AnkleRightSide,
+    Soleus, SoleusLeftSide, SoleusRightSide,
+    TibialisAnterior, TibialisAnteriorLeftSide, TibialisAnteriorRightSide,
+    MedialGastrocnemius, MedialGastrocnemiusLeftSide, MedialGastrocnemiusRightSide,
+    LateralGastrocnemius, LateralGastrocnemiusLeftSide, LateralGastrocnemiusRightSide,
+)
+
+# body part (GaitPhase related_name) -> (parent model, left side model, right side model)
+CURVE_BODY_PARTS = {
+    'pelvis': (Pelvis, PelvisLeftSide, PelvisRightSide),
+    'hip': (Hip, HipLeftSide, HipRightSide),
+    'knee': (Knee, KneeLeftSide, KneeRightSide),
+    'ankle': (Ankle, AnkleLeftSide, AnkleRightSide),
+    'soleus': (Soleus, SoleusLeftSide, SoleusRightSide),
+    'tibialis_anterior': (TibialisAnterior, TibialisAnteriorLeftSide, TibialisAnteriorRightSide),
+    'medial_gastrocnemius': (MedialGastrocnemius, MedialGastrocnemiusLeftSide, MedialGastrocnemiusRightSide),
+    'lateral_gastrocnemius': (LateralGastrocnemius, LateralGastrocnemiusLeftSide, LateralGastrocnemiusRightSide),
+}
+
+
+def side_columns(side_model) -> List[str]:
+    """Return the float columns of a side table, in declaration order."""
+    return [f.name for f in side_model._meta.get_fields() if isinstance(f, models.FloatField)]
+
+
+CURVE_CHANNELS = [
+    channel_key(body_part, side, column)
+    for body_part, (_, left_model, right_model) in CURVE_BODY_PARTS.items()
+    for side, side_model in zip(SIDES, (left_model, right_model))
+    for column in side_columns(side_model)
+]
+
+# Curve-only channels: body part -> column stems, each stored as _avg and _std
+TORQUE_COLUMNS = {
+    'hip': ['flexion_moment', 'adduction_moment', 'rotation_moment'],
+    'knee': ['moment'],
+    'ankle': ['moment', 'subtalar_moment'],
+}
+
+TORQUE_CHANNELS = [
+    channel_key(body_part, side, f"{column}_{statistic}")
+    for body_part, columns in TORQUE_COLUMNS.items()
+    for side in SIDES
+    for column in columns
+    for statistic in ('avg', 'std')
+]
+
+# Every channel a unit can carry
+GAIT_CHANNELS = CURVE_CHANNELS + TORQUE_CHANNELS
+
+
+def gait_phase_curves(unit_ids) -> Dict[int, Dict[str, np.ndarray]]:
+    """
+    Read the curves of many units stored as GaitPhase rows.
+    Issues one query for the phases and one per side table, whatever the number of units.
+    :param unit_ids: Ids of the ExerciseUnits to read.
+    :return: ExerciseUnit id to channel key to float32 curve (NaN where a row or value
+        is missing); units without GaitPhase rows are absent.
+    """
+    unit_ids = list(unit_ids)
+    position = {}
+    lengths = defaultdict(int)
+    phases = GaitPhase.objects.filter(exercise_unit__in=unit_ids).order_by('exercise_unit', 'phase')
+    for unit_id, phase in phases.values_list('exercise_unit', 'phase'):
+        position[unit_id, phase] = lengths[unit_id]
+        lengths[unit_id] += 1
+
+    curves = {unit_id: {} for unit_id in lengths}
+    for body_part, (_, left_model, right_model) in CURVE_BODY_PARTS.items():
+        for side, side_model in zip(SIDES, (left_model, right_model)):
+            cols = side_columns(side_model)
+            rows = side_model.objects.filter(
+                **{f"{body_part}__gait_phase__exercise_unit__in": unit_ids}
+            ).values_list(f"{body_part}__gait_phase__exercise_unit", f"{body_part}__gait_phase__phase", *cols)
+
+            blocks = {}
+            for unit_id, phase, *values in rows:
+                block = blocks.get(unit_id)
+                if block is None:
+                    block = blocks[unit_id] = np.full((len(cols), lengths[unit_id]), np.nan, dtype=np.float32)
+                block[:, position[unit_id, phase]] = [np.nan if v is None else v for v in values]
+            for unit_id, block in blocks.items():
+                for column, curve in zip(cols, block):
+                    curves[unit_id][channel_key(body_part, side, column)] = curve
+    return curves
+
+
+def curves_from_gait_phases(exercise_unit: ExerciseUnit) -> Dict[str, np.ndarray]:
+    """
+    Read the curves of a unit stored as GaitPhase rows (see gait_phase_curves).
+    :param exercise_unit: The ExerciseUnit to read.
+    :return: Channel key to float32 curve (NaN where a row or value is missing).
+    """
+    with instance_shard(exercise_unit):
+        return gait_phase_curves([exercise_unit.pk]).get(exercise_unit.pk, {})
+
+
+def pack_exercise_unit(exercise_unit: ExerciseUnit) -> ExerciseUnitCurves:
+    """
+    Pack (or repack) the GaitPhase rows of a unit into its ExerciseUnitCurves row.
+    Curve-only channels already in the row are kept, as there are no rows to rebuild them from.
+    """
+    with instance_shard(exercise_unit):
+        unpacked = curves_from_gait_phases(exercise_unit)
+        existing = ExerciseUnitCurves.objects.filter(exercise_unit=exercise_unit).first()
+        if existing is not None:
+            torque_channels = set(TORQUE_CHANNELS)
+            unpacked.update((key, curve) for key, curve in existing.as_dict().items() if key in torque_channels)
+        packed = ExerciseUnitCurves.pack(exercise_unit, unpacked)
+        curves, _ = ExerciseUnitCurves.objects.update_or_create(
+            exercise_unit=exercise_unit,
+            defaults={
+                'channels': packed.channels,
+                'phase_count': packed.phase_count,
+                'data': packed.data,
+            },
+        )
+    return curves
+
+
+def load_curves(exercise_units) -> Dict[int, ExerciseUnitCurves]:
+    """
+    Load packed curves for many units in one query; archived units are read
+    back from their bundles (see core.archive).
+    :param exercise_units: ExerciseUnit instances, ids or a queryset.
+    :return: ExerciseUnit id to ExerciseUnitCurves (units without curves are absent).
+    """
+    loaded = {
+        curves.exercise_unit_id: curves
+        for curves in ExerciseUnitCurves.objects.filter(exercise_unit__in=exercise_units)
+    }
+    if isinstance(exercise_units, models.QuerySet):
+        loaded.update(rehydrate_curves(exercise_units))
+    else:
+        pending = [unit_id for unit_id in (getattr(unit, 'pk', unit) for unit in exercise_units) if unit_id not in loaded]
+        if pending:
+            loaded.update(rehydrate_curves(pending))
+    return loaded
+
+
+def load_run_curves(run) -> Dict[int, ExerciseUnitCurves]:
+    """Load the packed curves of every unit of a run in one query, plus one for archived units."""
+    with instance_shard(run):
+        loaded = {
+            curves.exercise_unit_id: curves
+            for curves in ExerciseUnitCurves.objects.filter(exercise_unit__session=run)
+        }
+        loaded.update(rehydrate_curves(ExerciseUnit.objects.filter(session=run)))
+        return loaded
+
+
+def curve_gait_phases(curves: ExerciseUnitCurves) -> List[SimpleNamespace]:
+    """
+    Expose packed curves through the GaitPhase attribute graph so code written
+    against ``gait_phase.<body_part>.<side>.<column>`` keeps working.
+    """
+    rows = curves.as_array().T.tolist()
+    layout = [split_channel_key(key) for key in curves.channels]
+
+    gait_phases = []
+    for index, values in enumerate(rows):
+        gait_phase = SimpleNamespace(phase=float(index), exercise_unit_id=curves.exercise_unit_id)
+        for (body_part, side, column), value in zip(layout, values):
+            part = getattr(gait_phase, body_part, None)
+            if part is None:
+                part = SimpleNamespace()
+                setattr(gait_phase, body_part, part)
+            side_values = getattr(part, side, None)
+            if side_values is None:
+                side_values = SimpleNamespace()
+                setattr(part, side, side_values)
+            setattr(side_values, column, None if np.isnan(value) else value)
+        gait_phases.append(gait_phase)
+    return gait_phases
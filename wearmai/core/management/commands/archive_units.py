@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import UserProfile
+from services.archive.archive_service import ExerciseArchiveService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Move the gait curves of old exercise units into compressed per-user bundles (or restore them)"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--user",
+            type=str,
+            help="Only archive units of the user profile with this name"
+        )
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            help="Override settings.EXERCISE_ARCHIVE_AFTER_DAYS"
+        )
+        parser.add_argument(
+            "--level",
+            type=int,
+            help="Override settings.EXERCISE_ARCHIVE_ZSTD_LEVEL"
+        )
+        parser.add_argument(
+            "--restore",
+            action="store_true",
+            help="Bring the archived units back into the database and delete the bundles"
+        )
+
+    def handle(self, *args, **options) -> None:
+        users = UserProfile.objects.order_by('id')
+        if options.get('user'):
+            users = users.filter(name=options['user'])
+            if not users.exists():
+                raise CommandError(f"No user profile named {options['user']!r}")
+
+        service = ExerciseArchiveService(older_than_days=options.get('older_than_days'), level=options.get('level'))
+        units = 0
+        for user in users:
+            if options.get('restore', False):
+                units += service.restore_user(user)
+                continue
+            archive = service.archive_user(user)
+            units += archive.unit_count if archive is not None else 0
+        log.info("archive_units_done", units=units, restore=options.get('restore', False))
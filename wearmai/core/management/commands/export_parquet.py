@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import UserProfile
+from services.export.parquet_export import ParquetExportService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Export a user's gait curves as Parquet, one row per (exercise, unit, phase)"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--user",
+            type=str,
+            required=True,
+            help="Name of the user profile to export"
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            required=True,
+            help="Path of the .parquet file to write"
+        )
+        parser.add_argument(
+            "--compression",
+            type=str,
+            default="zstd",
+            help="Parquet compression codec"
+        )
+
+    def handle(self, *args, **options) -> None:
+        user = UserProfile.objects.filter(name=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user profile named {options['user']!r}")
+
+        rows = ParquetExportService().write(user, options['output'], compression=options['compression'])
+        log.info("export_parquet_done", user_name=user.name, rows=rows, output=options['output'])
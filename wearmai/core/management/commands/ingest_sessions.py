@@ -0,0 +1,111 @@
+import os
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core.models import UserProfile
+from services.ingest.columnar import is_columnar
+from services.ingest.ingest_service import (
+    CURVE_STORAGE_MODES, CohortIngestService, SessionIngestService, SessionWriter, read_user_info,
+)
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Bulk load a subject's day_<N> session folders (or a cohort of subjects, "
+            "or a Parquet/Arrow export) into the database")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "path",
+            type=str,
+            help="Subject folder containing day_<N> sessions (folders or .zip/.tar.gz bundles), "
+                 "an archive of such a folder, e.g. development/datasets/User_data/User1, "
+                 "or a .parquet/.arrow/.feather file in the export_parquet layout"
+        )
+        parser.add_argument(
+            "--user",
+            type=str,
+            default="Test User 2 - Full Data Load",
+            help="Name of the user profile to load into (created if missing)"
+        )
+        parser.add_argument(
+            "--start-date",
+            type=date.fromisoformat,
+            help="Date of day_1 (YYYY-MM-DD); day_N is dated N - 1 days later. Defaults to the "
+                 "dates of the previous ingest (today for a new user), or to the first date of a "
+                 "Parquet/Arrow file. A different date re-dates and re-ingests every session"
+        )
+        parser.add_argument(
+            "--storage",
+            choices=CURVE_STORAGE_MODES,
+            help="Override settings.GAIT_CURVE_STORAGE"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of processes parsing session files (1 parses in-process)"
+        )
+        parser.add_argument(
+            "--parse-cache",
+            action="store_true",
+            help="Keep parsed files as .npy sidecars and reuse them on re-ingest"
+        )
+        parser.add_argument(
+            "--cohort",
+            action="store_true",
+            help="Treat path as a root of subject folders/archives, each loaded into a user named after it"
+        )
+        parser.add_argument(
+            "--subject-workers",
+            type=int,
+            default=2,
+            help="With --cohort, number of subjects ingested concurrently (--workers parser processes each)"
+        )
+
+    def handle(self, *args, **options) -> None:
+        if options['cohort']:
+            return self.handle_cohort(**options)
+
+        user, created = UserProfile.objects.get_or_create(
+            name=options['user'],
+            defaults=read_user_info(options['path']),
+        )
+        log.info("ingest_user_resolved", user_name=user.name, created=created)
+
+        service = SessionIngestService(
+            SessionWriter(storage=options.get('storage')),
+            workers=options['workers'],
+            parse_cache=options['parse_cache'],
+        )
+        if is_columnar(options['path']):
+            stats = service.ingest_columnar(options['path'], user, options['start_date'])
+        else:
+            stats = service.ingest_subject(options['path'], user, options['start_date'])
+        log.info(
+            "ingest_sessions_done",
+            units=stats.units,
+            rows=stats.rows,
+            seconds=round(stats.seconds, 2),
+            rows_per_second=round(stats.rows_per_second),
+        )
+
+    def handle_cohort(self, **options) -> None:
+        service = CohortIngestService(
+            SessionWriter(storage=options.get('storage')),
+            subject_workers=options['subject_workers'],
+            workers=options['workers'],
+            parse_cache=options['parse_cache'],
+        )
+        results = service.ingest_cohort(options['path'], options['start_date'])
+        failed = sorted(result.subject for result in results if result.error is not None)
+        log.info(
+            "ingest_cohort_done",
+            subjects=len(results),
+            failed=len(failed),
+            units=sum(result.stats.units for result in results if result.stats),
+            rows=sum(result.stats.rows for result in results if result.stats),
+        )
+        if failed:
+            raise CommandError(f"Failed subjects (re-run to retry): {', '.join(failed)}")
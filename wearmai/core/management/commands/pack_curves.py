@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import ExerciseUnit
+from core.curves import pack_exercise_unit
+from core.sharding import shard_aliases
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Pack GaitPhase rows into columnar ExerciseUnitCurves blobs"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Repack units that already have curves"
+        )
+
+    def handle(self, *args, **options) -> None:
+        packed = 0
+        for alias in shard_aliases():
+            units = ExerciseUnit.objects.using(alias).filter(gait_phases__isnull=False).distinct()
+            if not options.get('rebuild', False):
+                units = units.filter(curves__isnull=True)
+
+            for exercise_unit in units.iterator():
+                with transaction.atomic(using=alias):
+                    curves = pack_exercise_unit(exercise_unit)
+                packed += 1
+                log.info("exercise_unit_packed", exercise_unit_id=exercise_unit.id, channels=len(curves.channels))
+
+        log.info("pack_curves_done", packed=packed)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import UserProfile
+from services.purge.purge_service import BulkPurgeService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Delete a user profile with all its exercise data and conversations, or only its exercise data"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--user",
+            type=str,
+            required=True,
+            help="Name of the user profile to purge"
+        )
+        parser.add_argument(
+            "--keep-profile",
+            action="store_true",
+            help="Only delete the exercise data, e.g. before a full re-ingest"
+        )
+
+    def handle(self, *args, **options) -> None:
+        user = UserProfile.objects.filter(name=options['user']).first()
+        if user is None:
+            raise CommandError(f"No user profile named {options['user']!r}")
+        try:
+            report = BulkPurgeService().purge_user(user, keep_profile=options.get('keep_profile', False))
+        except ValueError as e:
+            raise CommandError(str(e))
+        for label, rows in sorted(report.rows.items()):
+            log.info("table_purged", table=label, rows=rows)
+        log.info("purge_user_done", user=options['user'], rows=report.total, seconds=round(report.seconds, 3))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import UserProfile
+from services.sharding.shard_rebalance import ShardRebalanceService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Move users' exercise data to the shard their placement policy assigns "
+            "(e.g. after adding shards), or one user to a given shard")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--user",
+            type=str,
+            help="Only move the user profile with this name"
+        )
+        parser.add_argument(
+            "--to",
+            type=str,
+            help="Database alias to move --user to, instead of its policy shard"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows copied per query"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only log the moves"
+        )
+
+    def handle(self, *args, **options) -> None:
+        service = ShardRebalanceService(batch_size=options['batch_size'])
+        if options.get('user'):
+            user = UserProfile.objects.filter(name=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user profile named {options['user']!r}")
+            move = service.plan_user(user.id, options.get('to'))
+            moves = [move] if move is not None else []
+        elif options.get('to'):
+            raise CommandError("--to needs --user")
+        else:
+            moves = service.plan()
+
+        rows = 0
+        for move in moves:
+            if options.get('dry_run', False):
+                log.info("user_shard_move_planned", user_id=move.user_id, source=move.source, target=move.target)
+                continue
+            try:
+                rows += service.move_user(move.user_id, move.target)
+            except ValueError as e:
+                raise CommandError(str(e))
+        log.info("rebalance_shards_done", users=len(moves), rows=rows, dry_run=options.get('dry_run', False))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import ExerciseUnit, UserProfile
+from core.sharding import shard_aliases, shard_for, using_shard
+from services.exercise_summarisation.rollup_store import deferred_rollups
+from services.exercise_summarisation.summary_store import rebuild_unit_summaries
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialised ExerciseUnitSummary table and the weekly/monthly ExerciseRollup rows"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--user",
+            type=str,
+            help="Only rebuild units of the user profile with this name"
+        )
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only summarise units that have no summary rows yet"
+        )
+
+    def handle(self, *args, **options) -> None:
+        user = None
+        aliases = shard_aliases()
+        if options.get('user'):
+            user = UserProfile.objects.filter(name=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user profile named {options['user']!r}")
+            aliases = [shard_for(user)]
+
+        unit_count = rows = 0
+        for alias in aliases:
+            with using_shard(alias), deferred_rollups():
+                units = ExerciseUnit.objects.all()
+                if user is not None:
+                    units = units.filter(session__user=user)
+                if options.get('missing_only', False):
+                    units = units.filter(summaries__isnull=True)
+
+                unit_ids = list(units.values_list('id', flat=True).distinct())
+                rows += rebuild_unit_summaries(unit_ids)
+            unit_count += len(unit_ids)
+        log.info("rebuild_exercise_summaries_done", units=unit_count, rows=rows)
@@ -0,0 +1,12 @@
+from core.routers import routing_scope
+
+
+class RoutingScopeMiddleware():
+    """Give every request its own database routing scope (see core.routers)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_scope():
+            return self.get_response(request)
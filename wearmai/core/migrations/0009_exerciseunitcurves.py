@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_conversation_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseUnitCurves',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channels', models.JSONField(default=list)),
+                ('phase_count', models.PositiveSmallIntegerField(default=100)),
+                ('data', models.BinaryField()),
+                ('exercise_unit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='curves', to='core.exerciseunit')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_exerciseunitcurves'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseUnitSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body_part', models.CharField(max_length=64)),
+                ('side', models.CharField(max_length=64)),
+                ('column', models.CharField(max_length=64)),
+                ('count', models.IntegerField()),
+                ('mean', models.FloatField()),
+                ('m2', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('digest', models.JSONField(default=dict)),
+                ('exercise_unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='core.exerciseunit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('exercise_unit', 'body_part', 'side', 'column'), name='unique_exercise_unit_summary_column')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_exerciseunitsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('digest', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingested_sessions', to='core.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngestedTrialFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('digest', models.CharField(max_length=64)),
+                ('exercise_unit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source_files', to='core.exerciseunit')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='core.ingestedsession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ingestedsession',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='unique_ingested_session_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingestedtrialfile',
+            constraint=models.UniqueConstraint(fields=('session', 'name'), name='unique_ingested_trial_file_name'),
+        ),
+    ]
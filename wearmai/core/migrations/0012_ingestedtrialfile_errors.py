@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_ingest_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestedtrialfile',
+            name='errors',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-17 00:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ingestedtrialfile_errors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise', models.CharField(choices=[('run', 'run'), ('walk', 'walk'), ('jump', 'jump'), ('squat', 'squat'), ('land', 'land'), ('lunge', 'lunge')], max_length=16)),
+                ('date', models.DateField()),
+                ('speed', models.FloatField(blank=True, null=True)),
+                ('channels', models.JSONField(default=list)),
+                ('phase_count', models.PositiveSmallIntegerField(default=100)),
+                ('cycle_count', models.PositiveIntegerField(default=0)),
+                ('mean', models.BinaryField(null=True)),
+                ('m2', models.BinaryField(null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('exercise_units', models.ManyToManyField(blank=True, related_name='live_sessions', to='core.exerciseunit')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='live_sessions', to='core.userprofile')),
+            ],
+        ),
+    ]
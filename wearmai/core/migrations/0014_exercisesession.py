@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_livesession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exercise', models.CharField(choices=[('run', 'run'), ('walk', 'walk'), ('jump', 'jump'), ('squat', 'squat'), ('land', 'land'), ('lunge', 'lunge')], max_length=16)),
+                ('date', models.DateField()),
+                ('speed', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_sessions', to='core.userprofile')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['user', 'date'], name='exercise_session_user_date'), models.Index(fields=['user', 'exercise', 'date'], name='exercise_session_user_type')],
+            },
+        ),
+        migrations.AddField(
+            model_name='exerciseunit',
+            name='session',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exercise_units', to='core.exercisesession'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+from django.core.management.color import no_style
+from django.db import migrations
+from django.db.models import F
+import structlog
+
+log = structlog.get_logger(__name__)
+
+# ExerciseUnit FK / ExerciseSession.exercise -> legacy model
+LEGACY_MODELS = {
+    'run': 'Run',
+    'walk': 'Walk',
+    'jump': 'Jump',
+    'squat': 'Squat',
+    'land': 'Land',
+    'lunge': 'Lunge',
+}
+
+
+def _reset_sequences(schema_editor, models):
+    # Rows were inserted with explicit ids; no-op on SQLite
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def copy_exercise_sessions(apps, schema_editor):
+    """
+    Copy Run/Walk/Jump/Squat/Land/Lunge rows into ExerciseSession and point units at them.
+    Every session keeps its legacy id unless a row copied before it (runs first, then the
+    other types in LEGACY_MODELS order) already took that id; those are renumbered and
+    logged, old id to new id, as are the units without any exercise, which are deleted.
+    """
+    ExerciseSession = apps.get_model('core', 'ExerciseSession')
+    ExerciseUnit = apps.get_model('core', 'ExerciseUnit')
+    db = schema_editor.connection.alias
+
+    taken = set()
+    renumbered = 0
+    for exercise, model_name in LEGACY_MODELS.items():
+        legacy_model = apps.get_model('core', model_name)
+        fields = ['id', 'user_id', 'date'] + (['speed'] if exercise == 'walk' else [])
+        legacy_rows = list(legacy_model.objects.using(db).order_by('id').values(*fields))
+        kept = [row for row in legacy_rows if row['id'] not in taken]
+        moved = [row for row in legacy_rows if row['id'] in taken]
+
+        def session(row, **kwargs):
+            return ExerciseSession(
+                user_id=row['user_id'], exercise=exercise, date=row['date'], speed=row.get('speed'), **kwargs,
+            )
+
+        ExerciseSession.objects.using(db).bulk_create([session(row, id=row['id']) for row in kept], batch_size=1000)
+        taken.update(row['id'] for row in kept)
+        # Renumbered rows take ids past every explicit one
+        _reset_sequences(schema_editor, [ExerciseSession])
+        sessions = ExerciseSession.objects.using(db).bulk_create([session(row) for row in moved], batch_size=1000)
+        new_ids = {row['id']: created.id for row, created in zip(moved, sessions)}
+        taken.update(new_ids.values())
+        if new_ids:
+            renumbered += len(new_ids)
+            log.warning("exercise_sessions_renumbered", exercise=exercise, count=len(new_ids), ids=new_ids)
+
+        units = ExerciseUnit.objects.using(db).filter(session__isnull=True)
+        for old_id, new_id in new_ids.items():
+            units.filter(**{f"{exercise}_id": old_id}).update(session_id=new_id)
+        units.filter(**{f"{exercise}__isnull": False}).update(session_id=F(f"{exercise}_id"))
+
+    # Units without any exercise have no user or date and cannot be reached
+    orphans = list(ExerciseUnit.objects.using(db).filter(session__isnull=True).values_list('id', flat=True))
+    if orphans:
+        log.warning("exercise_units_without_exercise_deleted", count=len(orphans), ids=orphans)
+        ExerciseUnit.objects.using(db).filter(id__in=orphans).delete()
+    log.info("exercise_sessions_copied", sessions=len(taken), renumbered=renumbered, deleted_units=len(orphans))
+
+
+def restore_legacy_sessions(apps, schema_editor):
+    """
+    Recreate legacy rows from ExerciseSession and drop the sessions again. Units still linked
+    to a legacy row (reversing straight after the copy) keep it, so renumbered ids come back.
+    """
+    ExerciseSession = apps.get_model('core', 'ExerciseSession')
+    ExerciseUnit = apps.get_model('core', 'ExerciseUnit')
+    db = schema_editor.connection.alias
+
+    legacy_models = []
+    for exercise, model_name in LEGACY_MODELS.items():
+        legacy_model = apps.get_model('core', model_name)
+        linked = ExerciseUnit.objects.using(db).filter(**{f"{exercise}__isnull": False}).values('session_id')
+        sessions = ExerciseSession.objects.using(db).filter(exercise=exercise).exclude(id__in=linked)
+        legacy_model.objects.using(db).bulk_create([
+            legacy_model(
+                id=session.id, user_id=session.user_id, date=session.date,
+                **({'speed': session.speed} if exercise == 'walk' else {}),
+            )
+            for session in sessions.iterator()
+        ], batch_size=1000, ignore_conflicts=True)
+        ExerciseUnit.objects.using(db).filter(
+            session__exercise=exercise, **{f"{exercise}__isnull": True},
+        ).update(**{f"{exercise}_id": F('session_id')})
+        legacy_models.append(legacy_model)
+    _reset_sequences(schema_editor, legacy_models)
+    ExerciseUnit.objects.using(db).update(session=None)
+    ExerciseSession.objects.using(db).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_exercisesession'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_exercise_sessions, restore_legacy_sessions),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_copy_exercise_sessions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='run',
+        ),
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='walk',
+        ),
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='jump',
+        ),
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='squat',
+        ),
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='land',
+        ),
+        migrations.RemoveField(
+            model_name='exerciseunit',
+            name='lunge',
+        ),
+        migrations.AlterField(
+            model_name='exerciseunit',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_units', to='core.exercisesession'),
+        ),
+        migrations.DeleteModel(
+            name='Run',
+        ),
+        migrations.DeleteModel(
+            name='Walk',
+        ),
+        migrations.DeleteModel(
+            name='Jump',
+        ),
+        migrations.DeleteModel(
+            name='Squat',
+        ),
+        migrations.DeleteModel(
+            name='Land',
+        ),
+        migrations.DeleteModel(
+            name='Lunge',
+        ),
+        migrations.CreateModel(
+            name='Run',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+        migrations.CreateModel(
+            name='Walk',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+        migrations.CreateModel(
+            name='Jump',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+        migrations.CreateModel(
+            name='Squat',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+        migrations.CreateModel(
+            name='Land',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+        migrations.CreateModel(
+            name='Lunge',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.exercisesession',),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_remove_legacy_exercise_models'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gaitphase',
+            index=models.Index(fields=['exercise_unit', 'phase'], name='gait_phase_unit_phase'),
+        ),
+        migrations.AlterField(
+            model_name='gaitphase',
+            name='exercise_unit',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='gait_phases', to='core.exerciseunit'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ),
+    ]
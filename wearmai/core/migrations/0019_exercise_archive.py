@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_usershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('unit_count', models.PositiveIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_archives', to='core.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedUnitCurves',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.BigIntegerField()),
+                ('length', models.PositiveIntegerField()),
+                ('channels', models.JSONField(default=list)),
+                ('phase_count', models.PositiveSmallIntegerField(default=100)),
+                ('exercise_unit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archived_curves', to='core.exerciseunit')),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='units', to='core.exercisearchive')),
+            ],
+        ),
+    ]
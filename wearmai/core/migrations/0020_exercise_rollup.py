@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-17 01:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_exercise_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'week'), ('month', 'month')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('exercise', models.CharField(max_length=16)),
+                ('body_part', models.CharField(max_length=64)),
+                ('side', models.CharField(max_length=64)),
+                ('column', models.CharField(max_length=64)),
+                ('unit_count', models.PositiveIntegerField()),
+                ('count', models.IntegerField()),
+                ('mean', models.FloatField()),
+                ('m2', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('digest', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exercise_rollups', to='core.userprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'exercise', 'period_start', 'body_part', 'side', 'column'), name='unique_exercise_rollup_column')],
+            },
+        ),
+    ]
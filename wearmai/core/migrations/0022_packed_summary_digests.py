@@ -0,0 +1,106 @@
+from django.db import migrations, models
+import structlog
+
+from common.utils.sketch import UNIT_COMPRESSION, TDigest
+
+log = structlog.get_logger(__name__)
+
+
+def pack_digests(apps, schema_editor):
+    """
+    Pack the JSON digests of unit summaries and rollups. Unit digests held every value
+    of their curve, so their quartiles are exact; they are kept on the row and the
+    digest is recompressed to UNIT_COMPRESSION.
+    """
+    ExerciseUnitSummary = apps.get_model('core', 'ExerciseUnitSummary')
+    ExerciseRollup = apps.get_model('core', 'ExerciseRollup')
+    db = schema_editor.connection.alias
+
+    batch, packed = [], 0
+    for row in ExerciseUnitSummary.objects.using(db).only('min', 'max', 'legacy_digest').iterator(chunk_size=1000):
+        digest = TDigest.from_dict(row.legacy_digest) if row.legacy_digest else TDigest()
+        if len(digest.means):
+            row.q1, row.median, row.q3 = digest.quantile([0.25, 0.5, 0.75], row.min, row.max).tolist()
+        digest.compression = UNIT_COMPRESSION
+        digest._compress()
+        row.digest = digest.to_bytes()
+        batch.append(row)
+        if len(batch) == 1000:
+            ExerciseUnitSummary.objects.using(db).bulk_update(batch, ['q1', 'median', 'q3', 'digest'])
+            packed += len(batch)
+            batch = []
+    ExerciseUnitSummary.objects.using(db).bulk_update(batch, ['q1', 'median', 'q3', 'digest'])
+    packed += len(batch)
+
+    rollups = []
+    for row in ExerciseRollup.objects.using(db).only('legacy_digest').iterator(chunk_size=1000):
+        row.digest = (TDigest.from_dict(row.legacy_digest) if row.legacy_digest else TDigest()).to_bytes()
+        rollups.append(row)
+    ExerciseRollup.objects.using(db).bulk_update(rollups, ['digest'], batch_size=1000)
+    log.info("summary_digests_packed", database=db, unit_summaries=packed, rollups=len(rollups))
+
+
+def unpack_digests(apps, schema_editor):
+    """Back to JSON digests; unit digests keep their reduced compression."""
+    db = schema_editor.connection.alias
+    for model_name, compression in (('ExerciseUnitSummary', UNIT_COMPRESSION), ('ExerciseRollup', 100)):
+        model = apps.get_model('core', model_name)
+        rows = []
+        for row in model.objects.using(db).only('digest').iterator(chunk_size=1000):
+            row.legacy_digest = TDigest.from_bytes(row.digest, compression).to_dict()
+            rows.append(row)
+        model.objects.using(db).bulk_update(rows, ['legacy_digest'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_userprofile_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exerciseunitsummary',
+            name='q1',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='exerciseunitsummary',
+            name='median',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='exerciseunitsummary',
+            name='q3',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RenameField(
+            model_name='exerciseunitsummary',
+            old_name='digest',
+            new_name='legacy_digest',
+        ),
+        migrations.RenameField(
+            model_name='exerciserollup',
+            old_name='digest',
+            new_name='legacy_digest',
+        ),
+        migrations.AddField(
+            model_name='exerciseunitsummary',
+            name='digest',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name='exerciserollup',
+            name='digest',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(pack_digests, unpack_digests),
+        migrations.RemoveField(
+            model_name='exerciseunitsummary',
+            name='legacy_digest',
+        ),
+        migrations.RemoveField(
+            model_name='exerciserollup',
+            name='legacy_digest',
+        ),
+    ]
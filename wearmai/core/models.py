@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.db import models
 from openai import OpenAI
+import numpy as np
 import os
 from typing import Generator
 from wearmai.settings import OPENAI_API_KEY
+from common.utils.sketch import UNIT_COMPRESSION, PhaseAccumulator, SummarySketch, TDigest
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 
@@ -77,6 +80,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ]
 
 # Define Soleus and SoleusSide with one-to-one relationships
 class SoleusRightSide(models.Model):
@@ -234,64 +240,372 @@ class Pelvis(models.Model):
 
 # Define GaitPhase model
 class GaitPhase(models.Model):
-    exercise_unit = models.ForeignKey('ExerciseUnit', on_delete=models.CASCADE, related_name='gait_phases')
+    # Indexed through (exercise_unit, phase) below
+    exercise_unit = models.ForeignKey('ExerciseUnit', on_delete=models.CASCADE, related_name='gait_phases', db_index=False)
     phase = models.FloatField(null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['exercise_unit', 'phase'], name='gait_phase_unit_phase'),
+        ]
+
 
 # Define ExerciseUnit and associated models
 class ExerciseUnit(models.Model):
-    run = models.ForeignKey('Run', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
-    walk = models.ForeignKey('Walk', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
-    jump = models.ForeignKey('Jump', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
-    squat = models.ForeignKey('Squat', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
-    land = models.ForeignKey('Land', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
-    lunge = models.ForeignKey('Lunge', on_delete=models.CASCADE, related_name='exercise_units', null=True, blank=True)
+    session = models.ForeignKey('ExerciseSession', on_delete=models.CASCADE, related_name='exercise_units')
     speed = models.FloatField(null=True)
     # unit_count = models.FloatField(null=True)
 
 
+# Packed gait curves: one float32 blob per ExerciseUnit instead of a
+# GaitPhase row plus joint/muscle rows for each of its 100 phases.
+class ExerciseUnitCurves(models.Model):
+    exercise_unit = models.OneToOneField('ExerciseUnit', on_delete=models.CASCADE, related_name='curves')
+    # Channel keys ("<body_part>.<side>.<column>", see core.curves), one per row of `data`
+    channels = models.JSONField(default=list)
+    phase_count = models.PositiveSmallIntegerField(default=100)
+    # Little-endian float32 array of shape (len(channels), phase_count)
+    data = models.BinaryField()
+
+    @classmethod
+    def pack(cls, exercise_unit, curves: dict) -> "ExerciseUnitCurves":
+        """
+        Build an (unsaved) instance from a mapping of channel key -> curve.
+        :param exercise_unit: The ExerciseUnit the curves belong to.
+        :param curves: Channel key to 1-D array of per-phase values.
+        :return: An unsaved ExerciseUnitCurves instance.
+        """
+        channels = list(curves.keys())
+        matrix = np.asarray([curves[key] for key in channels], dtype='<f4')
+        phase_count = matrix.shape[1] if matrix.ndim == 2 else 0
+        return cls(
+            exercise_unit=exercise_unit,
+            channels=channels,
+            phase_count=phase_count,
+            data=matrix.tobytes(),
+        )
+
+    def as_array(self) -> np.ndarray:
+        """Return the curves as a read-only (channels, phases) float32 array."""
+        return np.frombuffer(self.data, dtype='<f4').reshape(len(self.channels), self.phase_count)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.channels, self.as_array()))
+
+    def channel(self, key: str) -> np.ndarray:
+        return self.as_array()[self.channels.index(key)]
+
+    def gait_phases(self) -> list:
+        """
+        GaitPhase-style view of the curves, e.g. ``phases[3].hip.left_side.flexion_avg``.
+        """
+        from core.curves import curve_gait_phases
+        return curve_gait_phases(self)
+
+
+# Cold tier (see core.archive): a bundle file of archived units of one user,
+# one zstd frame per unit.
+class ExerciseArchive(models.Model):
+    user = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='exercise_archives')
+    # Relative to settings.EXERCISE_ARCHIVE_DIR
+    path = models.CharField(max_length=255)
+    unit_count = models.PositiveIntegerField(default=0)
+    # Bytes
+    size = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+# Stub of an archived unit, in place of its GaitPhase rows and ExerciseUnitCurves
+# row; its ExerciseUnitSummary rows are kept. Bytes [offset, offset + length) of
+# the archive decode (core.archive.decode_curves) to a (len(channels), phase_count)
+# float32 array, as in ExerciseUnitCurves.data.
+class ArchivedUnitCurves(models.Model):
+    exercise_unit = models.OneToOneField('ExerciseUnit', on_delete=models.CASCADE, related_name='archived_curves')
+    archive = models.ForeignKey(ExerciseArchive, on_delete=models.CASCADE, related_name='units')
+    offset = models.BigIntegerField()
+    length = models.PositiveIntegerField()
+    channels = models.JSONField(default=list)
+    phase_count = models.PositiveSmallIntegerField(default=100)
+
+
+# Materialised per-unit summary: one row per ExerciseUnit, body part, side and column,
+# holding a mergeable SummarySketch so aggregates never re-read raw phase rows. The
+# digest is packed (TDigest.to_bytes) at UNIT_COMPRESSION, a few centroids rather than
+# the curve itself; the exact quartiles are kept alongside for single-unit summaries.
+class ExerciseUnitSummary(models.Model):
+    exercise_unit = models.ForeignKey('ExerciseUnit', on_delete=models.CASCADE, related_name='summaries')
+    body_part = models.CharField(max_length=64)
+    side = models.CharField(max_length=64)
+    column = models.CharField(max_length=64)
+    count = models.IntegerField()
+    mean = models.FloatField()
+    m2 = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    q1 = models.FloatField(null=True)
+    median = models.FloatField(null=True)
+    q3 = models.FloatField(null=True)
+    digest = models.BinaryField(default=bytes)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['exercise_unit', 'body_part', 'side', 'column'],
+                name='unique_exercise_unit_summary_column',
+            ),
+        ]
+
+    @classmethod
+    def from_sketch(cls, exercise_unit_id: int, body_part: str, side: str, column: str, sketch: SummarySketch) -> "ExerciseUnitSummary":
+        return cls(
+            exercise_unit_id=exercise_unit_id,
+            body_part=body_part,
+            side=side,
+            column=column,
+            count=sketch.count,
+            mean=sketch.mean,
+            m2=sketch.m2,
+            min=sketch.min,
+            max=sketch.max,
+            q1=sketch.quartiles[0] if sketch.quartiles else None,
+            median=sketch.quartiles[1] if sketch.quartiles else None,
+            q3=sketch.quartiles[2] if sketch.quartiles else None,
+            digest=sketch.digest.to_bytes(),
+        )
+
+    def to_sketch(self) -> SummarySketch:
+        return SummarySketch(
+            count=self.count,
+            mean=self.mean,
+            m2=self.m2,
+            minimum=self.min,
+            maximum=self.max,
+            digest=TDigest.from_bytes(self.digest, UNIT_COMPRESSION),
+            quartiles=(self.q1, self.median, self.q3) if self.median is not None else None,
+        )
+
+
+# Materialised per-user rollup: the unit summaries of one ISO week or calendar month
+# of an exercise merged per body part, side and column, so trends over a long history
+# are read from a few rows (see services.exercise_summarisation.rollup_store).
+class ExerciseRollup(models.Model):
+    PERIODS = ('week', 'month')
+    PERIOD_CHOICES = [(name, name) for name in PERIODS]
+
+    user = models.ForeignKey('UserProfile', on_delete=models.CASCADE, related_name='exercise_rollups')
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    # Monday of the ISO week or first day of the month
+    period_start = models.DateField()
+    exercise = models.CharField(max_length=16)
+    body_part = models.CharField(max_length=64)
+    side = models.CharField(max_length=64)
+    column = models.CharField(max_length=64)
+    unit_count = models.PositiveIntegerField()
+    count = models.IntegerField()
+    mean = models.FloatField()
+    m2 = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    # Packed as in ExerciseUnitSummary, at the default compression
+    digest = models.BinaryField(default=bytes)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'exercise', 'period_start', 'body_part', 'side', 'column'],
+                name='unique_exercise_rollup_column',
+            ),
+        ]
+
+    def to_sketch(self) -> SummarySketch:
+        return SummarySketch(
+            count=self.count,
+            mean=self.mean,
+            m2=self.m2,
+            minimum=self.min,
+            maximum=self.max,
+            digest=TDigest.from_bytes(self.digest),
+        )
+
+
 # Define User and exercise-related models
 class UserProfile(models.Model):
     name = models.CharField(max_length=255)
     height = models.FloatField(null=True)
     weight = models.FloatField(null=True)
-
-
-class Run(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='runs')
+    # Login allowed to use the profile's data through the API; shards keep copies of
+    # profile rows but no auth tables, hence no database constraint
+    account = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='profile', db_constraint=False,
+    )
+
+
+# Placement of a user's exercise data on one of settings.DATABASE_SHARDS (see core.sharding).
+# Lives on the default database with the profiles; each shard keeps a copy of the
+# profile row so its foreign keys resolve.
+class UserShard(models.Model):
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, primary_key=True, related_name='shard_placement')
+    shard = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# One row per user, exercise type and day; ExerciseUnits hang off it through a
+# single FK, so cross-exercise and date range queries are one indexed scan.
+class ExerciseSession(models.Model):
+    EXERCISES = ('run', 'walk', 'jump', 'squat', 'land', 'lunge')
+    EXERCISE_CHOICES = [(name, name) for name in EXERCISES]
+
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='exercise_sessions')
+    exercise = models.CharField(max_length=16, choices=EXERCISE_CHOICES)
     date = models.DateField()
     # duration = models.FloatField(null=True)
+    # Only ever set on walks (the former Walk.speed)
+    speed = models.FloatField(null=True, blank=True)
 
     class Meta:
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['user', 'date'], name='exercise_session_user_date'),
+            models.Index(fields=['user', 'exercise', 'date'], name='exercise_session_user_type'),
+        ]
 
+    def __str__(self):
+        return f"{self.exercise} {self.id} ({self.date})"
 
-class Walk(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_walks')
-    date = models.DateField()
-    # duration = models.FloatField(null=True)
-    speed = models.FloatField(null=True)
+    def save(self, *args, **kwargs):
+        if not self.exercise:
+            self.exercise = getattr(type(self), 'EXERCISE', '')
+        super().save(*args, **kwargs)
 
 
-class Jump(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_jumps')
-    date = models.DateField()
-    # duration = models.FloatField(null=True)
+class ExerciseTypeManager(models.Manager):
+    """Manager of an exercise type proxy: only that type's sessions."""
 
+    def __init__(self, exercise: str):
+        super().__init__()
+        self.exercise = exercise
+
+    def get_queryset(self):
+        return super().get_queryset().filter(exercise=self.exercise)
 
-class Squat(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_squats')
-    date = models.DateField()
-    # duration = models.FloatField(null=True)
 
+# Per exercise type views of ExerciseSession, e.g. Run.objects.filter(user=user)
+class Run(ExerciseSession):
+    EXERCISE = 'run'
+    objects = ExerciseTypeManager(EXERCISE)
 
-class Land(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_lands')
+    class Meta:
+        proxy = True
+
+
+class Walk(ExerciseSession):
+    EXERCISE = 'walk'
+    objects = ExerciseTypeManager(EXERCISE)
+
+    class Meta:
+        proxy = True
+
+
+class Jump(ExerciseSession):
+    EXERCISE = 'jump'
+    objects = ExerciseTypeManager(EXERCISE)
+
+    class Meta:
+        proxy = True
+
+
+class Squat(ExerciseSession):
+    EXERCISE = 'squat'
+    objects = ExerciseTypeManager(EXERCISE)
+
+    class Meta:
+        proxy = True
+
+
+class Land(ExerciseSession):
+    EXERCISE = 'land'
+    objects = ExerciseTypeManager(EXERCISE)
+
+    class Meta:
+        proxy = True
+
+
+class Lunge(ExerciseSession):
+    EXERCISE = 'lunge'
+    objects = ExerciseTypeManager(EXERCISE)
+
+    class Meta:
+        proxy = True
+
+
+# Ingest manifest: content fingerprints of the files each session was loaded from
+class IngestedSession(models.Model):
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='ingested_sessions')
+    day = models.PositiveIntegerField()
     date = models.DateField()
-    # duration = models.FloatField(null=True)
+    # sha256 over the sorted (file name, file digest) pairs of the session
+    digest = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_ingested_session_day'),
+        ]
 
 
-class Lunge(models.Model):
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='user_lunges')
+class IngestedTrialFile(models.Model):
+    session = models.ForeignKey(IngestedSession, on_delete=models.CASCADE, related_name='files')
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    # sha256 of the file contents
+    digest = models.CharField(max_length=64)
+    # The unit built from the trial this file belongs to; null for files that carry no ingested channels
+    exercise_unit = models.ForeignKey(ExerciseUnit, on_delete=models.SET_NULL, null=True, related_name='source_files')
+    # Validation errors of a quarantined file (its trial was not written); empty once ingested
+    errors = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'name'], name='unique_ingested_trial_file_name'),
+        ]
+
+
+# Live ingest: gait cycles streamed from a wearable are folded into running
+# per-phase mean/variance; each closed kilometre or trial becomes an ExerciseUnit.
+class LiveSession(models.Model):
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='live_sessions')
+    exercise = models.CharField(max_length=16, choices=ExerciseSession.EXERCISE_CHOICES)
     date = models.DateField()
-   
+    # Speed (km/h) of the unit being recorded
+    speed = models.FloatField(null=True, blank=True)
+    # Base channel keys ("<body_part>.<side>.<column stem>", e.g. "knee.left_side.angle")
+    channels = models.JSONField(default=list)
+    phase_count = models.PositiveSmallIntegerField(default=100)
+    # Cycles folded into the open unit and their running mean/M2, little-endian
+    # float64 arrays of shape (len(channels), phase_count)
+    cycle_count = models.PositiveIntegerField(default=0)
+    mean = models.BinaryField(null=True)
+    m2 = models.BinaryField(null=True)
+    exercise_units = models.ManyToManyField(ExerciseUnit, blank=True, related_name='live_sessions')
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def accumulator(self) -> PhaseAccumulator:
+        shape = (len(self.channels), self.phase_count)
+        if not self.cycle_count:
+            return PhaseAccumulator.empty(*shape)
+        return PhaseAccumulator(
+            self.cycle_count,
+            np.frombuffer(self.mean, dtype='<f8').reshape(shape),
+            np.frombuffer(self.m2, dtype='<f8').reshape(shape),
+        )
+
+    def store(self, accumulator: PhaseAccumulator) -> None:
+        """Copy an accumulator's state onto the (unsaved) fields."""
+        self.cycle_count = accumulator.count
+        self.mean = accumulator.mean.astype('<f8').tobytes()
+        self.m2 = accumulator.m2.astype('<f8').tobytes()
@@ -0,0 +1,18 @@
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import BasePermission
+
+from core.models import UserProfile
+
+
+class IsProfileOwner(BasePermission):
+    """
+    Object access for staff and for the account linked to the profile the object belongs to.
+    Objects are UserProfiles or rows with a user foreign key, e.g. LiveSession.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_staff:
+            return True
+        user_id = obj.pk if isinstance(obj, UserProfile) else obj.user_id
+        # Profiles are read from the default database: shard copies may be stale
+        return UserProfile.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id, account_id=request.user.pk).exists()
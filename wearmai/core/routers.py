@@ -0,0 +1,140 @@
+"""
+Read offload to a replica / analytics database.
+
+Reads made inside analytics_reads() go to the ANALYTICS_DB alias when it is
+configured (see settings.DATABASES); everything else uses the primary. The
+first write of a routing scope (one HTTP request, see core.middleware) pins
+the rest of that scope to the primary so it reads its own writes, and reads
+inside a transaction on the primary never leave it.
+
+ShardRouter comes first: it sends the exercise data of a user to their shard
+(see core.sharding) and leaves the default shard to AnalyticsRouter.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.models import UserProfile
+from core.sharding import current_shard, is_sharded, shard_aliases, shard_for, sharding_enabled
+
+ANALYTICS_DB = 'analytics'
+
+
+class RoutingScope():
+    def __init__(self):
+        # Reads may go to the analytics alias
+        self.analytics = False
+        # A write happened; later reads stay on the primary
+        self.pinned = False
+
+
+_scope = contextvars.ContextVar('db_routing_scope', default=None)
+
+
+@contextmanager
+def routing_scope():
+    """Start a fresh routing scope, e.g. per request."""
+    token = _scope.set(RoutingScope())
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def analytics_reads():
+    """Send the reads of the block to the analytics alias, unless the scope has written."""
+    scope = _scope.get()
+    token = None
+    if scope is None:
+        scope = RoutingScope()
+        token = _scope.set(scope)
+    previous = scope.analytics
+    scope.analytics = True
+    try:
+        yield
+    finally:
+        scope.analytics = previous
+        if token is not None:
+            _scope.reset(token)
+
+
+def analytics_configured() -> bool:
+    return ANALYTICS_DB in settings.DATABASES
+
+
+class AnalyticsRouter():
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None or not scope.analytics or scope.pinned or not analytics_configured():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return ANALYTICS_DB
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            scope.pinned = True
+        # Instances read from the analytics alias are saved to the primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == ANALYTICS_DB:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same rows
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ANALYTICS_DB}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The analytics database is a copy of the primary, not migrated on its own
+        if db == ANALYTICS_DB:
+            return False
+        return None
+
+
+class ShardRouter():
+    def _db(self, model, hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if not is_sharded(model):
+            # Profiles related to rows on a shard, e.g. session.user, are read from
+            # the default database rather than the shard's copy
+            if instance is not None and is_sharded(type(instance)) and instance._state.db not in (None, DEFAULT_DB_ALIAS):
+                return DEFAULT_DB_ALIAS
+            return None
+
+        alias = None
+        if instance is not None:
+            if is_sharded(type(instance)):
+                alias = instance._state.db
+            elif isinstance(instance, UserProfile):
+                alias = shard_for(instance)
+        alias = alias or current_shard()
+        # The default shard is left to the next routers, e.g. for the analytics replica
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Rows on a shard point at the shard's copy of their user's profile
+        if sharding_enabled() and any(
+            isinstance(user, UserProfile) and is_sharded(type(row)) for user, row in ((obj1, obj2), (obj2, obj1))
+        ):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards only carry the core schema
+        if db != DEFAULT_DB_ALIAS and db in shard_aliases():
+            return app_label == 'core'
+        return None
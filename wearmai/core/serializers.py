@@ -1,7 +1,11 @@
 from rest_framework import serializers
 from .models import Run, UserProfile
-from core.models import Run, UserProfile, ExerciseUnit
-from services.exercise_summarisation.exercise_summary_service import ExerciseSummaryService
+from core.models import Run, UserProfile, ExerciseUnit, LiveSession
+from core.routers import analytics_reads
+from core.sharding import instance_shard, user_shard
+from services.exercise_summarisation.exercise_summary_service import ExerciseSummaryService, summarise_sketches
+from services.exercise_summarisation.rollup_store import rollup_sketches
+from services.ingest.live_session import LiveSessionService
 
 class RunSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,16 +21,22 @@ class RunDetailSerializer(serializers.ModelSerializer):
         model = Run
         fields = ['id', 'date', 'kilometers', 'averages_across_runs']
 
+    def to_representation(self, instance):
+        with analytics_reads(), instance_shard(instance):
+            return super().to_representation(instance)
+
     def get_averages_across_runs(self, obj):
-        exercise_units = [e for e in ExerciseUnit.objects.filter(run=obj)]
+        exercise_units = [e for e in ExerciseUnit.objects.filter(session=obj)]
         return ExerciseSummaryService(exercise_units).run(aggregate = True)
 
     def get_kilometers(self, obj):
+        exercise_units = list(obj.exercise_units.all())
+        unit_sketches = ExerciseSummaryService(exercise_units).unit_sketches()
         kilometers = {}
-        for index, exercise_unit in enumerate(obj.exercise_units.all()):
+        for index, exercise_unit in enumerate(exercise_units):
             kilometers[f"kilometer_{index}"] = {
                 'speed': exercise_unit.speed,
-                'summary': ExerciseSummaryService([exercise_unit]).run(aggregate = True)
+                'summary': summarise_sketches(unit_sketches.get(exercise_unit.id, {}))
             }
         return kilometers
 
@@ -37,13 +47,57 @@ class UserProfileForLLM(serializers.ModelSerializer):
         model = UserProfile
         fields = ['id', 'name', 'weight', 'height', 'user_summary']
 
+    def to_representation(self, instance):
+        with analytics_reads(), user_shard(instance):
+            return super().to_representation(instance)
 
     def get_user_summary(self, obj):
-        exercise_units = [e for e in ExerciseUnit.objects.filter(run__in=obj.runs.all())]
+        exercise_units = [e for e in ExerciseUnit.objects.filter(session__in=Run.objects.filter(user=obj))]
         ai_user_profile = {
             'runs': {
                 'aggregated_run_summary': ExerciseSummaryService(exercise_units).run(aggregate = True),
+                # Month by month, for questions about trends
+                'monthly_run_summaries': {
+                    month.isoformat(): summarise_sketches(sketches)
+                    for month, sketches in rollup_sketches(obj, 'month', 'run', last=3).items()
+                },
                 'run_data': RunSerializer(Run.objects.filter(user=obj), many=True).data
             }
         }
-        return ai_user_profile
\ No newline at end of file
+        return ai_user_profile
+
+class LiveSessionSerializer(serializers.ModelSerializer):
+    exercise_unit_ids = serializers.PrimaryKeyRelatedField(source='exercise_units', many=True, read_only=True)
+    summary = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LiveSession
+        fields = [
+            'id', 'user', 'exercise', 'date', 'speed', 'channels', 'phase_count',
+            'cycle_count', 'exercise_unit_ids', 'started_at', 'finished_at', 'summary',
+        ]
+        read_only_fields = ['cycle_count', 'started_at', 'finished_at']
+
+    def get_summary(self, obj):
+        return LiveSessionService().summary(obj)
+
+
+class LiveCyclesSerializer(serializers.Serializer):
+    # Either phase-normalised cycles: one {channel: [phase values]} mapping per gait cycle
+    cycles = serializers.ListField(child=serializers.DictField(child=serializers.ListField()), allow_empty=False, required=False)
+    # or raw {channel: [samples]} plus the sample indices of consecutive heel strikes
+    samples = serializers.DictField(child=serializers.ListField(), required=False)
+    heel_strikes = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False)
+
+    def validate(self, data):
+        if ('cycles' in data) == ('samples' in data):
+            raise serializers.ValidationError("Send either cycles or samples")
+        if 'samples' in data and 'heel_strikes' not in data:
+            raise serializers.ValidationError({'heel_strikes': "Required with samples"})
+        return data
+
+
+class LiveCloseSerializer(serializers.Serializer):
+    # Speed of the next kilometre/trial; omit to keep the current one
+    speed = serializers.FloatField(required=False, allow_null=True)
+    finish = serializers.BooleanField(default=False)
@@ -0,0 +1,209 @@
+"""
+Per-user sharding of exercise data across database aliases.
+
+settings.DATABASE_SHARDS lists the aliases holding exercise data, 'default'
+first. The default database also keeps the global tables (GLOBAL_MODELS:
+profiles, shard placements, conversations); every other core model - sessions,
+units, gait phases and side tables, curves, summaries, the ingest manifest and
+live sessions - lives on its user's shard, recorded in UserShard, so all of a
+user's queries stay on one database. Each shard holds a copy of the profile
+row of its users for its foreign keys to point at.
+
+Shard i allocates ids from [i << SHARD_ID_BITS, (i + 1) << SHARD_ID_BITS), so
+ids are unique across shards and an id alone names its shard (id_shard).
+
+Code touching a user's rows runs inside user_shard() (or using_shard() /
+instance_shard() when it starts from an id or a loaded row);
+core.routers.ShardRouter sends the sharded queries of the block there.
+"""
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.models import ExerciseSession, IngestedSession, LiveSession, UserProfile, UserShard
+
+SHARD_ID_BITS = 40
+
+# core models kept on the default database only
+GLOBAL_MODELS = ('userprofile', 'usershard', 'conversation', 'message')
+
+# (user id or None, alias) of the innermost shard block
+_shard = contextvars.ContextVar('db_shard', default=None)
+
+
+def shard_aliases() -> List[str]:
+    return list(getattr(settings, 'DATABASE_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def sharding_enabled() -> bool:
+    return len(shard_aliases()) > 1
+
+
+def is_sharded(model) -> bool:
+    opts = model._meta.concrete_model._meta
+    return opts.app_label == 'core' and opts.model_name not in GLOBAL_MODELS
+
+
+def policy_shard(user_id: int) -> str:
+    """Shard a new user is placed on."""
+    aliases = shard_aliases()
+    return aliases[user_id % len(aliases)]
+
+
+def id_shard(pk: int) -> str:
+    """Shard holding the sharded row with this id."""
+    aliases = shard_aliases()
+    index = int(pk) >> SHARD_ID_BITS
+    if index >= len(aliases):
+        raise ValueError(f"Id {pk} belongs to unknown shard {index}")
+    return aliases[index]
+
+
+def shard_for(user) -> str:
+    """
+    Alias holding a user's exercise data; users seen for the first time are placed.
+    :param user: UserProfile or its id.
+    """
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    user_id = getattr(user, 'pk', user)
+    current = _shard.get()
+    if current is not None and current[0] == user_id:
+        return current[1]
+
+    alias = UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('shard', flat=True).first()
+    if alias is None:
+        alias = place_user(user_id)
+    if alias not in shard_aliases():
+        raise ValueError(f"User {user_id} is placed on unknown shard {alias}")
+    return alias
+
+
+def initial_shard(user_id: int) -> str:
+    """
+    Shard of a user without a placement: 'default' when the user already has exercise
+    data there (loaded before sharding was enabled), else policy_shard(). Records nothing.
+    """
+    legacy = any(
+        model.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).exists()
+        for model in (ExerciseSession, IngestedSession, LiveSession)
+    )
+    return DEFAULT_DB_ALIAS if legacy else policy_shard(user_id)
+
+
+def place_user(user_id: int) -> str:
+    """
+    Record the initial_shard() of a user without a placement.
+    :return: The alias recorded, which is another process' if it placed the user first.
+    """
+    alias = initial_shard(user_id)
+    copy_profile(user_id, alias)
+    placement, _ = UserShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(user_id=user_id, defaults={'shard': alias})
+    return placement.shard
+
+
+def copy_profile(user_id: int, alias: str) -> None:
+    """Copy a profile row to a shard, unless it is there already."""
+    if alias == DEFAULT_DB_ALIAS or UserProfile.objects.using(alias).filter(pk=user_id).exists():
+        return
+    profile = UserProfile.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id)
+    profile.save(using=alias, force_insert=True)
+
+
+def current_shard() -> Optional[str]:
+    current = _shard.get()
+    return current[1] if current is not None else None
+
+
+@contextmanager
+def using_shard(alias: Optional[str], user_id: Optional[int] = None):
+    """
+    Send the sharded queries of the block to alias; None keeps the current routing.
+    :yield: The alias in effect, None outside any shard block.
+    """
+    if alias is None:
+        yield current_shard()
+        return
+    token = _shard.set((user_id, alias))
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+@contextmanager
+def user_shard(user):
+    """Send the sharded queries of the block to the user's shard. :yield: The alias."""
+    user_id = getattr(user, 'pk', user)
+    with using_shard(shard_for(user_id), user_id) as alias:
+        yield alias
+
+
+def instance_shard(instance):
+    """Send the sharded queries of the block to the database a row was loaded from."""
+    return using_shard(instance._state.db if instance is not None else None)
+
+
+def sharded_models() -> List[type]:
+    """Concrete sharded models (M2M tables included), each after the models its foreign keys point to."""
+    remaining = [
+        model for model in apps.get_app_config('core').get_models(include_auto_created=True)
+        if is_sharded(model) and not model._meta.proxy
+    ]
+    ordered = []
+    while remaining:
+        for model in remaining:
+            parents = {field.related_model for field in model._meta.concrete_fields if field.is_relation}
+            if not any(parent in remaining and parent is not model for parent in parents):
+                ordered.append(model)
+                remaining.remove(model)
+                break
+        else:
+            raise ValueError("Circular foreign keys between sharded models")
+    return ordered
+
+
+def user_lookup(model) -> str:
+    """ORM lookup from a sharded model to its user, e.g. 'session__user' for ExerciseUnit."""
+    path = []
+    while True:
+        relations = [field for field in model._meta.concrete_fields if field.is_relation]
+        user_field = next((field for field in relations if field.related_model is UserProfile), None)
+        if user_field is not None:
+            return '__'.join(path + [user_field.name])
+        parent = next((field for field in relations if not field.null and is_sharded(field.related_model)), None)
+        if parent is None:
+            raise ValueError(f"{model.__name__} has no foreign key path to a user")
+        path.append(parent.name)
+        model = parent.related_model
+
+
+def reserve_id_range(alias: str) -> None:
+    """Advance the id sequences of the sharded tables on a shard to the start of its id range."""
+    start = shard_aliases().index(alias) << SHARD_ID_BITS
+    if not start:
+        return
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in sharded_models():
+            table, column = model._meta.db_table, model._meta.pk.column
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start - 1])
+                elif row[0] < start - 1:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start - 1, table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, column])
+                sequence = cursor.fetchone()[0]
+                cursor.execute("SELECT pg_sequence_last_value(%s::regclass)", [sequence])
+                last = cursor.fetchone()[0]
+                if last is None or last < start:
+                    cursor.execute("SELECT setval(%s::regclass, %s, false)", [sequence, start])
+            else:
+                raise ValueError(f"Unsupported shard database: {connection.vendor}")
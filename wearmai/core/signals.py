@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save
+from django.dispatch import receiver
+from core.models import ExerciseUnitCurves, ExerciseUnitSummary
+from core.curves import CURVE_BODY_PARTS, SIDES
+from core.sharding import reserve_id_range, shard_aliases, using_shard
+
+
+@receiver(post_save, sender=ExerciseUnitCurves)
+def rebuild_summaries_on_curves_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    from services.exercise_summarisation.summary_store import rebuild_unit_summaries
+
+    exercise_unit_id = instance.exercise_unit_id
+
+    def rebuild():
+        with using_shard(using):
+            rebuild_unit_summaries([exercise_unit_id])
+
+    transaction.on_commit(rebuild, using=using)
+
+
+def _invalidate_summaries_on_side_save(body_part, side):
+    lookup = f"exercise_unit__gait_phases__{body_part}__{side}"
+
+    def handler(sender, instance, raw=False, using=None, **kwargs):
+        # Row-by-row writes only invalidate; bulk loaders rebuild explicitly
+        if raw:
+            return
+        ExerciseUnitSummary.objects.using(using).filter(**{lookup: instance}).delete()
+
+    return handler
+
+
+_side_save_handlers = []
+for body_part, (_, left_side_model, right_side_model) in CURVE_BODY_PARTS.items():
+    for side, side_model in zip(SIDES, (left_side_model, right_side_model)):
+        handler = _invalidate_summaries_on_side_save(body_part, side)
+        post_save.connect(handler, sender=side_model, dispatch_uid=f"invalidate_summaries_{side_model.__name__}")
+        # receivers are weakly referenced by default
+        _side_save_handlers.append(handler)
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using=None, **kwargs):
+    if sender.name == 'core' and using in shard_aliases():
+        reserve_id_range(using)
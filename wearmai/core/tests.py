@@ -1,3 +1,1646 @@
-from django.test import TestCase
+import io
+import os
+import pickle
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from common.utils.sketch import UNIT_COMPRESSION, SummarySketch, TDigest, sketches_from_stack
+from common.utils.stats import get_batch_summary, get_summary
+from core.admin import UserProfileAdmin
+from core.curves import (
+    CURVE_BODY_PARTS, GAIT_CHANNELS, SIDES, TORQUE_CHANNELS, channel_key, curves_from_gait_phases, load_curves, load_run_curves,
+    pack_exercise_unit, split_channel_key,
+)
+from core.models import (
+    Conversation, ExerciseSession, ExerciseArchive, ExerciseRollup, ExerciseUnit, ExerciseUnitCurves, ExerciseUnitSummary, GaitPhase, HipLeftSide, IngestedSession, IngestedTrialFile, LiveSession,
+    Message, Run, UserProfile, UserShard,
+)
+from core.routers import ANALYTICS_DB, AnalyticsRouter, analytics_reads, routing_scope
+from core.serializers import RunDetailSerializer, UserProfileForLLM
+from core.sharding import id_shard, is_sharded, policy_shard, shard_for, sharded_models, user_lookup, user_shard, using_shard
+from services.archive.archive_service import ExerciseArchiveService
+from services.exercise_summarisation.exercise_summary_service import BODY_PARTS_TO_COLS, ExerciseSummaryService, aggregate_summaries
+from services.exercise_summarisation import rollup_store
+from services.exercise_summarisation.rollup_store import deferred_rollups, refresh_rollups, rollup_sketches, unit_buckets
+from services.export.parquet_export import ParquetExportService, user_units
+from services.ingest.ingest_service import CohortIngestService, SessionIngestService, SessionWriter, purge_units
+from services.ingest.channel_map import missing_file_columns, trial_channels
+from services.ingest.live_session import LIVE_CHANNELS, LiveSessionService
+from services.ingest.manifest import IngestManifest
+from services.ingest.normalization import normalize_cycles
+from services.ingest.parsing import ParsedSession, ParsedTrial, iter_parsed_sessions, parse_session
+from services.ingest.sources import DirectorySession, find_sessions, find_subjects
+from services.ingest.trial_files import PARSE_CACHE_DIR, parse_trial_filename, read_trial_bytes, read_trial_file
+from services.ingest.validation import session_report, validate_trial_file
+from services.purge.purge_service import BulkPurgeService
+from services.sharding.shard_rebalance import ShardRebalanceService
+
+# "SCAN <table>" and "SCAN <table> USING [COVERING] INDEX" both read every row
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+
+
+def _trial(exercise, speed, seed):
+    rng = np.random.default_rng(seed)
+    curves = {key: rng.normal(size=100).astype(np.float32) for key in GAIT_CHANNELS}
+    return ParsedTrial(exercise=exercise, speed=speed, curves=curves)
+
+
+def _write(user, day, storage, trials):
+    session = ParsedSession(day=day.day, path='test', trials=trials, report=session_report(day.day, 'test', []))
+    units, _ = SessionWriter(storage=storage).write(user, day, session)
+    return units
+
+
+def _write_history(user):
+    """Three units over two days, one in both storages and two in the side tables only."""
+    _write(user, date(2024, 1, 1), 'both', [_trial('run', 8.1, 1)])
+    _write(user, date(2024, 1, 2), 'tables', [_trial('run', 9.9, 2), _trial('jump', None, 3)])
+
+
+DATASET = os.path.join(settings.BASE_DIR, 'development', 'datasets', 'User_data', 'User1')
+
+
+def _subject(root, days, trials=('jump', 'run_63')):
+    """Copy the files of a few trials of the sample subject's days into root."""
+    for day in days:
+        source = os.path.join(DATASET, f"day_{day}")
+        target = os.path.join(root, f"day_{day}")
+        os.makedirs(target, exist_ok=True)
+        for name in os.listdir(source):
+            if any(f"_{trial}_" in name for trial in trials):
+                shutil.copy2(os.path.join(source, name), target)
+    return root
+
+
+def _change_first_value(path):
+    """Append a digit to the first value of a trial file, keeping it valid."""
+    with open(path) as file:
+        header, first, *rows = file.readlines()
+    phase, value, rest = first.split('\t', 2)
+    with open(path, 'w') as file:
+        file.writelines([header, f"{phase}\t{value}1\t{rest}", *rows])
+
+
+def _rewrite_trial_file(path, edit):
+    """Rewrite a trial file through edit(rows), rows being lists of cell strings, header first."""
+    with open(path) as file:
+        rows = [line.rstrip('\n').split('\t') for line in file]
+    edit(rows)
+    with open(path, 'w') as file:
+        file.writelines('\t'.join(row) + '\n' for row in rows)
+
+
+def _temp_dir(test):
+    """A temporary directory removed when the test ends."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return directory.name
+
+
+def _ingest_service(**options):
+    """SessionIngestService writing packed curves only."""
+    return SessionIngestService(SessionWriter(storage='curves'), **options)
+
+
+def _reference_summary(values, percision=4):
+    """get_summary as it was before the batched API: one column, no nulls."""
+    values = list(values)
+    return {
+        'min': float(round(min(values), percision)),
+        'q1': float(round(np.percentile(values, 25), percision)),
+        'median': float(round(np.percentile(values, 50), percision)),
+        'q3': float(round(np.percentile(values, 75), percision)),
+        'max': float(round(max(values), percision)),
+        'mean': float(round(np.mean(values), percision)),
+        'std': float(round(np.std(values), percision)),
+    }
+
+
+def _reference_cycles(signals, heel_strikes, phase_count, min_samples=2):
+    """One np.interp per cycle and channel, the straightforward version of normalize_cycles."""
+    samples = np.arange(len(signals))
+    cycles = []
+    for start, end in zip(heel_strikes[:-1], heel_strikes[1:]):
+        if end - start + 1 < min_samples:
+            continue
+        positions = np.linspace(start, end, phase_count)
+        cycles.append([np.interp(positions, samples, signals[:, channel]) for channel in range(signals.shape[1])])
+    return np.array(cycles).reshape(-1, signals.shape[1], phase_count)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class HotPathQueryPlanTests(TestCase):
+    """Fail when a hot read path falls back to a full table scan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserProfile.objects.create(name='Plan User')
+        other = UserProfile.objects.create(name='Other User')
+        for user in (cls.user, other):
+            # Plans are checked on the default database, also when shards are configured
+            UserShard.objects.create(user=user, shard='default')
+            _write(user, date(2024, 1, 1), 'both', [_trial('run', 8.1, 1), _trial('run', 9.9, 2), _trial('jump', None, 3)])
+            _write(user, date(2024, 1, 2), 'curves', [_trial('run', 8.1, 4), _trial('squat', None, 5)])
+        cls.table_units = _write(cls.user, date(2024, 1, 3), 'tables', [_trial('run', 6.3, 6), _trial('lunge', None, 7)])
+
+        conversation = Conversation.objects.create(user_profile=cls.user)
+        for participant in ('user', 'assistant'):
+            Message.objects.create(conversation=conversation, participant=participant, message={'role': participant})
+        cls.conversation = conversation
+
+    def assertNoFullScans(self, queries):
+        selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, "No SELECT queries captured")
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                scans = [row[-1] for row in cursor.fetchall() if FULL_SCAN.match(row[-1])]
+                self.assertFalse(scans, f"Full scan {scans} in:\n{sql}")
+
+    def capture(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return context.captured_queries
+
+    def test_run_detail_serializer(self):
+        runs = Run.objects.filter(user=self.user)
+        self.assertNoFullScans(self.capture(lambda: RunDetailSerializer(runs, many=True).data))
+
+    def test_user_profile_for_llm(self):
+        self.assertNoFullScans(self.capture(lambda: UserProfileForLLM(self.user).data))
+
+    def test_stored_summaries(self):
+        units = list(ExerciseUnit.objects.filter(session__user=self.user))
+        self.assertNoFullScans(self.capture(lambda: ExerciseSummaryService(units).run(aggregate=True)))
+
+    def test_summaries_from_curves_and_tables(self):
+        unit_ids = list(ExerciseUnit.objects.filter(session__user=self.user).values_list('id', flat=True))
+        queries = self.capture(lambda: ExerciseSummaryService([]).compute_unit_sketches(unit_ids))
+        # The tables-only units go through every side table
+        self.assertTrue(any('hipleftside' in query['sql'] for query in queries))
+        self.assertNoFullScans(queries)
+
+    def test_monthly_rollups(self):
+        self.assertNoFullScans(self.capture(lambda: rollup_sketches(self.user, 'month', 'run', last=3)))
+
+    def test_curves_from_gait_phases(self):
+        self.assertNoFullScans(self.capture(lambda: curves_from_gait_phases(self.table_units[0])))
+
+    def test_run_curves(self):
+        run = Run.objects.filter(user=self.user).first()
+        self.assertNoFullScans(self.capture(lambda: load_run_curves(run)))
+
+    def test_user_units(self):
+        self.assertNoFullScans(self.capture(lambda: user_units(self.user)))
+
+    def test_admin_exercises_by_date(self):
+        admin = UserProfileAdmin(UserProfile, None)
+        self.assertNoFullScans(self.capture(lambda: admin.exercises_by_date(self.user)))
+
+    def test_conversation_messages(self):
+        self.assertNoFullScans(self.capture(lambda: self.conversation.to_chat()))
+
+
+@mock.patch('core.routers.analytics_configured', return_value=True)
+class AnalyticsRouterTests(SimpleTestCase):
+    router = AnalyticsRouter()
+
+    def test_reads_outside_analytics_block_use_primary(self, _):
+        with routing_scope():
+            self.assertIsNone(self.router.db_for_read(Run))
+
+    def test_analytics_reads(self, _):
+        with routing_scope():
+            with analytics_reads():
+                self.assertEqual(self.router.db_for_read(Run), ANALYTICS_DB)
+            self.assertIsNone(self.router.db_for_read(Run))
+
+    def test_reads_after_write_use_primary(self, _):
+        with routing_scope():
+            self.router.db_for_write(UserProfile)
+            with analytics_reads():
+                self.assertIsNone(self.router.db_for_read(Run))
+        # A new scope (request) is not pinned
+        with routing_scope(), analytics_reads():
+            self.assertEqual(self.router.db_for_read(Run), ANALYTICS_DB)
+
+    def test_writes_of_analytics_instances_use_primary(self, _):
+        user = UserProfile(name='Replica User')
+        user._state.db = ANALYTICS_DB
+        self.assertEqual(self.router.db_for_write(UserProfile, instance=user), 'default')
+
+    def test_no_migrations_on_analytics(self, _):
+        self.assertFalse(self.router.allow_migrate(ANALYTICS_DB, 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+class AnalyticsRouterTransactionTests(TestCase):
+    @mock.patch('core.routers.analytics_configured', return_value=True)
+    def test_reads_inside_transaction_use_primary(self, _):
+        # TestCase wraps each test in a transaction on the primary
+        with routing_scope(), analytics_reads():
+            self.assertIsNone(AnalyticsRouter().db_for_read(Run))
+
+
+class ShardLayoutTests(SimpleTestCase):
+    def test_global_models(self):
+        self.assertFalse(is_sharded(UserProfile))
+        self.assertTrue(is_sharded(Run))
+
+    def test_models_follow_their_foreign_keys(self):
+        models = sharded_models()
+        for model in models:
+            for field in model._meta.concrete_fields:
+                if field.is_relation and is_sharded(field.related_model):
+                    self.assertLess(models.index(field.related_model), models.index(model), model.__name__)
+
+    def test_every_sharded_model_reaches_a_user(self):
+        for model in sharded_models():
+            user_lookup(model)
+        self.assertEqual(user_lookup(HipLeftSide), 'hip__gait_phase__exercise_unit__session__user')
+
+
+class SessionWriterTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='writer')
+
+    def test_default_storage_writes_curves_only(self):
+        units = _write(self.user, date(2024, 1, 1), None, [_trial('run', 8.1, 1)])
+        with user_shard(self.user):
+            self.assertIn(units[0].pk, load_curves([units[0].pk]))
+            self.assertFalse(GaitPhase.objects.filter(exercise_unit__in=units).exists())
+
+    def test_tables_hold_the_packed_values(self):
+        trial = _trial('run', 8.1, 1)
+        key = 'pelvis.left_side.tilt_angle_avg'
+        trial.curves[key][[3, 50]] = np.nan
+        units = _write(self.user, date(2024, 1, 1), 'both', [trial])
+        with user_shard(self.user):
+            packed = load_curves([units[0].pk])[units[0].pk].as_dict()
+            tables = curves_from_gait_phases(units[0])
+        self.assertLessEqual(set(tables), set(packed))
+        for channel, curve in tables.items():
+            np.testing.assert_array_equal(curve, packed[channel])
+        self.assertTrue(np.isnan(tables[key][[3, 50]]).all())
+
+
+class ExerciseUnitCurvesTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='curves')
+
+    def test_pack_round_trips_through_as_array(self):
+        trial = _trial('run', 8.1, 1)
+        trial.curves['knee.left_side.angle_avg'][7] = np.nan
+        curves = ExerciseUnitCurves.pack(None, trial.curves)
+        self.assertEqual((curves.channels, curves.phase_count), (list(trial.curves), 100))
+        np.testing.assert_array_equal(curves.as_array(), np.stack(list(trial.curves.values())))
+        np.testing.assert_array_equal(curves.channel('knee.left_side.angle_avg'), trial.curves['knee.left_side.angle_avg'])
+
+    def test_gait_phases_match_the_gait_phase_rows(self):
+        (unit,) = _write(self.user, date(2024, 1, 1), 'tables', [_trial('run', 8.1, 1)])
+        with user_shard(self.user):
+            curves = pack_exercise_unit(unit)
+            rows = list(GaitPhase.objects.filter(exercise_unit=unit).order_by('phase'))
+        view = curves.gait_phases()
+        self.assertEqual(len(view), len(rows))
+        for packed, row in zip(view, rows):
+            for key in curves.channels:
+                body_part, side, column = split_channel_key(key)
+                expected = getattr(getattr(getattr(row, body_part), side), column)
+                self.assertEqual(np.float32(getattr(getattr(getattr(packed, body_part), side), column)), np.float32(expected))
+
+    def test_pack_curves_is_idempotent(self):
+        _write(self.user, date(2024, 1, 1), 'tables', [_trial('run', 8.1, 1), _trial('jump', None, 2)])
+        (unit,) = _write(self.user, date(2024, 1, 2), 'both', [_trial('run', 9.9, 3)])
+        with user_shard(self.user):
+            packed_at_write = ExerciseUnitCurves.objects.get(exercise_unit=unit)
+
+        call_command('pack_curves')
+        with user_shard(self.user):
+            first = {curves.exercise_unit_id: curves.data for curves in ExerciseUnitCurves.objects.all()}
+        self.assertEqual(len(first), 3)
+        self.assertEqual(bytes(first[unit.pk]), bytes(packed_at_write.data))
+
+        with self.assertLogs('core.management.commands.pack_curves') as logs:
+            call_command('pack_curves')
+        self.assertIn('"packed": 0', logs.output[-1])
+
+        # Repacking from the side tables keeps the torque channels, which only live in the blob
+        call_command('pack_curves', rebuild=True)
+        with user_shard(self.user):
+            rebuilt = ExerciseUnitCurves.objects.get(exercise_unit=unit)
+            again = {curves.exercise_unit_id: bytes(curves.data) for curves in ExerciseUnitCurves.objects.all()}
+        self.assertEqual(set(rebuilt.channels), set(packed_at_write.channels))
+        np.testing.assert_array_equal(
+            [rebuilt.channel(key) for key in packed_at_write.channels], packed_at_write.as_array(),
+        )
+        self.assertEqual(again.keys(), first.keys())
+
+
+@unittest.skipUnless(len(settings.DATABASE_SHARDS) > 1, "Needs DATABASE_SHARDS")
+class ShardRebalanceTests(TestCase):
+    databases = '__all__'
+
+    def test_move_user(self):
+        user = UserProfile.objects.create(name='Shard User')
+        source = shard_for(user)
+        _write(user, date(2024, 1, 1), 'both', [_trial('run', 8.1, 1), _trial('jump', None, 2)])
+        with user_shard(user):
+            before = ExerciseSummaryService(list(ExerciseUnit.objects.filter(session__user=user))).run(aggregate=True)
+
+        target = next(alias for alias in settings.DATABASE_SHARDS if alias != source)
+        self.assertGreater(ShardRebalanceService(batch_size=50).move_user(user, target), 0)
+
+        self.assertEqual(shard_for(user), target)
+        self.assertFalse(ExerciseUnit.objects.using(source).filter(session__user=user).exists())
+        with user_shard(user):
+            units = list(ExerciseUnit.objects.filter(session__user=user))
+        self.assertEqual(len(units), 2)
+        self.assertEqual({id_shard(unit.pk) for unit in units}, {target})
+        self.assertEqual(ExerciseSummaryService(units).run(aggregate=True), before)
+
+    def test_plan_is_read_only(self):
+        users = [UserProfile.objects.create(name=f'Unplaced {i}') for i in range(4)]
+        # Loaded before sharding: data on 'default' without a placement
+        ExerciseSession.objects.using('default').create(user_id=users[1].pk, exercise='run', date=date(2024, 1, 1))
+
+        with CaptureQueriesContext(connections['default']) as queries:
+            moves = ShardRebalanceService().plan()
+        self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+        self.assertFalse(UserShard.objects.filter(user__in=users).exists())
+        expected = [
+            (user.pk, 'default', policy_shard(user.pk)) for user in users
+            if user == users[1] and policy_shard(user.pk) != 'default'
+        ]
+        self.assertEqual([move for move in moves if move.user_id in {user.pk for user in users}], expected)
+
+
+    def test_dry_run_of_one_user_places_nothing(self):
+        user = UserProfile.objects.create(name='Unplaced')
+        target = next(alias for alias in settings.DATABASE_SHARDS if alias != policy_shard(user.pk))
+        with self.assertLogs('core.management.commands.rebalance_shards') as logs:
+            call_command('rebalance_shards', user='Unplaced', to=target, dry_run=True)
+        self.assertIn('user_shard_move_planned', logs.output[0])
+        self.assertFalse(UserShard.objects.filter(user=user).exists())
+        self.assertIsNone(ShardRebalanceService().plan_user(user.pk))
+
+
+class ExerciseArchiveTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        override = override_settings(EXERCISE_ARCHIVE_DIR=_temp_dir(self))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_archive_round_trip(self):
+        user = UserProfile.objects.create(name='Archive User')
+        _write(user, date(2024, 1, 1), 'both', [_trial('run', 8.1, 1), _trial('jump', None, 2)])
+        _write(user, date(2024, 1, 2), 'tables', [_trial('run', 9.9, 3)])
+        _write(user, date(2024, 6, 1), 'curves', [_trial('squat', None, 4)])
+        with user_shard(user):
+            units = list(ExerciseUnit.objects.filter(session__user=user).order_by('id'))
+            runs = list(Run.objects.filter(user=user).order_by('id'))
+            before_curves = {unit_id: curves.as_dict() for unit_id, curves in load_curves(units).items()}
+            before_runs = [RunDetailSerializer(run).data for run in runs]
+
+        service = ExerciseArchiveService(older_than_days=90)
+        archive = service.archive_user(user, today=date(2024, 6, 1))
+        self.assertEqual(archive.unit_count, 3)
+        self.assertIsNone(service.archive_user(user, today=date(2024, 6, 1)))
+
+        with user_shard(user):
+            self.assertFalse(GaitPhase.objects.filter(exercise_unit__session__user=user).exists())
+            after_curves = {unit_id: curves.as_dict() for unit_id, curves in load_curves(units).items()}
+            self.assertEqual([RunDetailSerializer(run).data for run in runs], before_runs)
+        self.assertEqual(set(after_curves), {unit.id for unit in units})
+        for unit_id, curves in before_curves.items():
+            self.assertEqual(list(after_curves[unit_id]), list(curves))
+            for key, curve in curves.items():
+                np.testing.assert_array_equal(after_curves[unit_id][key], curve)
+
+        self.assertEqual(service.restore_user(user), 3)
+        with user_shard(user):
+            self.assertFalse(ExerciseArchive.objects.filter(user=user).exists())
+            restored = {unit_id: curves.as_dict() for unit_id, curves in load_curves(units).items()}
+        self.assertEqual(set(restored), set(after_curves))
+
+    def test_compact_drops_frames_of_purged_units(self):
+        user = UserProfile.objects.create(name='Compact User')
+        _write(user, date(2024, 1, 1), 'curves', [_trial('run', 8.1, 1), _trial('jump', None, 2)])
+        _write(user, date(2024, 1, 2), 'curves', [_trial('squat', None, 3)])
+        service = ExerciseArchiveService(older_than_days=90)
+        archive = service.archive_user(user, today=date(2024, 6, 1))
+        old_path = os.path.join(settings.EXERCISE_ARCHIVE_DIR, archive.path)
+        with user_shard(user):
+            units = list(ExerciseUnit.objects.filter(session__user=user).order_by('id'))
+            before = {unit_id: curves.as_dict() for unit_id, curves in load_curves(units).items()}
+            purge_units([units[0].id])
+
+        with self.captureOnCommitCallbacks(using=shard_for(user), execute=True):
+            self.assertGreater(service.compact_user(user), 0)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(service.compact_user(user), 0)
+        with user_shard(user):
+            archive.refresh_from_db()
+            self.assertEqual(archive.unit_count, 2)
+            self.assertEqual(archive.size, os.path.getsize(os.path.join(settings.EXERCISE_ARCHIVE_DIR, archive.path)))
+            after = {unit_id: curves.as_dict() for unit_id, curves in load_curves(units[1:]).items()}
+        self.assertEqual(set(after), {unit.id for unit in units[1:]})
+        for unit_id, curves in after.items():
+            for key, curve in curves.items():
+                np.testing.assert_array_equal(curve, before[unit_id][key])
+
+        with user_shard(user):
+            purge_units([unit.id for unit in units[1:]])
+        with self.captureOnCommitCallbacks(using=shard_for(user), execute=True):
+            service.compact_user(user)
+        with user_shard(user):
+            self.assertFalse(ExerciseArchive.objects.filter(user=user).exists())
+        self.assertEqual(os.listdir(os.path.join(settings.EXERCISE_ARCHIVE_DIR, f"user_{user.id}")), [])
+
+
+class BulkPurgeTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='Purge User')
+        Conversation.objects.create(user_profile=self.user)
+        _write(self.user, date(2024, 1, 1), 'both', [_trial('run', 8.1, 1), _trial('jump', None, 2)])
+        _write(self.user, date(2024, 1, 2), 'tables', [_trial('run', 9.9, 3)])
+        with user_shard(self.user):
+            units = list(ExerciseUnit.objects.filter(session__user=self.user).order_by('id'))
+            live = LiveSession.objects.create(user=self.user, exercise='run', date=date(2024, 1, 2))
+            live.exercise_units.set(units[-1:])
+            ingested = IngestedSession.objects.create(user=self.user, day=1, date=date(2024, 1, 1), digest='')
+            IngestedTrialFile.objects.create(
+                session=ingested, name='run.txt', size=1, mtime_ns=1, digest='', exercise_unit=units[0],
+            )
+        self.units = units
+
+    def collector_rows(self, queryset):
+        """Rows QuerySet.delete() would delete, rolled back."""
+        with transaction.atomic(using=queryset.db):
+            _, rows = queryset.delete()
+            transaction.set_rollback(True, using=queryset.db)
+        return {label: count for label, count in rows.items() if count}
+
+    def test_purge_matches_collector(self):
+        self.maxDiff = None
+        with user_shard(self.user):
+            queryset = ExerciseUnit.objects.filter(id__in=[self.units[0].id, self.units[-1].id])
+            expected = self.collector_rows(queryset)
+            report = BulkPurgeService().purge(queryset)
+            self.assertEqual(report.rows, expected)
+            self.assertEqual(list(ExerciseUnit.objects.filter(session__user=self.user)), self.units[1:-1])
+            self.assertEqual(list(IngestedTrialFile.objects.values_list('exercise_unit', flat=True)), [None])
+
+    def test_purge_user(self):
+        with user_shard(self.user) as alias:
+            expected = self.collector_rows(UserProfile.objects.using(alias).filter(pk=self.user.pk))
+        report = BulkPurgeService().purge_user(self.user)
+        for label, count in expected.items():
+            self.assertGreaterEqual(report.rows[label], count, label)
+        for alias in settings.DATABASE_SHARDS:
+            self.assertFalse(UserProfile.objects.using(alias).filter(pk=self.user.pk).exists())
+            self.assertFalse(GaitPhase.objects.using(alias).exists())
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_purge_user_keep_profile(self):
+        BulkPurgeService().purge_user(self.user, keep_profile=True)
+        self.assertTrue(Conversation.objects.filter(user_profile=self.user).exists())
+        with user_shard(self.user):
+            self.assertFalse(ExerciseUnit.objects.exists())
+            self.assertFalse(LiveSession.objects.exists())
+            self.assertFalse(IngestedSession.objects.exists())
+
+
+class ExerciseRollupTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='Rollup User')
+        # 2024-01-29 is a Monday: two weeks in January, one spanning into February
+        for seed, day in enumerate((date(2024, 1, 29), date(2024, 1, 31), date(2024, 2, 1), date(2024, 2, 6))):
+            _write(self.user, day, 'curves', [_trial('run', 8.1, seed), _trial('jump', None, seed + 10)])
+
+    def assertRollupMatches(self, rolled_up, units):
+        expected = aggregate_summaries(ExerciseSummaryService(units).run_sketches())
+        self.assertEqual(
+            {(body_part, side, col) for body_part, sides in rolled_up.items() for side, cols in sides.items() for col in cols},
+            {(body_part, side, col) for body_part, sides in expected.items() for side, cols in sides.items() for col in cols},
+        )
+        for body_part, sides in expected.items():
+            for side, cols in sides.items():
+                for col, sketch in cols.items():
+                    self.assertEqual(rolled_up[body_part][side][col].count, sketch.count)
+                    self.assertAlmostEqual(rolled_up[body_part][side][col].mean, sketch.mean)
+                    self.assertAlmostEqual(rolled_up[body_part][side][col].std, sketch.std)
+
+    def run_units(self, start, end):
+        return list(ExerciseUnit.objects.filter(
+            session__user=self.user, session__exercise='run', session__date__gte=start, session__date__lt=end,
+        ).order_by('id'))
+
+    def test_rollups_follow_ingest(self):
+        with user_shard(self.user):
+            months = rollup_sketches(self.user, 'month', 'run')
+            self.assertEqual(list(months), [date(2024, 1, 1), date(2024, 2, 1)])
+            self.assertRollupMatches(months[date(2024, 2, 1)], self.run_units(date(2024, 2, 1), date(2024, 3, 1)))
+
+            weeks = rollup_sketches(self.user, 'week', 'run', last=1)
+            self.assertEqual(list(weeks), [date(2024, 2, 5)])
+            self.assertRollupMatches(rollup_sketches(self.user, 'week', 'run')[date(2024, 1, 29)],
+                                     self.run_units(date(2024, 1, 29), date(2024, 2, 5)))
+            self.assertEqual(
+                set(ExerciseRollup.objects.filter(user=self.user).values_list('exercise', flat=True)), {'run', 'jump'},
+            )
+
+    def test_rollups_drop_removed_units(self):
+        with user_shard(self.user):
+            removed = self.run_units(date(2024, 2, 6), date(2024, 2, 7))
+            buckets = unit_buckets([unit.id for unit in removed])
+            BulkPurgeService().purge(ExerciseUnit.objects.filter(id__in=[unit.id for unit in removed]))
+            refresh_rollups(buckets)
+            self.assertFalse(ExerciseRollup.objects.filter(period='week', period_start=date(2024, 2, 5), exercise='run').exists())
+            self.assertRollupMatches(rollup_sketches(self.user, 'month', 'run')[date(2024, 2, 1)],
+                                     self.run_units(date(2024, 2, 1), date(2024, 3, 1)))
+
+    def test_new_units_are_merged_into_existing_rollups(self):
+        with user_shard(self.user):
+            with mock.patch('services.exercise_summarisation.rollup_store._refresh_buckets') as recompute:
+                _write(self.user, date(2024, 2, 7), 'curves', [_trial('run', 9.9, 30), _trial('run', 7.5, 31)])
+            recompute.assert_not_called()
+            merged = {
+                (row.period, row.period_start, row.body_part, row.side, row.column): row
+                for row in ExerciseRollup.objects.filter(user=self.user, exercise='run')
+            }
+            self.assertEqual(merged[('week', date(2024, 2, 5), 'Hip', 'HipLeftSide', 'flexion_avg')].unit_count, 3)
+            self.assertRollupMatches(rollup_sketches(self.user, 'month', 'run')[date(2024, 2, 1)],
+                                     self.run_units(date(2024, 2, 1), date(2024, 3, 1)))
+
+            # Same as recomputing the buckets from scratch, up to the digest
+            refresh_rollups(unit_buckets(ExerciseUnit.objects.values_list('id', flat=True)))
+            for row in ExerciseRollup.objects.filter(user=self.user, exercise='run'):
+                incremental = merged[(row.period, row.period_start, row.body_part, row.side, row.column)]
+                self.assertEqual((incremental.unit_count, incremental.count), (row.unit_count, row.count))
+                self.assertAlmostEqual(incremental.mean, row.mean)
+                self.assertAlmostEqual(incremental.m2, row.m2, places=6)
+                self.assertEqual((incremental.min, incremental.max), (row.min, row.max))
+                np.testing.assert_allclose(
+                    incremental.to_sketch().quantile([0.25, 0.5, 0.75]), row.to_sketch().quantile([0.25, 0.5, 0.75]),
+                    atol=0.01 * (row.max - row.min),
+                )
+
+    def test_deferred_rollups_merge_new_and_recompute_replaced_units(self):
+        with user_shard(self.user):
+            replaced = self.run_units(date(2024, 2, 6), date(2024, 2, 7))
+            with deferred_rollups():
+                buckets = unit_buckets([unit.id for unit in replaced])
+                BulkPurgeService().purge(ExerciseUnit.objects.filter(id__in=[unit.id for unit in replaced]))
+                refresh_rollups(buckets)
+                _write(self.user, date(2024, 2, 6), 'curves', [_trial('run', 9.9, 30)])
+                _write(self.user, date(2024, 3, 4), 'curves', [_trial('run', 9.9, 31)])
+            for start, end in ((date(2024, 2, 5), date(2024, 2, 12)), (date(2024, 3, 4), date(2024, 3, 11))):
+                units = self.run_units(start, end)
+                self.assertEqual(len(units), 1)
+                self.assertEqual(
+                    set(ExerciseRollup.objects.filter(period='week', period_start=start, exercise='run').values_list('unit_count', flat=True)),
+                    {1},
+                )
+                self.assertRollupMatches(rollup_sketches(self.user, 'week', 'run')[start], units)
+
+    def test_curve_edits_rebuild_summaries_and_rollups(self):
+        with user_shard(self.user) as alias:
+            (unit,) = self.run_units(date(2024, 1, 31), date(2024, 2, 1))
+            curves = ExerciseUnitCurves.objects.get(exercise_unit=unit)
+            edited = curves.as_dict()
+            edited['hip.left_side.flexion_avg'] = np.full(100, 5.0, dtype=np.float32)
+            packed = ExerciseUnitCurves.pack(unit, edited)
+            curves.channels, curves.data = packed.channels, packed.data
+            # The rebuild runs once the edit is committed
+            with self.captureOnCommitCallbacks(using=alias, execute=True) as callbacks:
+                curves.save()
+            self.assertEqual(len(callbacks), 1)
+
+            row = ExerciseUnitSummary.objects.get(exercise_unit=unit, body_part='Hip', side='HipLeftSide', column='flexion_avg')
+            self.assertEqual((row.min, row.max, row.mean, row.median), (5.0, 5.0, 5.0, 5.0))
+            self.assertRollupMatches(rollup_sketches(self.user, 'week', 'run')[date(2024, 1, 29)],
+                                     self.run_units(date(2024, 1, 29), date(2024, 2, 5)))
+            self.assertRollupMatches(rollup_sketches(self.user, 'month', 'run')[date(2024, 1, 1)],
+                                     self.run_units(date(2024, 1, 1), date(2024, 2, 1)))
+
+    def test_side_table_edits_invalidate_until_rebuilt(self):
+        (unit,) = _write(self.user, date(2024, 2, 7), 'tables', [_trial('run', 9.9, 30)])
+        with user_shard(self.user):
+            others = ExerciseUnitSummary.objects.exclude(exercise_unit=unit).count()
+            side = HipLeftSide.objects.filter(hip__gait_phase__exercise_unit=unit).order_by('hip__gait_phase__phase').first()
+            side.flexion_avg = 1000.0
+            side.save()
+            self.assertFalse(ExerciseUnitSummary.objects.filter(exercise_unit=unit).exists())
+            self.assertEqual(ExerciseUnitSummary.objects.count(), others)
+            # Until rebuilt, readers fall back to the side tables
+            summaries = {body_part: sides for summary in ExerciseSummaryService([unit]).run() for body_part, sides in summary.items()}
+            self.assertEqual(summaries['Hip']['HipLeftSide']['flexion_avg']['max'], 1000.0)
+
+        with self.assertLogs('services.exercise_summarisation.summary_store') as logs:
+            call_command('rebuild_exercise_summaries', missing_only=True)
+        self.assertEqual(sum('"units": 1,' in line for line in logs.output), 1)
+        with user_shard(self.user):
+            row = ExerciseUnitSummary.objects.get(exercise_unit=unit, body_part='Hip', side='HipLeftSide', column='flexion_avg')
+            self.assertEqual(row.max, 1000.0)
+            self.assertEqual(ExerciseUnitSummary.objects.count(), others + ExerciseUnitSummary.objects.filter(exercise_unit=unit).count())
+            self.assertRollupMatches(rollup_sketches(self.user, 'week', 'run')[date(2024, 2, 5)],
+                                     self.run_units(date(2024, 2, 5), date(2024, 2, 12)))
+
+    def test_rebuild_command_restores_summaries_and_rollups(self):
+        with user_shard(self.user):
+            removed = self.run_units(date(2024, 1, 31), date(2024, 2, 1))
+            expected = {
+                (row.exercise_unit_id, row.body_part, row.side, row.column): (row.count, row.mean, row.min, row.max, row.median)
+                for row in ExerciseUnitSummary.objects.exclude(exercise_unit__in=removed)
+            }
+            # Deleting a unit cascades to its summaries; its rollups are recomputed by the rebuild
+            ExerciseUnit.objects.filter(id__in=[unit.id for unit in removed]).delete()
+            ExerciseUnitSummary.objects.all().delete()
+            ExerciseRollup.objects.all().delete()
+
+        call_command('rebuild_exercise_summaries', user=self.user.name)
+        with user_shard(self.user):
+            rebuilt = {
+                (row.exercise_unit_id, row.body_part, row.side, row.column): (row.count, row.mean, row.min, row.max, row.median)
+                for row in ExerciseUnitSummary.objects.all()
+            }
+            self.assertEqual(rebuilt, expected)
+            self.assertEqual(
+                set(ExerciseRollup.objects.filter(period='week', exercise='run').values_list('period_start', 'unit_count')),
+                {(date(2024, 1, 29), 2), (date(2024, 2, 5), 1)},
+            )
+            self.assertRollupMatches(rollup_sketches(self.user, 'month', 'run')[date(2024, 1, 1)],
+                                     self.run_units(date(2024, 1, 1), date(2024, 2, 1)))
+
+        with self.assertRaisesMessage(CommandError, "No user profile named 'nobody'"):
+            call_command('rebuild_exercise_summaries', user='nobody')
+
+    def test_deferred_rollups(self):
+        with user_shard(self.user):
+            with deferred_rollups():
+                _write(self.user, date(2024, 3, 4), 'curves', [_trial('run', 9.9, 20)])
+                self.assertFalse(ExerciseRollup.objects.filter(period_start=date(2024, 3, 1)).exists())
+            self.assertTrue(ExerciseRollup.objects.filter(period_start=date(2024, 3, 1)).exists())
+            self.assertTrue(ExerciseRollup.objects.filter(period_start=date(2024, 3, 4)).exists())
+
+    def test_deferred_rollups_keep_the_block_error(self):
+        with user_shard(self.user):
+            with self.assertRaisesMessage(RuntimeError, 'ingest failed'), mock.patch(
+                'services.exercise_summarisation.rollup_store._refresh_buckets', side_effect=ValueError('refresh failed'),
+            ), deferred_rollups():
+                _write(self.user, date(2024, 3, 4), 'curves', [_trial('run', 9.9, 20)])
+                raise RuntimeError('ingest failed')
+
+            # Committed work before the error is still rolled up
+            with self.assertRaises(RuntimeError), deferred_rollups():
+                _write(self.user, date(2024, 4, 1), 'curves', [_trial('run', 9.9, 21)])
+                raise RuntimeError('ingest failed')
+            self.assertTrue(ExerciseRollup.objects.filter(period_start=date(2024, 4, 1)).exists())
+
+
+class LiveSessionApiTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        accounts = get_user_model().objects
+        self.owner = accounts.create_user('owner', password='x')
+        self.other = accounts.create_user('other', password='x')
+        self.user = UserProfile.objects.create(name='Live User', account=self.owner)
+        UserProfile.objects.create(name='Other User', account=self.other)
+        self.channel = LIVE_CHANNELS[0]
+
+    def client_for(self, account=None):
+        client = APIClient()
+        if account is not None:
+            client.force_authenticate(account)
+        return client
+
+    def start(self, client):
+        return client.post(reverse('live-session-create'), {
+            'user': self.user.pk, 'exercise': 'run', 'date': '2024-01-01', 'channels': [self.channel],
+        }, format='json')
+
+    def test_owner(self):
+        client = self.client_for(self.owner)
+        response = self.start(client)
+        self.assertEqual(response.status_code, 201)
+        pk = response.data['id']
+        cycles = [{self.channel: list(np.linspace(0, 1, 100))}]
+        self.assertEqual(client.post(reverse('live-session-cycles', args=[pk]), {'cycles': cycles}, format='json').status_code, 200)
+        self.assertEqual(client.get(reverse('live-session-detail', args=[pk])).data['cycle_count'], 1)
+        response = client.post(reverse('live-session-close', args=[pk]), {'finish': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['exercise_unit_id'])
+
+    def test_anonymous_and_other_users_are_rejected(self):
+        pk = self.start(self.client_for(self.owner)).data['id']
+        for client in (self.client_for(), self.client_for(self.other)):
+            self.assertIn(self.start(client).status_code, (401, 403))
+            self.assertIn(client.get(reverse('live-session-detail', args=[pk])).status_code, (401, 403))
+            cycles = [{self.channel: [0.0] * 100}]
+            self.assertIn(client.post(reverse('live-session-cycles', args=[pk]), {'cycles': cycles}, format='json').status_code, (401, 403))
+            self.assertIn(client.post(reverse('live-session-close', args=[pk]), {}, format='json').status_code, (401, 403))
+        with using_shard(id_shard(pk)):
+            self.assertEqual(LiveSession.objects.get(pk=pk).cycle_count, 0)
+
+
+class ParquetExportViewTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        accounts = get_user_model().objects
+        self.owner = accounts.create_user('owner', password='x')
+        self.other = accounts.create_user('other', password='x')
+        self.user = UserProfile.objects.create(name='Export User', account=self.owner)
+        _write_history(self.user)
+        self.url = reverse('user-export-parquet', args=[self.user.pk])
+
+    def test_owner_and_staff_download(self):
+        staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+        expected = io.BytesIO()
+        ParquetExportService().write(self.user, expected)
+        expected = pq.read_table(io.BytesIO(expected.getvalue()))
+        for account in (self.owner, staff):
+            client = APIClient()
+            client.force_authenticate(account)
+            response = client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+            self.assertTrue(table.equals(expected))
+            self.assertEqual(table.num_rows, 300)
+
+    def test_anonymous_and_other_users_are_rejected(self):
+        self.assertIn(APIClient().get(self.url).status_code, (401, 403))
+        client = APIClient()
+        client.force_authenticate(self.other)
+        self.assertEqual(client.get(self.url).status_code, 403)
+
+    def test_tables_only_units_are_read_per_batch(self):
+        def export_queries():
+            with user_shard(self.user) as alias, CaptureQueriesContext(connections[alias]) as context:
+                ParquetExportService().write(self.user, io.BytesIO())
+            return len(context.captured_queries)
+
+        before = export_queries()
+        _write(self.user, date(2024, 1, 3), 'tables', [_trial('run', 6.3, seed) for seed in range(4, 8)])
+        self.assertEqual(export_queries(), before)
+
+
+class IncrementalIngestTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.path = _subject(_temp_dir(self), (1, 2))
+        self.user = UserProfile.objects.create(name='Ingest User')
+
+    def sessions(self):
+        with user_shard(self.user):
+            return sorted(ExerciseSession.objects.filter(user=self.user).values_list('exercise', 'date'))
+
+    def test_unchanged_rerun_touches_no_units(self):
+        service = _ingest_service()
+        self.assertEqual(service.ingest_subject(self.path, self.user, date(2024, 1, 1)).units, 4)
+        with user_shard(self.user):
+            unit_ids = set(ExerciseUnit.objects.values_list('id', flat=True))
+        # Without a start date the recorded dates are kept
+        self.assertEqual(service.ingest_subject(self.path, self.user).units, 0)
+        self.assertEqual(service.ingest_subject(self.path, self.user, date(2024, 1, 1)).units, 0)
+        with user_shard(self.user):
+            self.assertEqual(set(ExerciseUnit.objects.values_list('id', flat=True)), unit_ids)
+        self.assertEqual(self.sessions(), [
+            ('jump', date(2024, 1, 1)), ('jump', date(2024, 1, 2)), ('run', date(2024, 1, 1)), ('run', date(2024, 1, 2)),
+        ])
+
+    def test_stats_include_the_rollup_refresh(self):
+        refresh = rollup_store._refresh_pending
+
+        def slow_refresh(pending):
+            time.sleep(0.5)
+            refresh(pending)
+
+        with mock.patch.object(rollup_store, '_refresh_pending', side_effect=slow_refresh) as refreshed:
+            stats = _ingest_service().ingest_subject(self.path, self.user, date(2024, 1, 1))
+        refreshed.assert_called_once()
+        self.assertGreaterEqual(stats.seconds, 0.5)
+        with user_shard(self.user):
+            self.assertTrue(ExerciseRollup.objects.filter(user=self.user).exists())
+
+    def test_parallel_parsing_matches_one_worker(self):
+        def summary(sessions):
+            return [
+                (session.day, [(trial.exercise, trial.speed, sorted(trial.curves)) for trial in session.trials])
+                for session in sessions
+            ]
+
+        # More sessions than the 2 * workers kept in flight, so results are handed back while others parse
+        jobs = [(source,) for source in find_sessions(self.path)] * 3
+        serial = list(iter_parsed_sessions(jobs))
+        parallel = list(iter_parsed_sessions(jobs, workers=2, cache=True))
+        self.assertEqual(summary(parallel), summary(serial))
+        for parallel_session, serial_session in zip(parallel, serial):
+            for parallel_trial, serial_trial in zip(parallel_session.trials, serial_session.trials):
+                for key, curve in serial_trial.curves.items():
+                    np.testing.assert_array_equal(parallel_trial.curves[key], curve)
+        self.assertTrue(os.listdir(os.path.join(self.path, 'day_1', PARSE_CACHE_DIR)))
+
+        def written(user):
+            with user_shard(user):
+                units = ExerciseUnit.objects.filter(session__user=user).order_by('id')
+                curves = load_curves(units)
+                return [
+                    (date, exercise, speed, curves[unit_id].channels, curves[unit_id].as_array().tolist())
+                    for unit_id, date, exercise, speed in units.values_list('id', 'session__date', 'session__exercise', 'speed')
+                ]
+
+        parallel_user = UserProfile.objects.create(name='Parallel Ingest User')
+        self.assertEqual(_ingest_service().ingest_subject(self.path, self.user, date(2024, 1, 1)).units, 4)
+        # Reads back the sidecars written above
+        stats = _ingest_service(workers=2, parse_cache=True).ingest_subject(self.path, parallel_user, date(2024, 1, 1))
+        self.assertEqual(stats.units, 4)
+        self.assertEqual(written(parallel_user), written(self.user))
+
+    def test_redated_sessions_leave_no_empty_sessions(self):
+        service = _ingest_service()
+        service.ingest_subject(self.path, self.user, date(2024, 1, 1))
+        self.assertEqual(service.ingest_subject(self.path, self.user, date(2024, 3, 1)).units, 4)
+        self.assertEqual(self.sessions(), [
+            ('jump', date(2024, 3, 1)), ('jump', date(2024, 3, 2)), ('run', date(2024, 3, 1)), ('run', date(2024, 3, 2)),
+        ])
+        with user_shard(self.user):
+            self.assertFalse(ExerciseSession.objects.filter(exercise_units__isnull=True).exists())
+            self.assertEqual(ExerciseUnit.objects.count(), 4)
+
+    def test_manifest_plans(self):
+        _ingest_service().ingest_subject(self.path, self.user, date(2024, 1, 1))
+        day_1 = os.path.join(self.path, 'day_1')
+        run_file = os.path.join(day_1, 'Subj04_run_63_ikAngAve_l.txt')
+        with user_shard(self.user):
+            manifest = IngestManifest(self.user)
+            units = dict(
+                ExerciseUnit.objects.filter(session__date=date(2024, 1, 1)).values_list('session__exercise', 'id')
+            )
+            self.assertEqual(manifest.start_date(), date(2024, 1, 1))
+            self.assertIsNone(manifest.plan(DirectorySession(1, day_1), date(2024, 1, 1)))
+
+            # A touched but unchanged file is skipped, and its new mtime recorded
+            stat = os.stat(run_file)
+            os.utime(run_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertIsNone(manifest.plan(DirectorySession(1, day_1), date(2024, 1, 1)))
+            self.assertEqual(
+                IngestedTrialFile.objects.get(session__day=1, name=os.path.basename(run_file)).mtime_ns,
+                stat.st_mtime_ns + 10**9,
+            )
+
+            # A changed file re-plans its trial only
+            _change_first_value(run_file)
+            plan = manifest.plan(DirectorySession(1, day_1), date(2024, 1, 1))
+            self.assertEqual(plan.changed_trials, {('run', 6.3)})
+            self.assertEqual(plan.stale_unit_ids(), [units['run']])
+            self.assertEqual(plan.stale_unit_ids(keep={('run', 6.3)}), [])
+
+            # A removed file changes its trial too
+            os.remove(os.path.join(day_1, 'Subj04_jump_musForStd_r.txt'))
+            plan = manifest.plan(DirectorySession(1, day_1), date(2024, 1, 1))
+            self.assertEqual(plan.changed_trials, {('run', 6.3), ('jump', None)})
+
+            # Re-dating re-plans every trial of the session
+            self.assertIsNone(manifest.plan(DirectorySession(2, os.path.join(self.path, 'day_2')), date(2024, 1, 2)))
+            plan = manifest.plan(DirectorySession(2, os.path.join(self.path, 'day_2')), date(2024, 2, 2))
+            self.assertEqual(plan.changed_trials, {('run', 6.3), ('jump', None)})
+            self.assertEqual(len(plan.stale_unit_ids()), 2)
+
+    def test_changed_trial_replaces_only_its_unit(self):
+        service = _ingest_service()
+        service.ingest_subject(self.path, self.user, date(2024, 1, 1))
+        with user_shard(self.user):
+            before = dict(ExerciseUnit.objects.filter(session__date=date(2024, 1, 1)).values_list('session__exercise', 'id'))
+        _change_first_value(os.path.join(self.path, 'day_1', 'Subj04_run_63_ikAngAve_l.txt'))
+
+        self.assertEqual(service.ingest_subject(self.path, self.user).units, 1)
+        with user_shard(self.user):
+            after = dict(ExerciseUnit.objects.filter(session__date=date(2024, 1, 1)).values_list('session__exercise', 'id'))
+            self.assertEqual(ExerciseUnit.objects.count(), 4)
+        self.assertEqual(after['jump'], before['jump'])
+        self.assertNotEqual(after['run'], before['run'])
+
+
+class CopyExerciseSessionsMigrationTests(TransactionTestCase):
+    before = [('core', '0014_exercisesession')]
+    after = [('core', '0015_copy_exercise_sessions')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+        apps = self.executor.loader.project_state(self.before).apps
+        ExerciseUnit = apps.get_model('core', 'ExerciseUnit')
+        user = apps.get_model('core', 'UserProfile').objects.create(name='migrated')
+        day = date(2024, 1, 1)
+        self.run = apps.get_model('core', 'Run').objects.create(id=7, user_id=user.id, date=day)
+        # Jump 7 collides with the run and is renumbered, jump 9 keeps its id
+        self.jumps = [apps.get_model('core', 'Jump').objects.create(id=pk, user_id=user.id, date=day) for pk in (7, 9)]
+        self.run_unit = ExerciseUnit.objects.create(run_id=7, speed=3.0)
+        self.jump_units = [ExerciseUnit.objects.create(jump_id=jump.id) for jump in self.jumps]
+        self.orphan = ExerciseUnit.objects.create()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_forward_and_reverse(self):
+        with self.assertLogs('core.migrations', level='WARNING') as logs:
+            self.executor.migrate(self.after)
+        self.assertTrue(any('exercise_sessions_renumbered' in line for line in logs.output))
+        self.assertTrue(any('exercise_units_without_exercise_deleted' in line for line in logs.output))
+
+        self.executor.loader.build_graph()
+        apps = self.executor.loader.project_state(self.after).apps
+        ExerciseSession = apps.get_model('core', 'ExerciseSession')
+        units = apps.get_model('core', 'ExerciseUnit').objects
+        self.assertEqual(ExerciseSession.objects.get(id=7).exercise, 'run')
+        self.assertEqual(ExerciseSession.objects.get(id=9).exercise, 'jump')
+        renumbered = ExerciseSession.objects.get(exercise='jump', id__gt=9)
+        self.assertEqual(units.get(id=self.run_unit.id).session_id, 7)
+        self.assertEqual(units.get(id=self.jump_units[0].id).session_id, renumbered.id)
+        self.assertEqual(units.get(id=self.jump_units[1].id).session_id, 9)
+        self.assertFalse(units.filter(id=self.orphan.id).exists())
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.before)
+        apps = self.executor.loader.project_state(self.before).apps
+        units = apps.get_model('core', 'ExerciseUnit').objects
+        # The legacy links were never cleared, so the renumbered jump gets its id back
+        self.assertEqual(units.get(id=self.run_unit.id).run_id, 7)
+        self.assertEqual([units.get(id=unit.id).jump_id for unit in self.jump_units], [7, 9])
+        self.assertEqual(sorted(apps.get_model('core', 'Jump').objects.values_list('id', flat=True)), [7, 9])
+        self.assertFalse(apps.get_model('core', 'ExerciseSession').objects.exists())
+
+
+class PackedDigestMigrationTests(TransactionTestCase):
+    before = [('core', '0021_userprofile_account')]
+    after = [('core', '0022_packed_summary_digests')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+        apps = self.executor.loader.project_state(self.before).apps
+        user = apps.get_model('core', 'UserProfile').objects.create(name='migrated')
+        session = apps.get_model('core', 'ExerciseSession').objects.create(user_id=user.id, exercise='run', date=date(2024, 1, 1))
+        unit = apps.get_model('core', 'ExerciseUnit').objects.create(session_id=session.id)
+        self.values = np.random.default_rng(22).normal(size=100)
+        # Before: every value of the curve in the JSON digest
+        sketch = SummarySketch.from_values(self.values, compression=100)
+        apps.get_model('core', 'ExerciseUnitSummary').objects.create(
+            exercise_unit_id=unit.id, body_part='Hip', side='HipLeftSide', column='flexion_avg',
+            count=sketch.count, mean=sketch.mean, m2=sketch.m2, min=sketch.min, max=sketch.max,
+            digest=sketch.digest.to_dict(),
+        )
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_digests_are_packed_with_exact_quartiles(self):
+        self.executor.migrate(self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        row = apps.get_model('core', 'ExerciseUnitSummary').objects.get()
+        self.assertEqual((row.q1, row.median, row.q3), tuple(np.percentile(self.values, [25, 50, 75])))
+        self.assertLess(len(row.digest), 4 * 2 * UNIT_COMPRESSION)
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+        sketch = ExerciseUnitSummary.objects.get(pk=row.pk).to_sketch()
+        self.assertEqual(sketch.summary(), SummarySketch.from_values(self.values).summary())
+
+
+class SummarySketchTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.chunks = [rng.gamma(2.0, 3.0, size=size) for size in (100, 37, 250, 1, 400)]
+        self.values = np.concatenate(self.chunks)
+
+    def assertMatchesSinglePass(self, merged, values, quantile_tolerance=0.0):
+        single = SummarySketch.from_values(values)
+        self.assertEqual(merged.count, single.count)
+        self.assertAlmostEqual(merged.mean, single.mean, places=10)
+        self.assertAlmostEqual(merged.std, single.std, places=10)
+        self.assertAlmostEqual(merged.std, float(np.std(values)), places=10)
+        self.assertEqual((merged.min, merged.max), (single.min, single.max))
+        quantiles = [0.01, 0.25, 0.5, 0.75, 0.99]
+        np.testing.assert_allclose(
+            merged.quantile(quantiles), np.percentile(values, [q * 100 for q in quantiles]),
+            rtol=0, atol=quantile_tolerance * (values.max() - values.min()),
+        )
+
+    def test_merge_equals_single_pass(self):
+        sketches = [SummarySketch.from_values(chunk) for chunk in self.chunks]
+        self.assertMatchesSinglePass(SummarySketch.merge_all(sketches), self.values, quantile_tolerance=0.01)
+        chained = sketches[0]
+        for sketch in sketches[1:]:
+            chained = chained.merge(sketch)
+        self.assertMatchesSinglePass(chained, self.values, quantile_tolerance=0.01)
+
+    def test_merge_is_exact_below_compression(self):
+        # Every value is its own centroid, so quantiles match np.percentile exactly
+        chunks = [self.chunks[1], self.chunks[3], self.values[:40]]
+        merged = SummarySketch.merge_all(SummarySketch.from_values(chunk) for chunk in chunks)
+        self.assertMatchesSinglePass(merged, np.concatenate(chunks), quantile_tolerance=1e-12)
+
+    def test_merge_all_ignores_order_and_empty_sketches(self):
+        sketches = [SummarySketch.from_values(chunk) for chunk in self.chunks]
+        forward = SummarySketch.merge_all(sketches + [SummarySketch()])
+        backward = SummarySketch.merge_all([SummarySketch.from_values([np.nan])] + sketches[::-1])
+        self.assertEqual(forward.to_dict(), backward.to_dict())
+
+    def test_round_trip_and_nulls(self):
+        values = np.append(self.chunks[0], [np.nan, np.nan])
+        sketch = SummarySketch.from_values(values)
+        self.assertEqual(sketch.count, 100)
+        restored = SummarySketch.from_dict(sketch.to_dict())
+        self.assertEqual(restored.summary(), sketch.summary())
+        stacked = sketches_from_stack(values.reshape(1, -1, 1))[0][0]
+        self.assertEqual(stacked.summary(), sketch.summary())
+
+    def test_packed_digest_keeps_exact_unit_quartiles(self):
+        values = self.chunks[2]
+        stacked = sketches_from_stack(values.reshape(1, -1, 1))[0][0]
+        self.assertLessEqual(len(stacked.digest.means), UNIT_COMPRESSION / 2 + 1)
+        self.assertEqual(stacked.quartiles, tuple(np.percentile(values, [25, 50, 75])))
+        restored = TDigest.from_bytes(stacked.digest.to_bytes(), UNIT_COMPRESSION)
+        np.testing.assert_allclose(restored.means, stacked.digest.means, rtol=1e-6)
+        np.testing.assert_array_equal(restored.weights, stacked.digest.weights)
+        # Once merged the quartiles come from the digests
+        merged = SummarySketch.merge_all([stacked, SummarySketch.from_values(self.chunks[0])])
+        self.assertIsNone(merged.quartiles)
+        self.assertMatchesSinglePass(merged, np.concatenate([values, self.chunks[0]]), quantile_tolerance=0.01)
+
+
+class BatchSummaryTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.data = rng.normal(20.0, 8.0, size=(100, 12))
+        self.data[rng.random(self.data.shape) < 0.1] = np.nan
+
+    def test_batch_matches_per_column_path(self):
+        batch = get_batch_summary(self.data).to_dict()
+        for column in range(self.data.shape[1]):
+            values = self.data[:, column]
+            self.assertEqual(batch[column], _reference_summary(values[~np.isnan(values)]))
+            self.assertEqual(get_summary(values[~np.isnan(values)]), batch[column])
+
+    def test_dict_and_stacked_inputs(self):
+        columns = {f"c{i}": self.data[:, i] for i in range(3)}
+        by_name = get_batch_summary(columns).to_dict()
+        by_position = get_batch_summary(self.data[:, :3]).to_dict()
+        self.assertEqual(list(by_name), ['c0', 'c1', 'c2'])
+        self.assertEqual(list(by_name.values()), list(by_position.values()))
+
+        # (units, phases, columns) reduced over the phases: one summary per unit and column
+        stacked = np.stack([self.data, self.data[::-1] * 2])
+        batch = get_batch_summary(stacked, axis=1)
+        self.assertEqual(batch.mean.shape, (2, 12))
+        np.testing.assert_allclose(batch.mean[1], 2 * get_batch_summary(self.data).mean)
+
+    def test_float32_and_empty_columns(self):
+        data = self.data.copy()
+        data[:, 0] = np.nan
+        exact = get_batch_summary(data)
+        fast = get_batch_summary(data, dtype=np.float32)
+        self.assertEqual(fast.mean.dtype, np.float32)
+        np.testing.assert_allclose(fast.mean[1:], exact.mean[1:], rtol=1e-5)
+        self.assertEqual(exact.count[0], 0)
+        self.assertTrue(all(np.isnan(value) for value in exact.to_dict()[0].values()))
+
+
+class SummaryEquivalenceTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='Summary User')
+        self.trials = [_trial('run', 8.1, 1), _trial('run', 9.9, 2), _trial('jump', None, 3)]
+        # NaN phases are left out of a column's summary
+        self.trials[1].curves[channel_key('knee', 'left_side', 'angle_avg')][[3, 50]] = np.nan
+        self.storages = ['curves', 'both', 'tables']
+        self.units = [
+            _write(self.user, date(2024, 1, 1 + i), storage, [trial])[0]
+            for i, (storage, trial) in enumerate(zip(self.storages, self.trials))
+        ]
+
+    def expected(self):
+        """Per unit and body part, get_summary of every stored column as before the batched engine."""
+        expected = []
+        for storage, trial in zip(self.storages, self.trials):
+            for body_part, cols in BODY_PARTS_TO_COLS.items():
+                name = next(name for name, (parent, _, _) in CURVE_BODY_PARTS.items() if parent is body_part)
+                sides = {}
+                for side, side_model in zip(SIDES, CURVE_BODY_PARTS[name][1:]):
+                    summaries = {}
+                    for col in cols:
+                        key = channel_key(name, side, col)
+                        if storage == 'tables' and key in TORQUE_CHANNELS:
+                            continue
+                        values = trial.curves[key].astype(np.float64)
+                        summaries[col] = _reference_summary(values[~np.isnan(values)])
+                    sides[side_model.__name__] = summaries
+                expected.append({body_part.__name__: sides})
+        return expected
+
+    def test_matches_per_unit_get_summary(self):
+        expected = self.expected()
+        # Torque columns are covered wherever packed curves are stored
+        self.assertIn('moment_avg', expected[1]['Knee']['KneeLeftSide'])
+        self.assertNotIn('moment_avg', expected[9]['Knee']['KneeLeftSide'])
+        with user_shard(self.user):
+            # From the materialised summaries, then from the raw curves
+            self.assertTrue(ExerciseUnitSummary.objects.filter(exercise_unit__in=self.units).exists())
+            self.assertEqual(ExerciseSummaryService(self.units).run(), expected)
+            ExerciseUnitSummary.objects.filter(exercise_unit__in=self.units).delete()
+            self.assertEqual(ExerciseSummaryService(self.units).run(), expected)
+
+
+class TorqueChannelTests(TestCase):
+    databases = '__all__'
+    joints = ('hip_flexion', 'hip_adduction', 'hip_rotation', 'knee_angle', 'ankle_angle', 'subtalar_angle')
+    # Joint moments put the side before "_moment"; pelvis moments have no side and are not loaded
+    columns = ['gaitPhase', 'pelvis_tilt_moment'] + [f"{joint}_{side}_moment" for joint in joints for side in ('r', 'l')]
+
+    def setUp(self):
+        self.day = os.path.join(_temp_dir(self), 'day_1')
+        os.makedirs(self.day)
+        phases = np.arange(1, 101)
+        self.values = {}
+        for mode in ('Ave', 'Std'):
+            table = np.column_stack([phases] + [
+                np.round(np.abs(np.sin(phases / 10 + i)) * (i + 1), 2) for i in range(len(self.columns) - 1)
+            ])
+            self.values[mode] = table
+            with open(os.path.join(self.day, f"Subj01_run_63_idTrq{mode}_l.txt"), 'w') as file:
+                file.write('\t'.join(self.columns) + '\n')
+                file.writelines('\t'.join(f"{value:.2f}" for value in row) + '\n' for row in table)
+
+    def column(self, mode, name):
+        return self.values[mode][:, self.columns.index(name)].astype(np.float32)
+
+    def write(self, storage):
+        user = UserProfile.objects.create(name=f'Torque {storage}')
+        parsed = parse_session(DirectorySession(1, self.day))
+        SessionWriter(storage=storage).write(user, date(2024, 1, 1), parsed)
+        with user_shard(user):
+            units = list(ExerciseUnit.objects.filter(session__user=user))
+            return ExerciseSummaryService(units).run()
+
+    def test_moment_columns_map_to_their_side(self):
+        channels = trial_channels('idTrq', 'Ave', 'l', self.columns)
+        self.assertEqual(channels, {
+            channel_key('hip', 'left_side', 'flexion_moment_avg'): self.columns.index('hip_flexion_l_moment'),
+            channel_key('hip', 'left_side', 'adduction_moment_avg'): self.columns.index('hip_adduction_l_moment'),
+            channel_key('hip', 'left_side', 'rotation_moment_avg'): self.columns.index('hip_rotation_l_moment'),
+            channel_key('knee', 'left_side', 'moment_avg'): self.columns.index('knee_angle_l_moment'),
+            channel_key('ankle', 'left_side', 'moment_avg'): self.columns.index('ankle_angle_l_moment'),
+            channel_key('ankle', 'left_side', 'subtalar_moment_avg'): self.columns.index('subtalar_angle_l_moment'),
+        })
+        self.assertEqual(
+            set(trial_channels('idTrq', 'Std', 'r', self.columns)),
+            {key for key in TORQUE_CHANNELS if '.right_side.' in key and key.endswith('_std')},
+        )
+        self.assertEqual(missing_file_columns('idTrq', self.columns), [])
+        summarised = {f"{body_part.__name__.lower()}.{col}" for body_part, cols in BODY_PARTS_TO_COLS.items() for col in cols}
+        self.assertLessEqual({key.replace('.left_side', '').replace('.right_side', '') for key in TORQUE_CHANNELS}, summarised)
+        self.assertEqual(missing_file_columns('idTrq', [c for c in self.columns if not c.startswith('knee')]), ['knee_angle_moment'])
+
+    def test_parsed_torque_curves_reach_the_summaries(self):
+        (trial,) = parse_session(DirectorySession(1, self.day)).trials
+        self.assertEqual((trial.exercise, trial.speed), ('run', 6.3))
+        self.assertEqual(set(trial.curves), {key for key in TORQUE_CHANNELS if 'left_side' in key})
+        np.testing.assert_array_equal(trial.curves[channel_key('knee', 'left_side', 'moment_avg')], self.column('Ave', 'knee_angle_l_moment'))
+        np.testing.assert_array_equal(trial.curves[channel_key('ankle', 'left_side', 'subtalar_moment_std')], self.column('Std', 'subtalar_angle_l_moment'))
+
+        summaries = {body_part: sides for summary in self.write('curves') for body_part, sides in summary.items()}
+        self.assertEqual(
+            summaries['Knee']['KneeLeftSide']['moment_avg'],
+            _reference_summary(self.column('Ave', 'knee_angle_l_moment').astype(np.float64)),
+        )
+        self.assertEqual(
+            set(summaries['Hip']['HipLeftSide']),
+            {f"{column}_moment_{statistic}" for column in ('flexion', 'adduction', 'rotation') for statistic in ('avg', 'std')},
+        )
+
+    def test_tables_storage_warns_and_drops_torque(self):
+        with self.assertLogs('services.ingest.ingest_service', level='WARNING') as logs:
+            summaries = self.write('tables')
+        self.assertIn('torque_channels_not_stored', logs.output[0])
+        self.assertEqual(
+            [column for summary in summaries for sides in summary.values() for columns in sides.values() for column in columns],
+            [],
+        )
+
+
+class TrialFileTests(SimpleTestCase):
+    source = os.path.join(DATASET, 'day_1', 'Subj04_jump_idTrqAve_l.txt')
+
+    def setUp(self):
+        self.path = os.path.join(_temp_dir(self), os.path.basename(self.source))
+        shutil.copy2(self.source, self.path)
+
+    def test_file_names(self):
+        trial_file = parse_trial_filename('day_3/Subj04_run_81_musForStd_r.txt')
+        self.assertEqual((trial_file.exercise, trial_file.speed, trial_file.data_type, trial_file.mode, trial_file.side),
+                         ('run', 8.1, 'musFor', 'Std', 'r'))
+        self.assertEqual(parse_trial_filename(self.path).trial, ('jump', None))
+        self.assertIsNone(parse_trial_filename('Subj04_swim_ikAngAve_l.txt'))
+        self.assertIsNone(parse_trial_filename('notes.txt'))
+
+    def test_values_match_loadtxt(self):
+        table = read_trial_file(self.path)
+        with open(self.path) as file:
+            self.assertEqual(table.columns, file.readline().split())
+        reference = np.loadtxt(self.path, skiprows=1, dtype=np.float32)
+        self.assertEqual(table.values.dtype, np.float32)
+        np.testing.assert_array_equal(table.values, reference)
+        np.testing.assert_array_equal(table.channel('gaitPhase'), reference[:, 0])
+        with open(self.path, 'rb') as file:
+            np.testing.assert_array_equal(read_trial_bytes(file.read()).values, reference)
+
+    def test_malformed_files_name_the_file(self):
+        for body, message in (
+            (b"a\tb\n1\t2\n3\tx\n", "could not convert"),
+            (b"a\tb\n1\t2\n3\n", "3 values do not fill 2 columns"),
+            (b"\n1\t2\n", "no column header"),
+        ):
+            with self.subTest(message=message), self.assertRaisesMessage(ValueError, f"bad.txt: {message}"):
+                read_trial_bytes(body, 'bad.txt')
+        self.assertTrue(np.isnan(read_trial_bytes(b"a\tb\n1\tNaN\n").values[0, 1]))
+
+    def test_parse_cache(self):
+        first = read_trial_file(self.path, cache=True)
+        cache_dir = os.path.join(os.path.dirname(self.path), PARSE_CACHE_DIR)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        with mock.patch('services.ingest.trial_files._parse_values') as parse:
+            cached = read_trial_file(self.path, cache=True)
+            mapped = read_trial_file(self.path, cache=True, mmap=True)
+        parse.assert_not_called()
+        np.testing.assert_array_equal(cached.values, first.values)
+        self.assertIsInstance(mapped.values, np.memmap)
+        self.assertEqual(cached.index, first.index)
+
+        # A changed file (size and mtime) is parsed again and replaces its sidecar
+        with open(self.path) as file:
+            header, *rows = file.readlines()
+        with open(self.path, 'w') as file:
+            file.writelines([header] + rows[:10])
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        changed = read_trial_file(self.path, cache=True)
+        self.assertEqual(changed.values.shape, (10, len(first.columns)))
+        np.testing.assert_array_equal(changed.values, first.values[:10])
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+class ArchiveSourceTests(SimpleTestCase):
+    def setUp(self):
+        self.root = _temp_dir(self)
+        self.subject = _subject(os.path.join(self.root, 'User1'), (1, 2))
+
+    def archive(self, name, source=None):
+        """Pack the subject folder (or one of its days) as root/name."""
+        source = source or self.subject
+        path = os.path.join(self.root, name)
+        if name.endswith('.zip'):
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for folder, _, files in sorted(os.walk(source)):
+                    for file_name in sorted(files):
+                        file_path = os.path.join(folder, file_name)
+                        archive.write(file_path, os.path.relpath(file_path, source))
+        else:
+            with tarfile.open(path, 'w:gz' if name.endswith('.tar.gz') else 'w') as archive:
+                for file_name in sorted(os.listdir(source)):
+                    archive.add(os.path.join(source, file_name), file_name)
+        return path
+
+    def assertSameSessions(self, sessions, expected):
+        self.assertEqual([session.day for session in sessions], [session.day for session in expected])
+        for session, reference in zip(sessions, expected):
+            self.assertEqual(session.file_names(), reference.file_names())
+            for name in session.file_names():
+                self.assertEqual(session.digest(name), reference.digest(name))
+                self.assertEqual(session.stat(name)[0], reference.stat(name)[0])
+            parsed, reference_parsed = parse_session(session), parse_session(reference)
+            self.assertEqual(len(parsed.trials), len(reference_parsed.trials))
+            for trial, reference_trial in zip(parsed.trials, reference_parsed.trials):
+                self.assertEqual(trial.curves.keys(), reference_trial.curves.keys())
+                for key, curve in reference_trial.curves.items():
+                    np.testing.assert_array_equal(trial.curves[key], curve)
+
+    def test_subject_archives(self):
+        expected = list(find_sessions(self.subject))
+        self.assertEqual([session.day for session in expected], [1, 2])
+        for name in ('User1.zip', 'User1.tar', 'User1.tar.gz'):
+            with self.subTest(archive=name):
+                sessions = list(find_sessions(self.archive(name)))
+                self.assertSameSessions(sessions, expected)
+                # Sessions only carry member positions unless the tar is compressed
+                members = [member for session in sessions for member in session.members.values()]
+                self.assertEqual(any(member.data is not None for member in members), name.endswith('.gz'))
+                # and survive the trip to a parser process
+                self.assertSameSessions([pickle.loads(pickle.dumps(session)) for session in sessions], expected)
+
+    def test_day_archives_and_cohort_root(self):
+        expected = list(find_sessions(self.subject))
+        day_folder = os.path.join(self.root, 'User2')
+        os.makedirs(day_folder)
+        for day in (1, 2):
+            archive = self.archive(f"day_{day}.zip", os.path.join(self.subject, f"day_{day}"))
+            shutil.move(archive, day_folder)
+        self.assertSameSessions(list(find_sessions(day_folder)), expected)
+
+        self.archive('User3.tar.gz')
+        self.assertEqual(
+            [(name, os.path.basename(path)) for name, path in find_subjects(self.root)],
+            [('User1', 'User1'), ('User2', 'User2'), ('User3', 'User3.tar.gz')],
+        )
+
+    def test_interleaved_days_are_rejected(self):
+        path = os.path.join(self.root, 'mixed.zip')
+        names = sorted(os.listdir(os.path.join(self.subject, 'day_1')))
+        with zipfile.ZipFile(path, 'w') as archive:
+            for day, name in ((1, names[0]), (2, names[0]), (1, names[1])):
+                archive.write(os.path.join(self.subject, f"day_{day}", name), f"day_{day}/{name}")
+        with self.assertRaisesMessage(ValueError, 'files of day_1 are not stored contiguously'):
+            list(find_sessions(path))
+
+
+class TrialValidationTests(TestCase):
+    databases = '__all__'
+    run_file = 'Subj04_run_63_ikAngAve_l.txt'
+
+    def setUp(self):
+        self.path = _subject(_temp_dir(self), (1,))
+        self.day = os.path.join(self.path, 'day_1')
+        self.user = UserProfile.objects.create(name='Validation User')
+
+    def report(self, edit):
+        _rewrite_trial_file(os.path.join(self.day, self.run_file), edit)
+        trial_file = parse_trial_filename(self.run_file)
+        return validate_trial_file(trial_file, read_trial_file(os.path.join(self.day, self.run_file)))
+
+    def test_clean_file(self):
+        self.assertEqual(self.report(lambda rows: None).errors, [])
+
+    def test_file_errors(self):
+        def set_cell(row, column, value):
+            return lambda rows: rows[row].__setitem__(column, value)
+
+        cases = [
+            (set_cell(5, 1, 'NaN'), '1 NaN values'),
+            (set_cell(5, 1, 'inf'), '1 infinite values'),
+            (set_cell(5, 1, '540.0'), '1 values out of range'),
+            (lambda rows: rows.pop(), 'expected 100 phase rows, found 99'),
+            (lambda rows: [row.pop(1) for row in rows], 'missing channels: pelvis_tilt'),
+        ]
+        for edit, error in cases:
+            with self.subTest(error=error):
+                shutil.copy2(os.path.join(DATASET, 'day_1', self.run_file), self.day)
+                self.assertIn(error, self.report(edit).errors)
+
+    def test_rejected_trials_are_quarantined(self):
+        service = _ingest_service()
+        service.ingest_subject(self.path, self.user, date(2024, 1, 1))
+        with user_shard(self.user):
+            run_unit = ExerciseUnit.objects.get(session__exercise='run')
+            curves = load_curves([run_unit])[run_unit.id].as_dict()
+
+        # An unreadable new version is not written; the previous unit stays
+        _rewrite_trial_file(os.path.join(self.day, self.run_file), lambda rows: rows[3].__setitem__(2, 'x'))
+        parsed = parse_session(DirectorySession(1, self.day))
+        self.assertEqual(list(parsed.report.rejected_trials), [('run', 6.3)])
+        self.assertEqual([trial.exercise for trial in parsed.trials], ['jump'])
+        self.assertEqual(service.ingest_subject(self.path, self.user).units, 0)
+        with user_shard(self.user):
+            self.assertEqual(list(ExerciseUnit.objects.filter(session__exercise='run')), [run_unit])
+            self.assertEqual(load_curves([run_unit])[run_unit.id].as_dict().keys(), curves.keys())
+            quarantined = IngestedTrialFile.objects.get(name=self.run_file)
+            self.assertEqual(quarantined.exercise_unit_id, run_unit.id)
+            self.assertTrue(quarantined.errors[0].startswith('unreadable:'))
+            # Still bad: the quarantined file is not retried
+            self.assertIsNone(IngestManifest(self.user).plan(DirectorySession(1, self.day), date(2024, 1, 1)))
+
+        # Fixed: the trial is retried and replaces its unit
+        shutil.copy2(os.path.join(DATASET, 'day_1', self.run_file), self.day)
+        _change_first_value(os.path.join(self.day, self.run_file))
+        self.assertEqual(service.ingest_subject(self.path, self.user).units, 1)
+        with user_shard(self.user):
+            self.assertFalse(ExerciseUnit.objects.filter(pk=run_unit.pk).exists())
+            self.assertEqual(IngestedTrialFile.objects.get(name=self.run_file).errors, [])
+
+
+class LiveSessionWelfordTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = UserProfile.objects.create(name='Welford User')
+        self.channels = LIVE_CHANNELS[:3]
+        self.service = LiveSessionService(SessionWriter(storage='curves'))
+        self.cycles = np.random.default_rng(12).normal(10.0, 4.0, size=(37, len(self.channels), 100))
+
+    def test_running_curves_match_the_offline_summary(self):
+        session = self.service.start(self.user, 'run', date(2024, 1, 1), self.channels)
+        for batch in np.array_split(self.cycles, [1, 2, 10, 25]):
+            session = self.service.add_cycles(session.id, [
+                {channel: values.tolist() for channel, values in zip(self.channels, cycle)} for cycle in batch
+            ])
+        self.assertEqual(session.cycle_count, len(self.cycles))
+
+        mean, std = self.cycles.mean(axis=0), self.cycles.std(axis=0, ddof=1)
+        curves = self.service.curves(session)
+        for i, channel in enumerate(self.channels):
+            np.testing.assert_allclose(curves[f"{channel}_avg"], mean[i], rtol=1e-12)
+            np.testing.assert_allclose(curves[f"{channel}_std"], std[i], rtol=1e-12)
+
+        summary = self.service.summary(session, percision=10)
+        expected = get_batch_summary(mean.T, columns=self.channels).to_dict(10)
+        self.assertEqual(summary.keys(), expected.keys())
+        for channel in self.channels:
+            for key, value in expected[channel].items():
+                self.assertAlmostEqual(summary[channel][key], value, places=8, msg=f"{channel} {key}")
+
+        unit = self.service.close_unit(session.id, finish=True)
+        with user_shard(self.user):
+            stored = load_curves([unit])[unit.id].as_dict()
+        for i, channel in enumerate(self.channels):
+            np.testing.assert_allclose(stored[f"{channel}_avg"], mean[i].astype(np.float32), rtol=1e-6)
+            np.testing.assert_allclose(stored[f"{channel}_std"], std[i].astype(np.float32), rtol=1e-6)
+
+
+class NormalizeCyclesTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(13)
+        self.signals = np.cumsum(rng.normal(size=(500, 3)), axis=0)
+        self.heel_strikes = [0, 1, 47, 96, 150, 151, 203, 260, 311, 380, 440, 499]
+
+    def test_matches_per_cycle_interpolation(self):
+        for phase_count in (2, 51, 100):
+            for min_samples in (2, 3):
+                with self.subTest(phase_count=phase_count, min_samples=min_samples):
+                    cycles = normalize_cycles(self.signals, self.heel_strikes, phase_count, min_samples)
+                    expected = _reference_cycles(self.signals, self.heel_strikes, phase_count, min_samples)
+                    self.assertEqual(cycles.shape, expected.shape)
+                    np.testing.assert_allclose(cycles, expected, rtol=1e-12, atol=1e-12)
+                    # Phase 0 and the last phase are the heel strikes themselves
+                    kept = [start for start, end in zip(self.heel_strikes, self.heel_strikes[1:]) if end - start + 1 >= min_samples]
+                    np.testing.assert_array_equal(cycles[:, :, 0], self.signals[kept])
+
+    def test_single_channel_and_no_cycles(self):
+        cycles = normalize_cycles(self.signals[:, 0], self.heel_strikes)
+        np.testing.assert_allclose(cycles, _reference_cycles(self.signals[:, :1], self.heel_strikes, 100), rtol=1e-12)
+        self.assertEqual(normalize_cycles(self.signals, [10]).shape, (0, 3, 100))
+
+    def test_rejects_bad_heel_strikes(self):
+        for heel_strikes in ([5, 5, 20], [20, 10], [-1, 10], [10, 500]):
+            with self.subTest(heel_strikes=heel_strikes), self.assertRaises(ValueError):
+                normalize_cycles(self.signals, heel_strikes)
+
+
+class CohortIngestTests(TransactionTestCase):
+    databases = '__all__'
+
+    def cohort(self, *names):
+        root = _temp_dir(self)
+        for name in names:
+            _subject(os.path.join(root, name), [1], trials=('run_63',))
+        return root
+
+    def ingest(self, root, subject_workers):
+        service = CohortIngestService(SessionWriter(storage='curves'), subject_workers=subject_workers)
+        if connection.vendor == 'sqlite' and subject_workers > 1:
+            # Still runs in the worker pool, one subject at a time
+            with self.assertLogs('services.ingest.ingest_service', level='WARNING') as logs:
+                results = service.ingest_cohort(root, date(2024, 1, 1))
+            self.assertIn('cohort_ingest_serialised', logs.output[0])
+        else:
+            results = service.ingest_cohort(root, date(2024, 1, 1))
+        return {result.subject: result for result in results}
+
+    def units(self, name):
+        user = UserProfile.objects.get(name=name)
+        with user_shard(user):
+            return ExerciseUnit.objects.filter(session__user=user).count()
+
+    def test_serial_and_threaded(self):
+        for subject_workers in (1, 3):
+            with self.subTest(subject_workers=subject_workers):
+                names = [f"{name}{subject_workers}" for name in ('Anna', 'Ben', 'Cleo')]
+                root = self.cohort(*names)
+                results = self.ingest(root, subject_workers)
+                self.assertEqual(sorted(results), names)
+                for name, result in results.items():
+                    self.assertIsNone(result.error)
+                    self.assertEqual(result.user_id, UserProfile.objects.get(name=name).id)
+                    self.assertEqual(result.stats.units, 1)
+                    self.assertEqual(self.units(name), 1)
+
+                # Profiles are created once; a re-run finds every session already ingested
+                rerun = self.ingest(root, subject_workers)
+                self.assertEqual([result.stats.units for result in rerun.values()], [0, 0, 0])
+                self.assertEqual(UserProfile.objects.filter(name__in=names).count(), 3)
+                self.assertEqual([self.units(name) for name in names], [1, 1, 1])
+
+    def test_ambiguous_subjects_fail(self):
+        root = self.cohort('Anna', 'Ben', 'Cleo')
+        UserProfile.objects.create(name='Ben')
+        UserProfile.objects.create(name='Ben')
+        with tarfile.open(os.path.join(root, 'Cleo.tar.gz'), 'w:gz') as archive:
+            archive.add(os.path.join(root, 'Cleo', 'day_1'), arcname='day_1')
+
+        with self.assertLogs('services.ingest.ingest_service', level='ERROR') as logs:
+            results = self.ingest(root, 1)
+        self.assertEqual(sum('subject_ambiguous' in line for line in logs.output), 2)
+        self.assertIsNone(results['Anna'].error)
+        self.assertEqual(self.units('Anna'), 1)
+        self.assertIn("2 user profiles are named 'Ben'", results['Ben'].error)
+        self.assertIn("2 subjects are named 'Cleo'", results['Cleo'].error)
+        self.assertFalse(UserProfile.objects.filter(name='Cleo').exists())
+        self.assertEqual(UserProfile.objects.filter(name='Ben').count(), 2)
+
+
+class ParquetRoundTripTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.source = UserProfile.objects.create(name='Export User')
+        self.target = UserProfile.objects.create(name='Import User')
+        _write_history(self.source)
+        _write(self.source, date(2024, 1, 5), 'curves', [_trial('walk', 4.2, 4)])
+        self.path = os.path.join(_temp_dir(self), 'history.parquet')
+
+    def table(self, user):
+        sink = io.BytesIO()
+        ParquetExportService().write(user, sink)
+        # Ids are the importing user's own
+        return pq.read_table(io.BytesIO(sink.getvalue())).drop(['user_id', 'exercise_id', 'exercise_unit_id'])
+
+    def test_export_import_round_trip(self):
+        self.assertEqual(ParquetExportService().write(self.source, self.path), 400)
+        streamed = b''.join(ParquetExportService(batch_size=1).stream(self.source))
+        self.assertTrue(pq.read_table(io.BytesIO(streamed)).equals(pq.read_table(self.path)))
+
+        stats = _ingest_service().ingest_columnar(self.path, self.target)
+        self.assertEqual(stats.units, 4)
+        self.assertTrue(self.table(self.target).equals(self.table(self.source)))
+        with user_shard(self.target):
+            self.assertEqual(
+                sorted(ExerciseSession.objects.filter(user=self.target).values_list('date', 'exercise')),
+                [(date(2024, 1, 1), 'run'), (date(2024, 1, 2), 'jump'), (date(2024, 1, 2), 'run'), (date(2024, 1, 5), 'walk')],
+            )
+            self.assertIsNone(ExerciseUnit.objects.get(session__user=self.target, session__exercise='jump').speed)
+
+    def test_units_without_curves_export_no_rows(self):
+        expected = self.table(self.source)
+        with user_shard(self.source):
+            session = ExerciseSession.objects.get(user=self.source, exercise='walk')
+            ExerciseUnit.objects.create(session=session, speed=4.0)
+            # Phase rows but no side table values
+            GaitPhase.objects.create(exercise_unit=ExerciseUnit.objects.create(session=session), phase=0)
+        self.assertEqual(len(user_units(self.source)), 6)
+        self.assertTrue(self.table(self.source).equals(expected))
+
+    def test_reimport_is_a_no_op(self):
+        ParquetExportService().write(self.source, self.path)
+        service = _ingest_service()
+        service.ingest_columnar(self.path, self.target)
+        units = user_units(self.target)
+
+        self.assertEqual(service.ingest_columnar(self.path, self.target).units, 0)
+        self.assertEqual(user_units(self.target), units)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from core import views
+
+urlpatterns = [
+    path('live-sessions/', views.LiveSessionCreateView.as_view(), name='live-session-create'),
+    path('live-sessions/<int:pk>/', views.LiveSessionDetailView.as_view(), name='live-session-detail'),
+    path('live-sessions/<int:pk>/cycles/', views.LiveSessionCyclesView.as_view(), name='live-session-cycles'),
+    path('live-sessions/<int:pk>/close/', views.LiveSessionCloseView.as_view(), name='live-session-close'),
+    path('users/<int:pk>/export.parquet', views.UserParquetExportView.as_view(), name='user-export-parquet'),
+]
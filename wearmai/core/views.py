@@ -1,3 +1,104 @@
-from django.shortcuts import render
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from core.models import LiveSession, UserProfile
+from core.permissions import IsProfileOwner
+from core.serializers import LiveCloseSerializer, LiveCyclesSerializer, LiveSessionSerializer
+from core.sharding import id_shard
+from services.export.parquet_export import ParquetExportService
+from services.ingest.live_session import LiveSessionService
+
+
+def get_live_session(view, request, pk):
+    """The live session with this id, from the shard its id belongs to, if the request may use it."""
+    try:
+        alias = id_shard(pk)
+    except ValueError:
+        raise Http404
+    session = get_object_or_404(LiveSession.objects.using(alias), pk=pk)
+    view.check_object_permissions(request, session)
+    return session
+
+
+class LiveSessionCreateView(APIView):
+    """Start a live session; cycles are then posted to its cycles endpoint."""
+    permission_classes = [IsAuthenticated, IsProfileOwner]
+
+    def post(self, request):
+        serializer = LiveSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        self.check_object_permissions(request, data['user'])
+        try:
+            session = LiveSessionService().start(
+                user=data['user'],
+                exercise=data['exercise'],
+                session_date=data['date'],
+                channels=data['channels'],
+                speed=data.get('speed'),
+                phase_count=data.get('phase_count', 100),
+            )
+        except ValueError as e:
+            raise ValidationError({'channels': str(e)})
+        return Response(LiveSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class LiveSessionDetailView(APIView):
+    """Live state and summary of the open unit."""
+    permission_classes = [IsAuthenticated, IsProfileOwner]
+
+    def get(self, request, pk):
+        return Response(LiveSessionSerializer(get_live_session(self, request, pk)).data)
+
+
+class LiveSessionCyclesView(APIView):
+    """Fold a batch of gait cycles (phase-normalised, or raw with heel strikes) into the open unit."""
+    permission_classes = [IsAuthenticated, IsProfileOwner]
+
+    def post(self, request, pk):
+        get_live_session(self, request, pk)
+        serializer = LiveCyclesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            if 'cycles' in data:
+                session = LiveSessionService().add_cycles(pk, data['cycles'])
+            else:
+                session = LiveSessionService().add_samples(pk, data['samples'], data['heel_strikes'])
+        except ValueError as e:
+            raise ValidationError({'cycles' if 'cycles' in data else 'samples': str(e)})
+        return Response({'id': session.id, 'cycle_count': session.cycle_count})
+
+
+class LiveSessionCloseView(APIView):
+    """Close the open kilometre/trial into an ExerciseUnit, optionally ending the session."""
+    permission_classes = [IsAuthenticated, IsProfileOwner]
+
+    def post(self, request, pk):
+        get_live_session(self, request, pk)
+        serializer = LiveCloseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            kwargs = {'next_speed': data['speed']} if 'speed' in data else {}
+            unit = LiveSessionService().close_unit(pk, finish=data['finish'], **kwargs)
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+        return Response({'exercise_unit_id': unit.id if unit else None}, status=status.HTTP_200_OK)
+
+
+class UserParquetExportView(APIView):
+    """A user's full gait-curve history as a Parquet file, streamed as it is written."""
+    permission_classes = [IsAuthenticated, IsProfileOwner]
+
+    def get(self, request, pk):
+        user = get_object_or_404(UserProfile, pk=pk)
+        self.check_object_permissions(request, user)
+        response = StreamingHttpResponse(ParquetExportService().stream(user), content_type='application/vnd.apache.parquet')
+        response['Content-Disposition'] = f'attachment; filename="user_{user.id}.parquet"'
+        return response
@@ -1,26 +1,14 @@
 import pandas as pd
-import os
 
+from services.ingest.trial_files import read_trial_file
 
 
-def txt_to_df(filepath):
+def txt_to_df(filepath, cache=False):
     """
     This function reads a text file and converts it to a pandas dataframe.
     :param filepath: The path to the text file.
-    :return: A pandas dataframe.
+    :param cache: Reuse/keep the .npy parse cache of the file (see read_trial_file).
+    :return: A pandas dataframe of float32 columns.
     """
-    # Read the text file
-    with open(filepath, 'r') as file:
-        data = file.read()
-
-    # Split the text file into a list of lines
-    lines = data.split('\n')
-
-    # Split the lines into a list of lists
-    data = [line.split() for line in lines]
-
-    # Convert the list of lists to a pandas dataframe
-    df = pd.DataFrame(data[1:], columns=data[0])
-
-    return df
-
+    table = read_trial_file(filepath, cache=cache)
+    return pd.DataFrame(table.values, columns=table.columns)
@@ -0,0 +1,199 @@
+import os
+import secrets
+from datetime import date, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, QuerySet
+from django.utils import timezone
+
+from core.archive import BundleWriter, archive_path, rehydrate_curves
+from core.curves import gait_phase_curves, load_curves
+from core.models import (
+    ArchivedUnitCurves, ExerciseArchive, ExerciseUnit, ExerciseUnitCurves, ExerciseUnitSummary, GaitPhase, UserProfile,
+)
+from core.sharding import user_shard
+from services.exercise_summarisation.summary_store import rebuild_unit_summaries
+from services.purge.purge_service import BulkPurgeService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+def _bundle_path(user_id: int) -> str:
+    """A new bundle's path, relative to settings.EXERCISE_ARCHIVE_DIR."""
+    return os.path.join(f"user_{user_id}", f"{timezone.now():%Y%m%dT%H%M%S}_{secrets.token_hex(4)}.zst")
+
+
+class ExerciseArchiveService():
+    """
+    Moves the curves of old units to the cold tier (see core.archive) and back;
+    each archive_user() call writes one new bundle for that user. Archived units
+    keep their summaries, so summary reads never touch the bundles; raw curves
+    are rehydrated by load_curves.
+
+    Purging an archived unit (e.g. a re-ingest replacing it) deletes its stub but
+    leaves its frame in the bundle; compact_user() drops bundles without live
+    stubs and rewrites the ones that lost some, and runs before every archive_user().
+    """
+
+    def __init__(self, older_than_days: Optional[int] = None, level: Optional[int] = None, batch_size: int = 200):
+        self.older_than_days = settings.EXERCISE_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        self.level = settings.EXERCISE_ARCHIVE_ZSTD_LEVEL if level is None else level
+        self.batch_size = batch_size
+
+    def archivable_units(self, user: UserProfile, today: Optional[date] = None) -> QuerySet:
+        """Units of the user's sessions older than the cutoff that are not archived yet."""
+        cutoff = (today or date.today()) - timedelta(days=self.older_than_days)
+        return ExerciseUnit.objects.filter(
+            session__user=user, session__date__lt=cutoff, archived_curves__isnull=True,
+        ).order_by('id')
+
+    def archive_user(self, user: UserProfile, today: Optional[date] = None) -> Optional[ExerciseArchive]:
+        """
+        Archive the user's old units into a new bundle.
+        :return: The bundle, or None if no unit was due.
+        """
+        self.compact_user(user)
+        with user_shard(user) as alias:
+            unit_ids = list(self.archivable_units(user, today).values_list('id', flat=True))
+            if not unit_ids:
+                return None
+
+            # The summaries stay behind as the units' precomputed statistics
+            summarised = set(
+                ExerciseUnitSummary.objects.filter(exercise_unit__in=unit_ids).values_list('exercise_unit_id', flat=True)
+            )
+            unsummarised = [unit_id for unit_id in unit_ids if unit_id not in summarised]
+            if unsummarised:
+                rebuild_unit_summaries(unsummarised)
+
+            relative_path = _bundle_path(user.id)
+            writer = BundleWriter(relative_path, self.level)
+            try:
+                stubs = []
+                for start in range(0, len(unit_ids), self.batch_size):
+                    batch = list(ExerciseUnit.objects.filter(id__in=unit_ids[start:start + self.batch_size]).order_by('id'))
+                    stored = load_curves(batch)
+                    # Units only stored as GaitPhase rows
+                    tables = gait_phase_curves([unit.id for unit in batch if unit.id not in stored])
+                    for unit in batch:
+                        curves = stored.get(unit.id)
+                        if curves is None:
+                            curves = ExerciseUnitCurves.pack(unit, tables.get(unit.id, {}))
+                        offset, length = writer.add(curves.as_array())
+                        stubs.append(ArchivedUnitCurves(
+                            exercise_unit_id=unit.id,
+                            offset=offset,
+                            length=length,
+                            channels=curves.channels,
+                            phase_count=curves.phase_count,
+                        ))
+                writer.close()
+
+                with transaction.atomic(using=alias):
+                    archive = ExerciseArchive.objects.create(
+                        user=user, path=relative_path, unit_count=len(stubs), size=writer.size,
+                    )
+                    for stub in stubs:
+                        stub.archive = archive
+                    ArchivedUnitCurves.objects.bulk_create(stubs, batch_size=1000)
+                    BulkPurgeService().purge(
+                        GaitPhase.objects.filter(exercise_unit__in=unit_ids),
+                        ExerciseUnitCurves.objects.filter(exercise_unit__in=unit_ids),
+                    )
+            except BaseException:
+                writer.discard()
+                raise
+
+        log.info("exercise_units_archived", user_id=user.id, units=len(stubs), bytes=writer.size, path=relative_path)
+        return archive
+
+    def compact_user(self, user: UserProfile) -> int:
+        """
+        Reclaim the frames of purged units: delete the user's bundles without live stubs,
+        and copy the live frames of the others that lost units into new, smaller bundles.
+        :return: Number of bytes reclaimed.
+        """
+        with user_shard(user) as alias:
+            archives = list(
+                ExerciseArchive.objects.filter(user=user)
+                .annotate(live=Count('units'))
+                .filter(live__lt=F('unit_count'))
+                .order_by('id')
+            )
+            if not archives:
+                return 0
+
+            old_paths = [archive.path for archive in archives]
+            reclaimed = 0
+            writers = []
+            try:
+                with transaction.atomic(using=alias):
+                    for archive in archives:
+                        reclaimed += archive.size
+                        if not archive.live:
+                            archive.delete()
+                            continue
+                        writers.append(self._rewrite(archive))
+                        reclaimed -= archive.size
+            except BaseException:
+                for writer in writers:
+                    writer.discard()
+                raise
+
+            def remove_bundles():
+                for path in old_paths:
+                    if os.path.exists(archive_path(path)):
+                        os.remove(archive_path(path))
+
+            transaction.on_commit(remove_bundles, using=alias)
+
+        log.info("exercise_archives_compacted", user_id=user.id, bundles=len(archives), bytes=reclaimed)
+        return reclaimed
+
+    def _rewrite(self, archive: ExerciseArchive) -> BundleWriter:
+        """Copy the live frames of a bundle into a new one and point its stubs and row there."""
+        stubs = list(archive.units.order_by('offset'))
+        old_path, archive.path = archive.path, _bundle_path(archive.user_id)
+        writer = BundleWriter(archive.path)
+        try:
+            with open(archive_path(old_path), 'rb') as f:
+                for stub in stubs:
+                    f.seek(stub.offset)
+                    stub.offset, _ = writer.add_frame(f.read(stub.length))
+            writer.close()
+        except BaseException:
+            writer.discard()
+            raise
+        ArchivedUnitCurves.objects.bulk_update(stubs, ['offset'], batch_size=1000)
+        archive.unit_count = len(stubs)
+        archive.size = writer.size
+        archive.save(update_fields=['path', 'unit_count', 'size'])
+        return writer
+
+    def restore_user(self, user: UserProfile) -> int:
+        """
+        Bring every archived unit of the user back as ExerciseUnitCurves and drop the bundles.
+        Units archived from GaitPhase rows come back as packed curves only.
+        :return: Number of units restored.
+        """
+        with user_shard(user) as alias:
+            archives = list(ExerciseArchive.objects.filter(user=user))
+            unit_ids = list(ArchivedUnitCurves.objects.filter(archive__in=archives).values_list('exercise_unit_id', flat=True))
+            with transaction.atomic(using=alias):
+                for start in range(0, len(unit_ids), self.batch_size):
+                    restored = rehydrate_curves(unit_ids[start:start + self.batch_size])
+                    ExerciseUnitCurves.objects.bulk_create(restored.values())
+                ExerciseArchive.objects.filter(id__in=[archive.id for archive in archives]).delete()
+
+                def remove_bundles():
+                    for archive in archives:
+                        if os.path.exists(archive_path(archive.path)):
+                            os.remove(archive_path(archive.path))
+
+                transaction.on_commit(remove_bundles, using=alias)
+
+        log.info("exercise_units_restored", user_id=user.id, units=len(unit_ids), bundles=len(archives))
+        return len(unit_ids)
@@ -1,89 +1,228 @@
-from typing import List
-from core.models import ExerciseUnit, Soleus, Pelvis, PelvisRightSide, PelvisLeftSide, TibialisAnteriorLeftSide, TibialisAnteriorRightSide, MedialGastrocnemiusLeftSide, MedialGastrocnemiusRightSide, LateralGastrocnemiusLeftSide, LateralGastrocnemiusRightSide
-from core.models import SoleusLeftSide, SoleusRightSide, TibialisAnterior, MedialGastrocnemius, LateralGastrocnemius, Hip, Knee, Ankle, HipRightSide, HipLeftSide, KneeRightSide, KneeLeftSide, AnkleRightSide, AnkleLeftSide
-from common.utils.stats import get_summary
+from collections import defaultdict
+from typing import Dict, List
+import numpy as np
+from core.models import ExerciseUnit, ExerciseUnitSummary, Hip, Knee, Ankle, Pelvis
+from core.routers import analytics_reads
+from core.sharding import instance_shard
+from core.curves import CURVE_BODY_PARTS, SIDES, channel_key, load_curves, side_columns
+from common.utils.sketch import SummarySketch, sketches_from_stack
 
 BODY_PARTS_TO_COLS = {
         # Soleus: ['force_avg', 'force_std'],
         # TibialisAnterior: ['force_avg', 'force_std'],
         # MedialGastrocnemius: ['force_avg', 'force_std'],
         # LateralGastrocnemius: ['force_avg', 'force_std'],
-        Hip: ['flexion_avg', 'adduction_avg', 'rotation_avg', 'flexion_std', 'adduction_std', 'rotation_std'],
-        Knee: ['angle_avg', 'angle_std'],
-        Ankle: ['subtalar_angle_avg', 'angle_avg', 'subtalar_angle_std', 'angle_std'],
+        Hip: ['flexion_avg', 'adduction_avg', 'rotation_avg', 'flexion_std', 'adduction_std', 'rotation_std',
+              # Joint moments, only stored in packed curves (core.curves.TORQUE_CHANNELS)
+              'flexion_moment_avg', 'adduction_moment_avg', 'rotation_moment_avg',
+              'flexion_moment_std', 'adduction_moment_std', 'rotation_moment_std'],
+        Knee: ['angle_avg', 'angle_std', 'moment_avg', 'moment_std'],
+        Ankle: ['subtalar_angle_avg', 'angle_avg', 'subtalar_angle_std', 'angle_std',
+                'moment_avg', 'subtalar_moment_avg', 'moment_std', 'subtalar_moment_std'],
         Pelvis: ['tilt_angle_avg', 'list_angle_avg', 'rotation_angle_avg', 'tilt_angle_std', 'list_angle_std', 'rotation_angle_std']
 
     }
 
 
 def aggregate_summaries(summaries):
-    aggregated_summary = {}
-    # Calculate a rolling average of the columns
-    count = 1
+    """
+    Merge per-unit summary sketches into one sketch per body part, side and column.
+    The merge is order independent and never re-reads raw phase rows.
+    :param summaries: Iterable of {body_part: {side: {col: SummarySketch}}}.
+    :return: The merged mapping in the same shape.
+    """
+    collected = {}
     for summary in summaries:
         for body_part, sides in summary.items():
-            if body_part not in aggregated_summary:
-                aggregated_summary[body_part] = sides
-            else:
-                for side, cols in sides.items():
-                    if side not in aggregated_summary[body_part]:
-                        aggregated_summary[body_part][side] = cols
-                    else:
-                        for col, values in cols.items():
-                            if col not in aggregated_summary[body_part][side]:
-                                aggregated_summary[body_part][side][col] = values
-                            else:
-                                for key, value in values.items():
-                                    aggregated_summary[body_part][side][col][key] = ((aggregated_summary[body_part][side][col][key]*count) + value)/(count + 1)
-                                    count += 1
-
-    # Iterate through again and round the values
-    percision = 4
-    for body_part, sides in aggregated_summary.items():
-        for side, cols in sides.items():
-            for col, values in cols.items():
-                for key, value in values.items():
-                    aggregated_summary[body_part][side][col][key] = round(value, percision)
-    return aggregated_summary
+            for side, cols in sides.items():
+                for col, sketch in cols.items():
+                    collected.setdefault(body_part, {}).setdefault(side, {}).setdefault(col, []).append(sketch)
+
+    return {
+        body_part: {
+            side: {col: SummarySketch.merge_all(sketches) for col, sketches in cols.items()}
+            for side, cols in sides.items()
+        }
+        for body_part, sides in collected.items()
+    }
+
+
+def summarise_sketches(sketches, percision = 4):
+    """Turn a {body_part: {side: {col: SummarySketch}}} mapping into get_summary style dicts."""
+    return {
+        body_part: {
+            side: {col: sketch.summary(percision) for col, sketch in cols.items()}
+            for side, cols in sides.items()
+        }
+        for body_part, sides in sketches.items()
+    }
+
+
+def _body_part_tables(body_part):
+    """Return the snake case name and the left/right side models of a body part model."""
+    for name, (parent, left_side_model, right_side_model) in CURVE_BODY_PARTS.items():
+        if parent is body_part:
+            return name, left_side_model, right_side_model
+    raise ValueError(f"Unknown body part: {body_part.__name__}")
+
+
+def _side_table_blocks(body_part_name, side_model, cols, unit_ids) -> Dict[int, np.ndarray]:
+    """
+    Fetch a side table for many units in one query and split it per unit.
+    :return: ExerciseUnit id -> (phases, len(cols)) array, NaN for null values and
+        for columns the table does not have (curve-only channels).
+    """
+    stored = set(side_columns(side_model))
+    positions = [i for i, col in enumerate(cols) if col in stored]
+    if not positions:
+        return {}
+
+    rows = side_model.objects.filter(
+        **{f"{body_part_name}__gait_phase__exercise_unit__in": unit_ids}
+    ).values_list(f"{body_part_name}__gait_phase__exercise_unit", *[cols[i] for i in positions])
+
+    values = np.array(list(rows), dtype=np.float64)
+    if not values.size:
+        return {}
+
+    keys = values[:, 0].astype(np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    block = np.full((len(keys), len(cols)), np.nan)
+    block[:, positions] = values[order, 1:]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    return dict(zip(unique_keys.tolist(), np.split(block, starts[1:])))
+
+
+def _curve_block(curves, body_part_name, side, cols):
+    """Return a (phases, len(cols)) array from packed curves, or None if no column is stored."""
+    index = {key: i for i, key in enumerate(curves.channels)}
+    rows = [index.get(channel_key(body_part_name, side, col)) for col in cols]
+    if all(row is None for row in rows):
+        return None
+
+    matrix = curves.as_array()
+    block = np.full((curves.phase_count, len(cols)), np.nan)
+    for i, row in enumerate(rows):
+        if row is not None:
+            block[:, i] = matrix[row]
+    return block
+
+
+def _sketch_blocks(blocks: Dict[int, np.ndarray]) -> Dict[int, list]:
+    """
+    Build one SummarySketch per column of every unit's block.
+    Units with the same number of phases are stacked and reduced together.
+    :return: ExerciseUnit id -> list of SummarySketch, one per column.
+    """
+    unit_ids_by_length = defaultdict(list)
+    for unit_id, block in blocks.items():
+        unit_ids_by_length[block.shape[0]].append(unit_id)
+
+    results = {}
+    for unit_ids in unit_ids_by_length.values():
+        stacked = np.stack([blocks[unit_id] for unit_id in unit_ids])
+        results.update(zip(unit_ids, sketches_from_stack(stacked)))
+    return results
+
+
+def _stored_unit_sketches(unit_ids) -> Dict[int, dict]:
+    """Read the materialised summaries of the summarised columns in one query."""
+    wanted = {
+        (body_part.__name__, side_model.__name__, col)
+        for body_part, cols in BODY_PARTS_TO_COLS.items()
+        for side_model in _body_part_tables(body_part)[1:]
+        for col in cols
+    }
+
+    unit_sketches = {}
+    for row in ExerciseUnitSummary.objects.filter(exercise_unit__in=unit_ids).order_by('id'):
+        if (row.body_part, row.side, row.column) not in wanted:
+            continue
+        unit_sketches.setdefault(row.exercise_unit_id, {}).setdefault(row.body_part, {}).setdefault(row.side, {})[row.column] = row.to_sketch()
+    return unit_sketches
+
 
 class ExerciseSummaryService():
     def __init__(self, exercise_units: List[ExerciseUnit]):
         self.exercise_units = exercise_units
 
-    def run(self, aggregate = False):
+    def _load_blocks(self, unit_ids):
+        """
+        Load the raw values of every summarised column for all units at once: one
+        query for packed curves plus one per side table for the remaining units.
+        :return: (body part, side model) -> ExerciseUnit id -> (phases, cols) array.
+        """
+        curves_by_unit = load_curves(unit_ids)
+        table_unit_ids = [unit_id for unit_id in unit_ids if unit_id not in curves_by_unit]
+
+        blocks = {}
+        for body_part, cols in BODY_PARTS_TO_COLS.items():
+            body_part_name, left_side_model, right_side_model = _body_part_tables(body_part)
+            for side, side_model in zip(SIDES, (left_side_model, right_side_model)):
+                per_unit = {}
+                for unit_id, curves in curves_by_unit.items():
+                    block = _curve_block(curves, body_part_name, side, cols)
+                    if block is not None:
+                        per_unit[unit_id] = block
+                if table_unit_ids:
+                    per_unit.update(_side_table_blocks(body_part_name, side_model, cols, table_unit_ids))
+                blocks[(body_part, side_model)] = per_unit
+        return blocks
+
+    def compute_unit_sketches(self, unit_ids) -> Dict[int, dict]:
+        """
+        Summarise units from their raw curves, ignoring the materialised summaries.
+        :return: ExerciseUnit id -> {body_part: {side: {col: SummarySketch}}}.
+        """
+        sketches = {
+            key: _sketch_blocks(per_unit)
+            for key, per_unit in self._load_blocks(unit_ids).items()
+        }
+
+        unit_sketches = {}
+        for unit_id in unit_ids:
+            for body_part, cols in BODY_PARTS_TO_COLS.items():
+                _, left_side_model, right_side_model = _body_part_tables(body_part)
+                for side_model in (left_side_model, right_side_model):
+                    col_sketches = sketches[(body_part, side_model)].get(unit_id)
+                    if col_sketches is None:
+                        continue
+                    # Columns without data (e.g. torque of tables-only units) are left out, as in ExerciseUnitSummary
+                    unit_sketches.setdefault(unit_id, {}).setdefault(body_part.__name__, {})[side_model.__name__] = {
+                        col: sketch for col, sketch in zip(cols, col_sketches) if sketch.count
+                    }
+        return unit_sketches
+
+    def unit_sketches(self) -> Dict[int, dict]:
+        """
+        Summary sketches per unit, read from ExerciseUnitSummary where present
+        (one query) and computed from raw curves for the remaining units.
+        :return: ExerciseUnit id -> {body_part: {side: {col: SummarySketch}}}.
+        """
+        unit_ids = [exercise_unit.id for exercise_unit in self.exercise_units]
+        # The units of one service are one user's, on one shard
+        with analytics_reads(), instance_shard(self.exercise_units[0] if self.exercise_units else None):
+            unit_sketches = _stored_unit_sketches(unit_ids)
+            missing = [unit_id for unit_id in unit_ids if unit_id not in unit_sketches]
+            if missing:
+                unit_sketches.update(self.compute_unit_sketches(missing))
+        return unit_sketches
+
+    def run_sketches(self) -> List[dict]:
+        """
+        Summarise every unit as mergeable sketches.
+        :return: One {body_part: {side: {col: SummarySketch}}} per unit and body part.
+        """
+        unit_sketches = self.unit_sketches()
         summaries = []
         for exercise_unit in self.exercise_units:
-            gait_phases = exercise_unit.gait_phases.all()
-            for body_part, cols in BODY_PARTS_TO_COLS.items():
-                main_body_parts = body_part.objects.filter(gait_phase__in=gait_phases)
-                body_part_name = body_part.__name__
-                left_side_class_name = f"{body_part.__name__}LeftSide"
-                right_side_class_name = f"{body_part.__name__}RightSide"
-                # get the actual class from teh class name string
-                left_side_class = globals()[left_side_class_name]
-                right_side_class = globals()[right_side_class_name]
-
-                # use the bodypart class name as the query parameter
-                # Title case to snake case
-                body_part_name = ''.join(['_' + i.lower() if i.isupper() else i for i in body_part_name]).lstrip('_')
-        
-
-                left_side = left_side_class.objects.filter(**{f"{body_part_name}__in": main_body_parts})
-                right_side = right_side_class.objects.filter(**{f"{body_part_name}__in": main_body_parts})
-
-                summary = {
-                    body_part.__name__: {
-                        left_side_class_name: {
-                            col: get_summary([getattr(left, col) for left in left_side])
-                            for col in cols
-                        },
-                        right_side_class_name: {
-                            col: get_summary([getattr(right, col) for right in right_side])
-                            for col in cols
-                        }
-                }}
-                summaries.append(summary)
+            for body_part, sides in unit_sketches.get(exercise_unit.id, {}).items():
+                summaries.append({body_part: sides})
+        return summaries
 
+    def run(self, aggregate = False):
+        summaries = self.run_sketches()
         if aggregate:
-            return aggregate_summaries(summaries)
-        return summaries
\ No newline at end of file
+            return summarise_sketches(aggregate_summaries(summaries))
+        return [summarise_sketches(summary) for summary in summaries]
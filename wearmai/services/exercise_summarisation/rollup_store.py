@@ -0,0 +1,273 @@
+"""
+Weekly and monthly rollups of the unit summaries (core.models.ExerciseRollup).
+
+A rollup bucket is one user, exercise and period (ISO week or calendar month).
+New units are merged into their buckets' rows (add_to_rollups), which only reads
+the new units' summaries. Sketches cannot be subtracted, so when units are
+replaced, edited or deleted their buckets are recomputed from the summaries of
+the units they still hold (refresh_rollups), an indexed range read merged in
+memory. Bulk loaders wrap their work in deferred_rollups() so each bucket is
+recomputed or merged into once rather than per session.
+"""
+import contextvars
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from common.utils.sketch import SummarySketch
+from core.models import ExerciseRollup, ExerciseUnit, ExerciseUnitSummary
+from core.sharding import current_shard, using_shard
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class RollupBucket(NamedTuple):
+    user_id: int
+    exercise: str
+    period: str
+    start: date
+
+
+class _Pending(NamedTuple):
+    # (alias, bucket) pairs to recompute
+    buckets: Set[tuple]
+    # (alias, unit id) pairs to merge in
+    units: Set[tuple]
+
+
+# Work collected by the outermost deferred_rollups() block
+_deferred = contextvars.ContextVar('deferred_rollups', default=None)
+
+
+def period_start(day: date, period: str) -> date:
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown rollup period: {period}")
+
+
+def period_end(start: date, period: str) -> date:
+    """First day after the period starting on start."""
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=31)).replace(day=1)
+
+
+def unit_buckets(unit_ids: Iterable[int]) -> Set[RollupBucket]:
+    """The week and month buckets of the given units."""
+    unit_ids = list(unit_ids)
+    if not unit_ids:
+        return set()
+    sessions = (
+        ExerciseUnit.objects.filter(id__in=unit_ids)
+        .values_list('session__user_id', 'session__exercise', 'session__date')
+        .distinct()
+    )
+    return {
+        RollupBucket(user_id, exercise, period, period_start(day, period))
+        for user_id, exercise, day in sessions
+        for period in ExerciseRollup.PERIODS
+    }
+
+
+@contextmanager
+def deferred_rollups():
+    """
+    Collect the buckets refreshed and the units added in the block, and recompute or
+    merge into each bucket once on leaving it. When the block raises, the work it
+    already committed is still rolled up, but a failure doing so is only logged so
+    the block's own exception propagates.
+    """
+    if _deferred.get() is not None:
+        yield
+        return
+    pending = _Pending(set(), set())
+    token = _deferred.set(pending)
+    try:
+        yield
+    except BaseException:
+        try:
+            _refresh_pending(pending)
+        except Exception:
+            log.exception("deferred_rollups_refresh_failed", buckets=len(pending.buckets), units=len(pending.units))
+        raise
+    else:
+        _refresh_pending(pending)
+    finally:
+        _deferred.reset(token)
+
+
+def _refresh_pending(pending: _Pending) -> None:
+    for alias in {alias for alias, _ in pending.buckets | pending.units}:
+        buckets = {bucket for bucket_alias, bucket in pending.buckets if bucket_alias == alias}
+        with using_shard(alias):
+            _refresh_buckets(buckets)
+            # Recomputed buckets already hold their new units
+            _merge_units([unit_id for unit_alias, unit_id in pending.units if unit_alias == alias], skip=buckets)
+
+
+def refresh_rollups(buckets: Iterable[RollupBucket]) -> int:
+    """
+    Recompute the rollup rows of the given buckets from the stored unit summaries.
+    :return: The number of rollup rows written (0 when deferred).
+    """
+    buckets = set(buckets)
+    pending = _deferred.get()
+    if pending is not None:
+        pending.buckets.update((current_shard(), bucket) for bucket in buckets)
+        return 0
+    return _refresh_buckets(buckets)
+
+
+def add_to_rollups(unit_ids: Iterable[int]) -> int:
+    """
+    Merge the stored summaries of newly written units into their buckets' rollup rows.
+    Units must not be in their rollups yet; rebuilt or removed units go through refresh_rollups.
+    :return: The number of rollup rows written (0 when deferred).
+    """
+    unit_ids = list(unit_ids)
+    pending = _deferred.get()
+    if pending is not None:
+        pending.units.update((current_shard(), unit_id) for unit_id in unit_ids)
+        return 0
+    return _merge_units(unit_ids)
+
+
+def _store_sketch(row: ExerciseRollup, sketch: SummarySketch) -> None:
+    row.count = sketch.count
+    row.mean = sketch.mean
+    row.m2 = sketch.m2
+    row.min = sketch.min
+    row.max = sketch.max
+    row.digest = sketch.digest.to_bytes()
+
+
+def _refresh_buckets(buckets: Set[RollupBucket]) -> int:
+    written = 0
+    for bucket in sorted(buckets):
+        collected: Dict[tuple, list] = {}
+        units = set()
+        summaries = ExerciseUnitSummary.objects.filter(
+            exercise_unit__session__user_id=bucket.user_id,
+            exercise_unit__session__exercise=bucket.exercise,
+            exercise_unit__session__date__gte=bucket.start,
+            exercise_unit__session__date__lt=period_end(bucket.start, bucket.period),
+        )
+        for row in summaries:
+            collected.setdefault((row.body_part, row.side, row.column), []).append(row.to_sketch())
+            units.add(row.exercise_unit_id)
+
+        rows = []
+        for (body_part, side, column), sketches in collected.items():
+            row = ExerciseRollup(
+                user_id=bucket.user_id,
+                period=bucket.period,
+                period_start=bucket.start,
+                exercise=bucket.exercise,
+                body_part=body_part,
+                side=side,
+                column=column,
+                unit_count=len(units),
+            )
+            _store_sketch(row, SummarySketch.merge_all(sketches))
+            rows.append(row)
+        with transaction.atomic(using=router.db_for_write(ExerciseRollup)):
+            ExerciseRollup.objects.filter(
+                user_id=bucket.user_id, period=bucket.period, exercise=bucket.exercise, period_start=bucket.start,
+            ).delete()
+            ExerciseRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+
+    if buckets:
+        log.info("exercise_rollups_refreshed", buckets=len(buckets), rows=written)
+    return written
+
+
+def _merge_units(unit_ids: Iterable[int], skip: Set[RollupBucket] = frozenset()) -> int:
+    unit_ids = list(unit_ids)
+    if not unit_ids:
+        return 0
+    summaries: Dict[int, list] = {}
+    for row in ExerciseUnitSummary.objects.filter(exercise_unit__in=unit_ids):
+        summaries.setdefault(row.exercise_unit_id, []).append(row)
+
+    bucket_units: Dict[RollupBucket, list] = {}
+    sessions = ExerciseUnit.objects.filter(id__in=list(summaries)).values_list(
+        'id', 'session__user_id', 'session__exercise', 'session__date',
+    )
+    for unit_id, user_id, exercise, day in sessions:
+        for period in ExerciseRollup.PERIODS:
+            bucket = RollupBucket(user_id, exercise, period, period_start(day, period))
+            if bucket not in skip:
+                bucket_units.setdefault(bucket, []).append(unit_id)
+
+    written = 0
+    now = timezone.now()
+    for bucket, units in sorted(bucket_units.items()):
+        collected: Dict[tuple, list] = {}
+        for unit_id in units:
+            for row in summaries[unit_id]:
+                collected.setdefault((row.body_part, row.side, row.column), []).append(row.to_sketch())
+
+        with transaction.atomic(using=router.db_for_write(ExerciseRollup)):
+            existing = {
+                (row.body_part, row.side, row.column): row
+                for row in ExerciseRollup.objects.select_for_update().filter(
+                    user_id=bucket.user_id, period=bucket.period, exercise=bucket.exercise, period_start=bucket.start,
+                )
+            }
+            unit_count = len(units) + (next(iter(existing.values())).unit_count if existing else 0)
+            created = []
+            for (body_part, side, column), sketches in collected.items():
+                row = existing.get((body_part, side, column))
+                if row is not None:
+                    sketches.append(row.to_sketch())
+                else:
+                    row = ExerciseRollup(
+                        user_id=bucket.user_id,
+                        period=bucket.period,
+                        period_start=bucket.start,
+                        exercise=bucket.exercise,
+                        body_part=body_part,
+                        side=side,
+                        column=column,
+                    )
+                    created.append(row)
+                _store_sketch(row, SummarySketch.merge_all(sketches))
+            for row in [*existing.values(), *created]:
+                row.unit_count = unit_count
+                row.updated_at = now
+            ExerciseRollup.objects.bulk_update(
+                list(existing.values()), ['unit_count', 'count', 'mean', 'm2', 'min', 'max', 'digest', 'updated_at'],
+                batch_size=1000,
+            )
+            ExerciseRollup.objects.bulk_create(created, batch_size=1000)
+        written += len(collected)
+
+    if bucket_units:
+        log.info("exercise_rollups_merged", buckets=len(bucket_units), units=len(summaries), rows=written)
+    return written
+
+
+def rollup_sketches(user, period: str, exercise: str, last: Optional[int] = None) -> Dict[date, dict]:
+    """
+    Rolled-up sketches of a user, oldest period first.
+    :param last: Only the most recent periods with data, e.g. 3 for the last three months.
+    :return: Period start to {body_part: {side: {column: SummarySketch}}}, as aggregate_summaries gives.
+    """
+    rollups = ExerciseRollup.objects.filter(user=user, period=period, exercise=exercise)
+    if last is not None:
+        starts = list(
+            rollups.order_by('-period_start').values_list('period_start', flat=True).distinct()[:last]
+        )
+        rollups = rollups.filter(period_start__in=starts)
+
+    sketches = {}
+    for row in rollups.order_by('period_start'):
+        sketches.setdefault(row.period_start, {}).setdefault(row.body_part, {}).setdefault(row.side, {})[row.column] = row.to_sketch()
+    return sketches
@@ -0,0 +1,49 @@
+from typing import List
+from django.db import router, transaction
+from core.models import ExerciseUnitSummary
+from services.exercise_summarisation.exercise_summary_service import ExerciseSummaryService
+from services.exercise_summarisation.rollup_store import add_to_rollups, refresh_rollups, unit_buckets
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+def rebuild_unit_summaries(unit_ids: List[int], batch_size: int = 500, added: bool = False) -> int:
+    """
+    Recompute the materialised ExerciseUnitSummary rows of the given units, and the
+    weekly and monthly rollups they belong to.
+    :param unit_ids: Ids of the ExerciseUnits to rebuild.
+    :param batch_size: Number of units summarised per query batch.
+    :param added: The units were just written, so their summaries are merged into
+        the rollups rather than the rollups being recomputed.
+    :return: The number of summary rows written.
+    """
+    unit_ids = list(unit_ids)
+    written = 0
+    for start in range(0, len(unit_ids), batch_size):
+        batch = unit_ids[start:start + batch_size]
+        unit_sketches = ExerciseSummaryService([]).compute_unit_sketches(batch)
+        rows = [
+            ExerciseUnitSummary.from_sketch(unit_id, body_part, side, col, sketch)
+            for unit_id, body_parts in unit_sketches.items()
+            for body_part, sides in body_parts.items()
+            for side, cols in sides.items()
+            for col, sketch in cols.items()
+            if sketch.count
+        ]
+        with transaction.atomic(using=router.db_for_write(ExerciseUnitSummary)):
+            ExerciseUnitSummary.objects.filter(exercise_unit__in=batch).delete()
+            ExerciseUnitSummary.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+
+    log.info("exercise_unit_summaries_rebuilt", units=len(unit_ids), rows=written)
+    if added:
+        add_to_rollups(unit_ids)
+    else:
+        refresh_rollups(unit_buckets(unit_ids))
+    return written
+
+
+def invalidate_unit_summaries(unit_ids: List[int]) -> None:
+    """Drop materialised summaries so readers fall back to the raw curves."""
+    ExerciseUnitSummary.objects.filter(exercise_unit__in=unit_ids).delete()
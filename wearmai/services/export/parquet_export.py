@@ -0,0 +1,159 @@
+"""
+Columnar export of a user's biomechanics history.
+
+One row per (exercise, unit, phase) and one float32 column per curve channel,
+built per batch of units straight from the packed ExerciseUnitCurves blobs
+(units stored only as GaitPhase rows are read per batch through
+core.curves.gait_phase_curves) and written as Arrow record batches, so no
+per-row Python objects are created. stream() hands the file out one row group
+at a time, e.g. to an HTTP response.
+"""
+import io
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.curves import GAIT_CHANNELS, gait_phase_curves, load_curves
+from core.models import ExerciseSession, ExerciseUnit, UserProfile
+from core.routers import analytics_reads
+from core.sharding import user_shard
+import structlog
+
+log = structlog.get_logger(__name__)
+
+EXERCISES = ExerciseSession.EXERCISES
+
+METADATA_FIELDS = [
+    pa.field('user_id', pa.int64()),
+    pa.field('exercise', pa.dictionary(pa.int8(), pa.string())),
+    pa.field('exercise_id', pa.int64()),
+    pa.field('date', pa.date32()),
+    pa.field('exercise_unit_id', pa.int64()),
+    pa.field('speed', pa.float64()),
+    pa.field('phase', pa.int16()),
+]
+
+
+def export_schema(channels: List[str] = GAIT_CHANNELS) -> pa.Schema:
+    return pa.schema(METADATA_FIELDS + [pa.field(channel, pa.float32()) for channel in channels])
+
+
+def user_units(user: UserProfile) -> List[tuple]:
+    """:return: (exercise, exercise id, date, unit id, speed) of every unit of the user, by date."""
+    with user_shard(user):
+        units = list(ExerciseUnit.objects.filter(session__user=user).values_list(
+            'session__exercise', 'session_id', 'session__date', 'id', 'speed',
+        ))
+    return sorted(units, key=lambda unit: (unit[2], EXERCISES.index(unit[0]), unit[3]))
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream collecting what the Parquet writer wrote since the last drain()."""
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetExportService():
+    def __init__(self, channels: Optional[List[str]] = None, batch_size: int = 256):
+        self.channels = list(channels or GAIT_CHANNELS)
+        self.batch_size = batch_size
+        self.schema = export_schema(self.channels)
+        self._column = {channel: i for i, channel in enumerate(self.channels)}
+
+    def record_batches(self, user: UserProfile) -> Iterator[pa.RecordBatch]:
+        with analytics_reads():
+            units = user_units(user)
+        for start in range(0, len(units), self.batch_size):
+            # Not held across the yield, which would leak the routing into the consumer
+            with analytics_reads(), user_shard(user):
+                batch = self._record_batch(user, units[start:start + self.batch_size])
+            yield batch
+
+    def write(self, user: UserProfile, sink: Union[str, BinaryIO], compression: str = 'zstd') -> int:
+        """
+        Write the user's history as Parquet.
+        :param sink: File path or writable binary stream.
+        :return: Number of rows written.
+        """
+        rows = 0
+        with pq.ParquetWriter(sink, self.schema, compression=compression) as writer:
+            for batch in self.record_batches(user):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        log.info("parquet_export_written", user_id=user.id, rows=rows, channels=len(self.channels))
+        return rows
+
+    def stream(self, user: UserProfile, compression: str = 'zstd') -> Iterator[bytes]:
+        """The user's history as Parquet, in chunks of about one batch of units."""
+        sink = _ChunkSink()
+        rows = 0
+        with pq.ParquetWriter(sink, self.schema, compression=compression) as writer:
+            for batch in self.record_batches(user):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                yield sink.drain()
+        yield sink.drain()
+        log.info("parquet_export_streamed", user_id=user.id, rows=rows, bytes=sink.position)
+
+    def _record_batch(self, user: UserProfile, units: List[tuple]) -> pa.RecordBatch:
+        unit_ids = [unit[3] for unit in units]
+        stored = load_curves(unit_ids)
+        # Tables-only units: their side tables, read for the whole batch
+        tables = gait_phase_curves([unit_id for unit_id in unit_ids if unit_id not in stored])
+
+        blocks, phase_counts = [], []
+        for unit_id in unit_ids:
+            curves = stored.get(unit_id)
+            if curves is not None:
+                keys, matrix = curves.channels, curves.as_array()
+            elif tables.get(unit_id):
+                keys = list(tables[unit_id])
+                matrix = np.asarray([tables[unit_id][key] for key in keys], dtype=np.float32)
+            else:
+                # Neither packed curves nor side table values: no rows
+                keys, matrix = [], np.empty((0, 0), dtype=np.float32)
+            blocks.append((keys, matrix))
+            phase_counts.append(matrix.shape[1])
+
+        counts = np.asarray(phase_counts, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        values = np.full((offsets[-1], len(self.channels)), np.nan, dtype=np.float32)
+        for (keys, matrix), offset, count in zip(blocks, offsets, counts):
+            rows = [i for i, key in enumerate(keys) if key in self._column]
+            columns = [self._column[keys[i]] for i in rows]
+            values[offset:offset + count, columns] = matrix[rows].T
+
+        exercises, exercise_ids, dates, _, speeds = zip(*units)
+        exercise_codes = np.repeat([EXERCISES.index(exercise) for exercise in exercises], counts).astype(np.int8)
+        phases = np.concatenate([np.arange(count, dtype=np.int16) for count in counts])
+        arrays = [
+            pa.array(np.full(offsets[-1], user.id, dtype=np.int64)),
+            pa.DictionaryArray.from_arrays(pa.array(exercise_codes), pa.array(EXERCISES)),
+            pa.array(np.repeat(np.asarray(exercise_ids, dtype=np.int64), counts)),
+            pa.array(np.repeat(np.asarray(dates, dtype='datetime64[D]'), counts), type=pa.date32()),
+            pa.array(np.repeat(np.asarray(unit_ids, dtype=np.int64), counts)),
+            pa.array(np.repeat(np.asarray([np.nan if s is None else s for s in speeds], dtype=np.float64), counts), from_pandas=True),
+            pa.array(phases),
+        ] + [pa.array(values[:, i], from_pandas=True) for i in range(len(self.channels))]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
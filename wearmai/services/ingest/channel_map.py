@@ -0,0 +1,78 @@
+from typing import Dict, List, Tuple
+
+from core.channels import channel_key
+from services.ingest.trial_files import FILE_SIDES
+
+# File column (without its _l/_r suffix) -> (body part, side table column stem), per data type
+FILE_COLUMNS_TO_CHANNELS = {
+    'ikAng': {
+        'pelvis_tilt': ('pelvis', 'tilt_angle'),
+        'pelvis_list': ('pelvis', 'list_angle'),
+        'pelvis_rotation': ('pelvis', 'rotation_angle'),
+        'hip_flexion': ('hip', 'flexion'),
+        'hip_adduction': ('hip', 'adduction'),
+        'hip_rotation': ('hip', 'rotation'),
+        'knee_angle': ('knee', 'angle'),
+        'ankle_angle': ('ankle', 'angle'),
+        'subtalar_angle': ('ankle', 'subtalar_angle'),
+    },
+    # Joint moments; these channels are only stored in ExerciseUnitCurves (see core.curves)
+    'idTrq': {
+        'hip_flexion_moment': ('hip', 'flexion_moment'),
+        'hip_adduction_moment': ('hip', 'adduction_moment'),
+        'hip_rotation_moment': ('hip', 'rotation_moment'),
+        'knee_angle_moment': ('knee', 'moment'),
+        'ankle_angle_moment': ('ankle', 'moment'),
+        'subtalar_angle_moment': ('ankle', 'subtalar_moment'),
+    },
+    'musFor': {
+        'soleus': ('soleus', 'force'),
+        'tib_ant': ('tibialis_anterior', 'force'),
+        'med_gas': ('medial_gastrocnemius', 'force'),
+        'lat_gas': ('lateral_gastrocnemius', 'force'),
+    },
+}
+
+MODE_SUFFIXES = {'Ave': 'avg', 'Std': 'std'}
+
+
+def _split_side(column: str) -> Tuple[str, str]:
+    # The side is the last token, or precedes "_moment" in idTrq files (knee_angle_l_moment)
+    for suffix in FILE_SIDES:
+        if column.endswith(f"_{suffix}"):
+            return column[:-2], suffix
+        if column.endswith(f"_{suffix}_moment"):
+            return f"{column[:-len('_l_moment')]}_moment", suffix
+    return column, ''
+
+
+def trial_channels(data_type: str, mode: str, side: str, columns: List[str]) -> Dict[str, int]:
+    """
+    Map the columns of one trial file to curve channels.
+
+    Files list both legs' joints; the columns of the file's own side are used,
+    falling back to the only available side (muscle files only export `_r`).
+    :return: Channel key -> column index in the file.
+    """
+    mapping = FILE_COLUMNS_TO_CHANNELS.get(data_type, {})
+    candidates = {}
+    for index, column in enumerate(columns):
+        stem, column_side = _split_side(column)
+        if stem not in mapping:
+            continue
+        current = candidates.get(stem)
+        if current is None or column_side in ('', side):
+            candidates[stem] = (index, column_side)
+
+    channels = {}
+    for stem, (index, _) in candidates.items():
+        body_part, column_stem = mapping[stem]
+        key = channel_key(body_part, FILE_SIDES[side], f"{column_stem}_{MODE_SUFFIXES[mode]}")
+        channels[key] = index
+    return channels
+
+
+def missing_file_columns(data_type: str, columns: List[str]) -> List[str]:
+    """:return: The mapped column stems of a data type that a file has on neither side."""
+    present = {_split_side(column)[0] for column in columns}
+    return [stem for stem in FILE_COLUMNS_TO_CHANNELS.get(data_type, {}) if stem not in present]
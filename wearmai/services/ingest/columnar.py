@@ -0,0 +1,145 @@
+"""
+Reading Arrow/Parquet exports with the layout of services.export.parquet_export:
+one row per (exercise, unit, phase) and one column per curve channel.
+
+The table is sorted and converted column by column into a single NumPy matrix;
+units are then cut out of it as contiguous row ranges, so no Python object is
+built per row.
+"""
+import hashlib
+import os
+from datetime import date
+from typing import Dict, Iterator, List, NamedTuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from core.channels import split_channel_key
+from services.ingest.parsing import ParsedTrial
+from services.ingest.validation import EXPECTED_PHASES
+
+COLUMNAR_SUFFIXES = ('.parquet', '.arrow', '.feather')
+REQUIRED_COLUMNS = ('date', 'exercise', 'phase')
+
+
+def is_columnar(path: str) -> bool:
+    return os.path.isfile(path) and path.endswith(COLUMNAR_SUFFIXES)
+
+
+class ColumnarUnit(NamedTuple):
+    # "#<exercise>_<unit key>", recorded in the ingest manifest; independent of the
+    # file name so a renamed or re-encoded export stays unchanged
+    name: str
+    digest: str
+    size: int
+    trial: ParsedTrial
+
+
+class ColumnarSession(NamedTuple):
+    date: date
+    digest: str
+    units: List[ColumnarUnit]
+    # Unit name -> why it was not loaded
+    rejected: Dict[str, str]
+
+
+def read_columnar_table(path: str) -> pa.Table:
+    if path.endswith('.parquet'):
+        return pq.read_table(path)
+    return feather.read_table(path)
+
+
+def _channel_columns(table: pa.Table) -> List[str]:
+    channels = []
+    for name in table.column_names:
+        try:
+            split_channel_key(name)
+        except ValueError:
+            continue
+        channels.append(name)
+    return channels
+
+
+def _numpy(column: pa.ChunkedArray, dtype=None) -> np.ndarray:
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    values = column.to_numpy()
+    return values.astype(dtype) if dtype is not None else values
+
+
+def columnar_sessions(table: pa.Table, source_name: str) -> Iterator[ColumnarSession]:
+    """
+    Split a columnar table into per-date sessions of units.
+    Units are keyed by exercise_unit_id when the column exists, else by (exercise, speed).
+    :param source_name: File name used in error messages.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in table.column_names]
+    if missing:
+        raise ValueError(f"{source_name}: missing columns {', '.join(missing)}")
+    channels = _channel_columns(table)
+    if not channels:
+        raise ValueError(f"{source_name}: no channel columns")
+
+    if pa.types.is_dictionary(table.schema.field('exercise').type):
+        table = table.set_column(
+            table.schema.get_field_index('exercise'), 'exercise', table.column('exercise').cast(pa.string())
+        )
+    has_unit_ids = 'exercise_unit_id' in table.column_names
+    has_speed = 'speed' in table.column_names
+    unit_column = 'exercise_unit_id' if has_unit_ids else ('speed' if has_speed else 'exercise')
+    table = table.sort_by([
+        ('date', 'ascending'), ('exercise', 'ascending'), (unit_column, 'ascending'), ('phase', 'ascending'),
+    ])
+
+    days = _numpy(table.column('date').cast(pa.date32())).astype('datetime64[D]')
+    exercises = _numpy(table.column('exercise')).astype(str)
+    speeds = _numpy(table.column('speed'), np.float64) if has_speed else np.full(table.num_rows, np.nan)
+    unit_keys = _numpy(table.column('exercise_unit_id'), np.int64) if has_unit_ids else np.nan_to_num(speeds, nan=-1.0)
+    values = np.column_stack([_numpy(table.column(channel), np.float32) for channel in channels])
+
+    # Row ranges of units and of dates
+    new_unit = np.ones(table.num_rows, dtype=bool)
+    new_unit[1:] = (days[1:] != days[:-1]) | (exercises[1:] != exercises[:-1]) | (unit_keys[1:] != unit_keys[:-1])
+    unit_starts = np.flatnonzero(new_unit)
+    unit_ends = np.append(unit_starts[1:], table.num_rows)
+    date_starts = set(np.flatnonzero(np.r_[True, days[1:] != days[:-1]]).tolist())
+
+    sha = None
+    session = None
+    for start, end in zip(unit_starts, unit_ends):
+        if start in date_starts:
+            if session is not None:
+                yield session._replace(digest=sha.hexdigest())
+            sha = hashlib.sha256()
+            session = ColumnarSession(date=days[start].astype(date), digest='', units=[], rejected={})
+
+        exercise = str(exercises[start])
+        speed = None if np.isnan(speeds[start]) else float(speeds[start])
+        unit_key = int(unit_keys[start]) if has_unit_ids else len(session.units) + len(session.rejected)
+        name = f"#{exercise}_{unit_key}"
+
+        block = values[start:end]
+        if block.shape[0] != EXPECTED_PHASES:
+            session.rejected[name] = f"expected {EXPECTED_PHASES} phase rows, found {block.shape[0]}"
+            continue
+        if np.isinf(block).any():
+            session.rejected[name] = "infinite values"
+            continue
+
+        # Channels a unit does not carry are all-null in the shared layout
+        present = ~np.isnan(block).all(axis=0)
+        curves = {channel: block[:, j] for j, channel in enumerate(channels) if present[j]}
+        data = block[:, present].tobytes()
+        digest = hashlib.sha256(f"{exercise}\0{speed}\0".encode() + data).hexdigest()
+        sha.update(f"{name}\0{digest}\n".encode())
+        session.units.append(ColumnarUnit(
+            name=name,
+            digest=digest,
+            size=len(data),
+            trial=ParsedTrial(exercise=exercise, speed=speed, curves=curves),
+        ))
+
+    if session is not None:
+        yield session._replace(digest=sha.hexdigest())
@@ -0,0 +1,436 @@
+import os
+import re
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from core.curves import CURVE_BODY_PARTS, SIDES, TORQUE_CHANNELS, channel_key, side_columns
+from core.models import ExerciseSession, ExerciseUnit, ExerciseUnitCurves, GaitPhase, UserProfile
+from core.sharding import user_shard
+from services.exercise_summarisation.rollup_store import deferred_rollups, refresh_rollups, unit_buckets
+from services.exercise_summarisation.summary_store import rebuild_unit_summaries
+from services.ingest.columnar import columnar_sessions, read_columnar_table
+from services.ingest.manifest import FileFingerprint, IngestManifest
+from services.ingest.parsing import ParsedSession, ParsedTrial, iter_parsed_sessions
+from services.ingest.sources import find_sessions, find_subjects
+from services.ingest.validation import session_report
+from services.purge.purge_service import BulkPurgeService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+CURVE_STORAGE_MODES = ('tables', 'curves', 'both')
+
+
+class IngestStats(NamedTuple):
+    units: int
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class SubjectResult(NamedTuple):
+    subject: str
+    user_id: Optional[int]
+    stats: Optional[IngestStats]
+    # Why the subject failed; its transaction was rolled back
+    error: Optional[str] = None
+
+
+def read_user_info(subject_dir: str) -> dict:
+    """Read weight (kg) and height (cm) from a subject's user_info.txt, if present."""
+    path = os.path.join(subject_dir, 'user_info.txt')
+    if not os.path.exists(path):
+        return {}
+
+    info = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            number = re.search(r'[\d.]+', value)
+            if not number:
+                continue
+            if key.strip() == 'weight':
+                info['weight'] = float(number[0])
+            elif key.strip() == 'height':
+                height = float(number[0])
+                info['height'] = height * 100 if 'cm' not in value and height < 3 else height
+    return info
+
+
+def _nullable(values: np.ndarray) -> list:
+    # NaN (missing in the file) -> NULL
+    column = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        column[i] = None
+    return column
+
+
+class SessionWriter():
+    """
+    Writes parsed sessions with one transaction per session and bulk inserts,
+    into the packed ExerciseUnitCurves, the GaitPhase/side tables, or both,
+    on the user's shard.
+    The tables take about a hundred rows per phase-curve unit and are opt-in
+    ('tables' or 'both'); joint moment (torque) channels have no side tables.
+    """
+
+    def __init__(self, storage: Optional[str] = None):
+        self.storage = storage or getattr(settings, 'GAIT_CURVE_STORAGE', 'curves')
+        if self.storage not in CURVE_STORAGE_MODES:
+            raise ValueError(f"Invalid curve storage mode: {self.storage}")
+
+    def write(self, user: UserProfile, session_date: date, session: ParsedSession) -> Tuple[List[ExerciseUnit], IngestStats]:
+        """
+        Write a parsed session under the user's exercise sessions of session_date.
+        :return: The created units, in the order of session.trials, and the write stats.
+        """
+        exercises = sorted({trial.exercise for trial in session.trials})
+        unknown = [exercise for exercise in exercises if exercise not in ExerciseSession.EXERCISES]
+        if unknown:
+            raise ValueError(f"Unknown exercise: {', '.join(unknown)}")
+
+        start = time.perf_counter()
+        with user_shard(user) as alias, transaction.atomic(using=alias):
+            sessions = {}
+            for exercise_session in ExerciseSession.objects.filter(
+                user=user, date=session_date, exercise__in=exercises,
+            ).order_by('id'):
+                sessions.setdefault(exercise_session.exercise, exercise_session)
+            created = ExerciseSession.objects.bulk_create([
+                ExerciseSession(user=user, exercise=exercise, date=session_date)
+                for exercise in exercises if exercise not in sessions
+            ])
+            sessions.update((exercise_session.exercise, exercise_session) for exercise_session in created)
+
+            units = ExerciseUnit.objects.bulk_create([
+                ExerciseUnit(session=sessions[trial.exercise], speed=trial.speed)
+                for trial in session.trials
+            ])
+            rows = len(created) + len(units)
+
+            if self.storage in ('curves', 'both'):
+                ExerciseUnitCurves.objects.bulk_create([
+                    ExerciseUnitCurves.pack(unit, trial.curves)
+                    for unit, trial in zip(units, session.trials)
+                ])
+                rows += len(units)
+
+            if self.storage in ('tables', 'both'):
+                rows += self._write_tables(units, session.trials)
+            if self.storage == 'tables' and any(not set(trial.curves).isdisjoint(TORQUE_CHANNELS) for trial in session.trials):
+                log.warning("torque_channels_not_stored", day=session.day, storage=self.storage)
+
+            rebuild_unit_summaries([unit.id for unit in units], added=True)
+
+        return units, IngestStats(units=len(units), rows=rows, seconds=time.perf_counter() - start)
+
+    def _write_tables(self, units: List[ExerciseUnit], trials: List[ParsedTrial]) -> int:
+        gait_phases = {}
+        phase_rows = []
+        for unit, trial in zip(units, trials):
+            phase_count = len(next(iter(trial.curves.values()))) if trial.curves else 0
+            gait_phases[unit.id] = [GaitPhase(exercise_unit_id=unit.id, phase=float(i)) for i in range(phase_count)]
+            phase_rows.extend(gait_phases[unit.id])
+        GaitPhase.objects.bulk_create(phase_rows)
+        rows = len(phase_rows)
+
+        for body_part, (parent_model, left_side_model, right_side_model) in CURVE_BODY_PARTS.items():
+            # (unit, side model) pairs that have data for this body part
+            present = [
+                (unit, trial, side, side_model)
+                for unit, trial in zip(units, trials)
+                for side, side_model in zip(SIDES, (left_side_model, right_side_model))
+                if any(key.startswith(f"{body_part}.{side}.") for key in trial.curves)
+            ]
+            unit_ids = list(dict.fromkeys(unit.id for unit, *_ in present))
+            parent_rows = [
+                parent_model(gait_phase_id=gait_phase.pk)
+                for unit_id in unit_ids
+                for gait_phase in gait_phases[unit_id]
+            ]
+            parent_model.objects.bulk_create(parent_rows)
+            rows += len(parent_rows)
+
+            parent_ids = {}
+            for parent in parent_rows:
+                parent_ids.setdefault(parent.gait_phase_id, parent.pk)
+
+            side_rows = defaultdict(list)
+            fk_name = f"{body_part}_id"
+            for unit, trial, side, side_model in present:
+                cols = side_columns(side_model)
+                phase_count = len(gait_phases[unit.id])
+                values = [
+                    _nullable(trial.curves[key]) if key in trial.curves else [None] * phase_count
+                    for key in (channel_key(body_part, side, col) for col in cols)
+                ]
+                side_rows[side_model].extend(
+                    side_model(**{fk_name: parent_ids[gait_phase.pk]}, **dict(zip(cols, phase_values)))
+                    for gait_phase, phase_values in zip(gait_phases[unit.id], zip(*values))
+                )
+            for side_model, batch in side_rows.items():
+                side_model.objects.bulk_create(batch)
+                rows += len(batch)
+        return rows
+
+
+def purge_units(unit_ids: List[int]) -> List[int]:
+    """
+    Delete replaced units with everything hanging off them.
+    :return: Ids of the sessions they belonged to, for purge_empty_sessions().
+    """
+    if not unit_ids:
+        return []
+    session_ids = sorted(set(ExerciseUnit.objects.filter(id__in=unit_ids).values_list('session_id', flat=True)))
+    BulkPurgeService().purge(ExerciseUnit.objects.filter(id__in=unit_ids))
+    return session_ids
+
+
+def purge_empty_sessions(session_ids: List[int]) -> None:
+    """Delete the sessions among session_ids that have no units left, e.g. after a re-date."""
+    empty = list(
+        ExerciseSession.objects.filter(id__in=session_ids, exercise_units__isnull=True).values_list('id', flat=True)
+    )
+    if empty:
+        BulkPurgeService().purge(ExerciseSession.objects.filter(id__in=empty))
+        log.info("empty_sessions_deleted", sessions=len(empty))
+
+
+class SessionIngestService():
+    def __init__(self, writer: Optional[SessionWriter] = None, workers: int = 1, parse_cache: bool = False):
+        self.writer = writer or SessionWriter()
+        self.workers = workers
+        self.parse_cache = parse_cache
+
+    def ingest_subject(self, subject_path: str, user: UserProfile, start_date: Optional[date] = None) -> IngestStats:
+        """
+        Ingest the day_<N> sessions of a subject folder or archive; day N is dated start_date + N - 1 days.
+        Without a start_date the dates of the previous ingest are kept (today's for a first ingest),
+        as a different start_date re-dates, and so replaces, every recorded session.
+        Only sessions whose files changed since the last ingest (per the manifest) are parsed,
+        and within them only the changed trials, whose previous units are replaced atomically.
+        Trials failing validation are quarantined: not written, and their previous unit kept.
+        Sessions are parsed by `workers` processes and written in order by this one.
+        :return: Totals over the written sessions, timed including the rollup refresh.
+        """
+        start = time.perf_counter()
+        # The deferred rollups are refreshed on leaving the block
+        with user_shard(user) as alias, deferred_rollups():
+            units, rows = self._ingest_subject(subject_path, user, start_date, alias)
+        return IngestStats(units=units, rows=rows, seconds=time.perf_counter() - start)
+
+    def _ingest_subject(self, subject_path: str, user: UserProfile, start_date: Optional[date], alias: str) -> Tuple[int, int]:
+        manifest = IngestManifest(user)
+        start_date = start_date or manifest.start_date() or date.today()
+        plans = deque()
+
+        def jobs():
+            # Planned lazily so archive sessions are streamed rather than all held in memory
+            for source in find_sessions(subject_path):
+                plan = manifest.plan(source, start_date + timedelta(days=source.day - 1))
+                if plan is None:
+                    log.info("session_unchanged", day=source.day)
+                    continue
+                plans.append(plan)
+                yield source, plan.changed_trials
+
+        units = rows = 0
+        for session in iter_parsed_sessions(jobs(), self.workers, self.parse_cache):
+            plan = plans.popleft()
+            if session.report.rejected_trials:
+                log.warning("session_trials_quarantined", **session.report.to_dict())
+            with transaction.atomic(using=alias):
+                stale_unit_ids = plan.stale_unit_ids(keep=session.report.rejected_trials)
+                # Also covers exercises the session no longer has
+                stale_buckets = unit_buckets(stale_unit_ids)
+                stale_session_ids = purge_units(stale_unit_ids)
+                written, stats = self.writer.write(user, plan.date, session)
+                purge_empty_sessions(stale_session_ids)
+                refresh_rollups(stale_buckets)
+                manifest.record(plan, {
+                    (trial.exercise, trial.speed): unit
+                    for trial, unit in zip(session.trials, written)
+                }, session.report)
+            units += stats.units
+            rows += stats.rows
+            log.info(
+                "session_ingested",
+                day=session.day,
+                units=stats.units,
+                replaced_units=len(stale_unit_ids),
+                quarantined_trials=len(session.report.rejected_trials),
+                rows=stats.rows,
+                rows_per_second=round(stats.rows_per_second),
+            )
+        return units, rows
+
+    def ingest_columnar(self, path: str, user: UserProfile, start_date: Optional[date] = None) -> IngestStats:
+        """
+        Ingest an Arrow/Parquet file in the export layout (see services.ingest.columnar).
+        Rows are grouped into one session per date, numbered as day (date - start_date) + 1
+        so they share the manifest with text ingest; unchanged dates are skipped and
+        changed ones replace the session's previous units.
+        :param start_date: Date of day 1; defaults to the file's first date.
+        :return: Totals over the written sessions, timed including the rollup refresh.
+        """
+        start = time.perf_counter()
+        with user_shard(user) as alias, deferred_rollups():
+            units, rows = self._ingest_columnar(path, user, start_date, alias)
+        return IngestStats(units=units, rows=rows, seconds=time.perf_counter() - start)
+
+    def _ingest_columnar(self, path: str, user: UserProfile, start_date: Optional[date], alias: str) -> Tuple[int, int]:
+        manifest = IngestManifest(user)
+        mtime_ns = os.stat(path).st_mtime_ns
+        units = rows = 0
+        for session in columnar_sessions(read_columnar_table(path), os.path.basename(path)):
+            start_date = start_date or session.date
+            day = (session.date - start_date).days + 1
+            if day < 1:
+                raise ValueError(f"{path}: {session.date} is before the start date {start_date}")
+            if session.rejected:
+                log.warning("columnar_units_quarantined", day=day, date=str(session.date), errors=session.rejected)
+
+            recorded, stale_unit_ids = manifest.columnar_session(day)
+            if recorded is not None and recorded.digest == session.digest and recorded.date == session.date:
+                log.info("session_unchanged", day=day)
+                continue
+
+            location = f"{path}!{session.date}"
+            parsed = ParsedSession(
+                day=day,
+                path=location,
+                trials=[unit.trial for unit in session.units],
+                report=session_report(day, location, []),
+            )
+            with transaction.atomic(using=alias):
+                # Also covers exercises the session no longer has
+                stale_buckets = unit_buckets(stale_unit_ids)
+                stale_session_ids = purge_units(stale_unit_ids)
+                written, stats = self.writer.write(user, session.date, parsed)
+                purge_empty_sessions(stale_session_ids)
+                refresh_rollups(stale_buckets)
+                manifest.record_columnar(day, session.date, session.digest, [
+                    FileFingerprint(unit.name, unit.size, mtime_ns, unit.digest) for unit in session.units
+                ], written)
+            units += stats.units
+            rows += stats.rows
+            log.info(
+                "session_ingested",
+                day=day,
+                units=stats.units,
+                replaced_units=len(stale_unit_ids),
+                rows=stats.rows,
+                rows_per_second=round(stats.rows_per_second),
+            )
+        return units, rows
+
+
+class CohortIngestService():
+    """
+    Ingests a root of subject folders/archives, several subjects at a time.
+
+    Each subject runs in its own thread (with its own parser processes) and
+    its own transaction: a failing or interrupted subject rolls back alone,
+    manifest records included, and is ingested again from its first session
+    on the next run, while the manifest makes completed subjects no-ops. An
+    interrupted cohort load therefore resumes at the subjects it had not finished.
+    """
+
+    def __init__(
+        self,
+        writer: Optional[SessionWriter] = None,
+        subject_workers: int = 2,
+        workers: int = 1,
+        parse_cache: bool = False,
+    ):
+        self.writer = writer or SessionWriter()
+        self.subject_workers = max(subject_workers, 1)
+        self.workers = workers
+        self.parse_cache = parse_cache
+
+    def ingest_cohort(self, root: str, start_date: Optional[date] = None) -> List[SubjectResult]:
+        """
+        Ingest every subject under root into a user profile named after it.
+        :return: One SubjectResult per subject, in completion order.
+        """
+        subjects = find_subjects(root)
+        subject_workers = self.subject_workers
+        if connection.vendor == 'sqlite' and subject_workers > 1:
+            # SQLite has a single writer; concurrent per-user transactions would only wait on each other
+            log.warning("cohort_ingest_serialised", vendor=connection.vendor, subject_workers=subject_workers)
+            subject_workers = 1
+
+        results = []
+        users = self._resolve_users(subjects, results)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=subject_workers) as pool:
+            futures = [
+                pool.submit(self._ingest_subject, name, path, users[name], start_date)
+                for name, path in subjects if name in users
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                log.info(
+                    "subject_ingested" if result.error is None else "subject_failed",
+                    subject=result.subject,
+                    done=len(results),
+                    total=len(subjects),
+                    units=result.stats.units if result.stats else 0,
+                    error=result.error,
+                    elapsed_seconds=round(time.perf_counter() - start, 2),
+                )
+        return results
+
+    def _resolve_users(self, subjects: List[Tuple[str, str]], failed: List[SubjectResult]) -> Dict[str, UserProfile]:
+        """
+        Find or create each subject's profile, serially and before any subject starts,
+        as profile names are not unique. Subjects whose name is ambiguous (two subjects
+        or several profiles of that name) are added to failed and get no profile.
+        :return: Subject name to profile.
+        """
+        paths = defaultdict(list)
+        for name, path in subjects:
+            paths[name].append(path)
+        profiles = defaultdict(list)
+        for profile in UserProfile.objects.filter(name__in=list(paths)).order_by('id'):
+            profiles[profile.name].append(profile)
+
+        users = {}
+        for name, (path, *others) in paths.items():
+            if others:
+                error = f"{len(others) + 1} subjects are named {name!r}: {', '.join([path, *others])}"
+            elif len(profiles[name]) > 1:
+                error = f"{len(profiles[name])} user profiles are named {name!r}"
+            else:
+                users[name] = profiles[name][0] if profiles[name] else UserProfile.objects.create(
+                    name=name, **read_user_info(path),
+                )
+                continue
+            log.error("subject_ambiguous", subject=name, error=error)
+            failed.extend(SubjectResult(subject=name, user_id=None, stats=None, error=error) for _ in (path, *others))
+        return users
+
+    def _ingest_subject(self, name: str, path: str, user: UserProfile, start_date: Optional[date]) -> SubjectResult:
+        try:
+            # A failing subject also rolls back on its shard, which commits before the default database
+            with transaction.atomic(), user_shard(user) as alias, transaction.atomic(using=alias):
+                service = SessionIngestService(self.writer, workers=self.workers, parse_cache=self.parse_cache)
+                stats = service.ingest_subject(path, user, start_date)
+            return SubjectResult(subject=name, user_id=user.id, stats=stats)
+        except Exception as e:
+            log.exception("subject_ingest_error", subject=name)
+            return SubjectResult(subject=name, user_id=None, stats=None, error=f"{type(e).__name__}: {e}")
+        finally:
+            # Worker threads own their connections
+            connections.close_all()
@@ -0,0 +1,175 @@
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from common.utils.sketch import PhaseAccumulator
+from common.utils.stats import get_batch_summary
+from core.curves import GAIT_CHANNELS
+from core.models import ExerciseUnit, LiveSession, UserProfile
+from core.sharding import id_shard, user_shard, using_shard
+from services.ingest.ingest_service import SessionWriter
+from services.ingest.normalization import normalize_cycles
+from services.ingest.parsing import ParsedSession, ParsedTrial
+from services.ingest.validation import session_report
+import structlog
+
+log = structlog.get_logger(__name__)
+
+# Base channel keys a live session can record; each closes into its _avg and _std columns
+LIVE_CHANNELS = sorted(
+    key[:-len('_avg')] for key in GAIT_CHANNELS
+    if key.endswith('_avg') and f"{key[:-len('_avg')]}_std" in GAIT_CHANNELS
+)
+
+_UNCHANGED = object()
+
+
+class LiveSessionService():
+    """
+    Streaming ingest of gait cycles, phase-normalised or raw (see services.ingest.normalization).
+
+    Cycles only update the session's running per-phase mean/M2 (PhaseAccumulator),
+    so nothing is buffered; closing a unit writes the Ave/Std curves through the
+    regular SessionWriter and starts the next unit from an empty accumulator.
+    """
+
+    def __init__(self, writer: Optional[SessionWriter] = None):
+        self.writer = writer or SessionWriter()
+
+    def start(
+        self,
+        user: UserProfile,
+        exercise: str,
+        session_date: date,
+        channels: List[str],
+        speed: Optional[float] = None,
+        phase_count: int = 100,
+    ) -> LiveSession:
+        unknown = sorted(set(channels) - set(LIVE_CHANNELS))
+        if unknown:
+            raise ValueError(f"Unknown live channels: {', '.join(unknown)}")
+        if len(set(channels)) != len(channels):
+            raise ValueError("Duplicate live channels")
+        with user_shard(user):
+            session = LiveSession.objects.create(
+                user=user,
+                exercise=exercise,
+                date=session_date,
+                speed=speed,
+                channels=list(channels),
+                phase_count=phase_count,
+            )
+        log.info("live_session_started", live_session_id=session.id, channels=len(channels))
+        return session
+
+    def add_cycles(self, session_id: int, cycles: List[Dict[str, List[float]]]) -> LiveSession:
+        """
+        Fold a batch of cycles into the open unit.
+        :param cycles: One mapping of channel -> phase_count values per cycle; every
+            cycle must carry all of the session's channels.
+        """
+        return self._fold(session_id, lambda session: self._cycle_array(session, cycles))
+
+    def add_samples(self, session_id: int, samples: Dict[str, List[float]], heel_strikes: List[int]) -> LiveSession:
+        """
+        Time-normalise raw samples between heel strikes and fold the cycles into the open unit.
+        :param samples: Channel -> raw samples on a shared clock, for all of the session's channels.
+        :param heel_strikes: Sample indices of consecutive heel strikes.
+        """
+        def cycles(session):
+            missing = [channel for channel in session.channels if channel not in samples]
+            if missing:
+                raise ValueError(f"Samples are missing channel {missing[0]}")
+            try:
+                signals = np.column_stack([np.asarray(samples[channel], dtype=np.float64) for channel in session.channels])
+            except ValueError:
+                raise ValueError("Every channel needs the same number of samples")
+            if not np.isfinite(signals).all():
+                raise ValueError("Samples contain NaN or infinite values")
+            return normalize_cycles(signals, heel_strikes, session.phase_count)
+
+        return self._fold(session_id, cycles)
+
+    def _fold(self, session_id: int, cycles) -> LiveSession:
+        with using_shard(id_shard(session_id)) as alias, transaction.atomic(using=alias):
+            session = LiveSession.objects.select_for_update().get(pk=session_id)
+            if session.finished_at is not None:
+                raise ValueError("Live session is finished")
+
+            accumulator = session.accumulator()
+            accumulator.update(cycles(session))
+            session.store(accumulator)
+            session.save(update_fields=['cycle_count', 'mean', 'm2', 'updated_at'])
+        return session
+
+    def close_unit(self, session_id: int, next_speed=_UNCHANGED, finish: bool = False) -> Optional[ExerciseUnit]:
+        """
+        Finalise the open unit (a kilometre or trial) into an ExerciseUnit.
+        :param next_speed: Speed of the next unit, if it changes.
+        :param finish: Also end the session.
+        :return: The new unit, or None if no cycles were recorded since the last close.
+        """
+        with using_shard(id_shard(session_id)) as alias, transaction.atomic(using=alias):
+            session = LiveSession.objects.select_for_update().get(pk=session_id)
+            if session.finished_at is not None:
+                raise ValueError("Live session is finished")
+
+            unit = None
+            if session.cycle_count:
+                trial = ParsedTrial(exercise=session.exercise, speed=session.speed, curves=self.curves(session))
+                location = f"live:{session.id}"
+                parsed = ParsedSession(day=0, path=location, trials=[trial], report=session_report(0, location, []))
+                (unit,), _ = self.writer.write(session.user, session.date, parsed)
+                session.exercise_units.add(unit)
+
+            session.store(PhaseAccumulator.empty(len(session.channels), session.phase_count))
+            if next_speed is not _UNCHANGED:
+                session.speed = next_speed
+            if finish:
+                session.finished_at = timezone.now()
+            session.save()
+
+        log.info(
+            "live_unit_closed",
+            live_session_id=session.id,
+            exercise_unit_id=unit.id if unit else None,
+            finished=finish,
+        )
+        return unit
+
+    def curves(self, session: LiveSession) -> Dict[str, np.ndarray]:
+        """:return: The open unit's Ave/Std curves, keyed by full channel key."""
+        accumulator = session.accumulator()
+        curves = {}
+        for channel, mean, std in zip(session.channels, accumulator.mean, accumulator.std()):
+            curves[f"{channel}_avg"] = mean
+            curves[f"{channel}_std"] = std
+        return curves
+
+    def summary(self, session: LiveSession, percision: int = 4) -> dict:
+        """Summary statistics of the open unit's mean curves, per channel."""
+        if not session.cycle_count:
+            return {}
+        accumulator = session.accumulator()
+        return get_batch_summary(accumulator.mean.T, columns=session.channels).to_dict(percision)
+
+    def _cycle_array(self, session: LiveSession, cycles: List[Dict[str, List[float]]]) -> np.ndarray:
+        try:
+            array = np.array(
+                [[cycle[channel] for channel in session.channels] for cycle in cycles],
+                dtype=np.float64,
+            )
+        except KeyError as e:
+            raise ValueError(f"Cycle is missing channel {e.args[0]}")
+        except ValueError:
+            raise ValueError(f"Every channel of a cycle needs {session.phase_count} values")
+
+        expected = (len(cycles), len(session.channels), session.phase_count)
+        if array.shape != expected:
+            raise ValueError(f"Every channel of a cycle needs {session.phase_count} values")
+        if not np.isfinite(array).all():
+            raise ValueError("Cycles contain NaN or infinite values")
+        return array
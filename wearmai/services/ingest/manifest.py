@@ -0,0 +1,215 @@
+"""
+File-fingerprint manifest for incremental ingest.
+
+Each ingested session records the size, mtime and sha256 of every trial file
+it was loaded from. Re-ingesting a subject then hashes only files whose size
+or mtime moved, skips sessions whose digest is unchanged, and re-parses only
+the trials that have new, changed or removed files.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Collection, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from core.models import ExerciseUnit, IngestedSession, IngestedTrialFile, UserProfile
+from services.ingest.parsing import INGESTED_DATA_TYPES, TrialKey
+from services.ingest.sources import SessionSource
+from services.ingest.trial_files import parse_trial_filename
+from services.ingest.validation import SessionReport
+
+
+def _trial_key(name: str) -> TrialKey:
+    trial_file = parse_trial_filename(name)
+    # Rows recorded by a columnar import are not trial files; key them by name so they get replaced
+    return trial_file.trial if trial_file is not None else (name, None)
+
+
+class FileFingerprint(NamedTuple):
+    name: str
+    size: int
+    mtime_ns: int
+    digest: str
+
+    @property
+    def trial(self) -> TrialKey:
+        return _trial_key(self.name)
+
+
+class SessionPlan(NamedTuple):
+    source: SessionSource
+    date: date
+    digest: str
+    fingerprints: Dict[str, FileFingerprint]
+    # Trials with new, changed or removed files; only these are parsed and written
+    changed_trials: Set[TrialKey]
+    # Units built from the previous version of the changed trials
+    stale_units: Dict[TrialKey, Set[int]]
+    # Manifest rows of the previous ingest of this session, by file name
+    known: Dict[str, IngestedTrialFile]
+
+    def stale_unit_ids(self, keep: Collection[TrialKey] = ()) -> List[int]:
+        """:param keep: Trials whose previous units stay, e.g. because the new version was rejected."""
+        return sorted(
+            unit_id
+            for trial, unit_ids in self.stale_units.items() if trial not in keep
+            for unit_id in unit_ids
+        )
+
+
+def fingerprint_session(source: SessionSource, known: Dict[str, IngestedTrialFile]) -> Dict[str, FileFingerprint]:
+    """
+    Fingerprint the ingested trial files of a session.
+    Files whose size and mtime match their manifest row keep the recorded digest.
+    :return: File name -> FileFingerprint.
+    """
+    fingerprints = {}
+    for trial_file in source.trial_files():
+        if trial_file.data_type not in INGESTED_DATA_TYPES:
+            continue
+        name = trial_file.path
+        size, mtime_ns = source.stat(name)
+        row = known.get(name)
+        if row is not None and row.size == size and row.mtime_ns == mtime_ns:
+            digest = row.digest
+        else:
+            digest = source.digest(name)
+        fingerprints[name] = FileFingerprint(name, size, mtime_ns, digest)
+    return fingerprints
+
+
+def session_digest(fingerprints: Dict[str, FileFingerprint]) -> str:
+    sha = hashlib.sha256()
+    for name in sorted(fingerprints):
+        sha.update(f"{name}\0{fingerprints[name].digest}\n".encode())
+    return sha.hexdigest()
+
+
+class IngestManifest():
+    def __init__(self, user: UserProfile):
+        self.user = user
+
+    def start_date(self) -> Optional[date]:
+        """Date of day 1 of the recorded sessions, or None when nothing was ingested yet."""
+        session = IngestedSession.objects.filter(user=self.user).order_by('day').first()
+        return session.date - timedelta(days=session.day - 1) if session is not None else None
+
+    def plan(self, source: SessionSource, session_date: date) -> Optional[SessionPlan]:
+        """
+        Compare a session against its manifest.
+        :return: What to re-ingest, or None when the session is unchanged.
+        """
+        session = IngestedSession.objects.filter(user=self.user, day=source.day).first()
+        known = {row.name: row for row in session.files.all()} if session else {}
+        fingerprints = fingerprint_session(source, known)
+        digest = session_digest(fingerprints)
+
+        if session is not None and session.date == session_date and session.digest == digest:
+            self._refresh_mtimes(known, fingerprints)
+            return None
+
+        if session is not None and session.date != session_date:
+            # Re-dated sessions move every unit to the new date's exercises
+            changed_files = set(fingerprints) | set(known)
+        else:
+            changed_files = {
+                name for name, fingerprint in fingerprints.items()
+                if name not in known or known[name].digest != fingerprint.digest
+            } | (set(known) - set(fingerprints))
+        changed_trials = {_trial_key(name) for name in changed_files}
+
+        stale_units = defaultdict(set)
+        for name, row in known.items():
+            trial = _trial_key(name)
+            if row.exercise_unit_id is not None and trial in changed_trials:
+                stale_units[trial].add(row.exercise_unit_id)
+        return SessionPlan(
+            source=source,
+            date=session_date,
+            digest=digest,
+            fingerprints=fingerprints,
+            changed_trials=changed_trials,
+            stale_units=dict(stale_units),
+            known=known,
+        )
+
+    def record(self, plan: SessionPlan, units: Dict[TrialKey, ExerciseUnit], report: SessionReport) -> IngestedSession:
+        """
+        Store the fingerprints of an ingested plan; call inside the transaction that wrote its units.
+        Files of rejected trials are recorded with their validation errors (quarantined) and
+        stay linked to the trial's previous unit, if any; they are retried once they change.
+        :param units: The units written for the plan's changed trials.
+        :param report: The validation report of the parsed session.
+        """
+        errors = report.errors
+        session, _ = IngestedSession.objects.update_or_create(
+            user=self.user,
+            day=plan.source.day,
+            defaults={'date': plan.date, 'digest': plan.digest},
+        )
+        session.files.all().delete()
+
+        rows = []
+        for name, fingerprint in plan.fingerprints.items():
+            trial = fingerprint.trial
+            if trial not in plan.changed_trials:
+                # Not re-parsed: carry the previous row over
+                unit_id, file_errors = plan.known[name].exercise_unit_id, plan.known[name].errors
+            elif trial in report.rejected_trials:
+                unit_id, file_errors = min(plan.stale_units.get(trial, ()), default=None), errors.get(name, [])
+            else:
+                unit = units.get(trial)
+                unit_id, file_errors = (unit.id if unit is not None else None), []
+            rows.append(IngestedTrialFile(
+                session=session,
+                name=name,
+                size=fingerprint.size,
+                mtime_ns=fingerprint.mtime_ns,
+                digest=fingerprint.digest,
+                exercise_unit_id=unit_id,
+                errors=file_errors,
+            ))
+        IngestedTrialFile.objects.bulk_create(rows)
+        return session
+
+    def columnar_session(self, day: int) -> Tuple[Optional[IngestedSession], List[int]]:
+        """:return: The manifest row of a session and the units recorded for it."""
+        session = IngestedSession.objects.filter(user=self.user, day=day).first()
+        if session is None:
+            return None, []
+        unit_ids = session.files.exclude(exercise_unit=None).values_list('exercise_unit_id', flat=True)
+        return session, sorted(set(unit_ids))
+
+    def record_columnar(self, day: int, session_date: date, digest: str, files: List[FileFingerprint], units: List[ExerciseUnit]) -> IngestedSession:
+        """
+        Record a session loaded from a columnar file; each unit is recorded as one
+        pseudo-file ("<file name>#<unit key>") fingerprinting its slice of the table.
+        """
+        session, _ = IngestedSession.objects.update_or_create(
+            user=self.user,
+            day=day,
+            defaults={'date': session_date, 'digest': digest},
+        )
+        session.files.all().delete()
+        IngestedTrialFile.objects.bulk_create([
+            IngestedTrialFile(
+                session=session,
+                name=fingerprint.name,
+                size=fingerprint.size,
+                mtime_ns=fingerprint.mtime_ns,
+                digest=fingerprint.digest,
+                exercise_unit_id=unit.id,
+            )
+            for fingerprint, unit in zip(files, units)
+        ])
+        return session
+
+    def _refresh_mtimes(self, known: Dict[str, IngestedTrialFile], fingerprints: Dict[str, FileFingerprint]) -> None:
+        # Touched but identical files: remember the new mtime so they are not hashed again
+        touched = []
+        for name, fingerprint in fingerprints.items():
+            row = known[name]
+            if (row.size, row.mtime_ns) != (fingerprint.size, fingerprint.mtime_ns):
+                row.size, row.mtime_ns = fingerprint.size, fingerprint.mtime_ns
+                touched.append(row)
+        if touched:
+            IngestedTrialFile.objects.bulk_update(touched, ['size', 'mtime_ns'])
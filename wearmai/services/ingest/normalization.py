@@ -0,0 +1,99 @@
+"""
+Time normalisation of raw gait recordings into 100-phase curves.
+
+Cycles run from one heel strike to the next and are resampled onto a common
+phase grid with one gather and one linear blend for all cycles and channels
+at once (the batched equivalent of calling np.interp per cycle and channel).
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.ingest.parsing import ParsedTrial
+
+PHASE_COUNT = 100
+
+
+def normalize_cycles(
+    signals: np.ndarray,
+    heel_strikes: Sequence[int],
+    phase_count: int = PHASE_COUNT,
+    min_samples: int = 2,
+) -> np.ndarray:
+    """
+    Resample every heel-strike-to-heel-strike cycle to phase_count points.
+    Phase 0 is the opening heel strike and the last phase the closing one.
+    :param signals: Raw samples of shape (samples, channels), or (samples,) for one channel.
+    :param heel_strikes: Sample indices of consecutive heel strikes, ascending.
+    :param phase_count: Points per normalised cycle.
+    :param min_samples: Cycles spanning fewer samples than this are dropped.
+    :return: Array of shape (cycles, channels, phase_count).
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    if signals.ndim == 1:
+        signals = signals[:, None]
+    strikes = np.asarray(heel_strikes, dtype=np.int64)
+    if strikes.ndim != 1 or np.any(np.diff(strikes) <= 0):
+        raise ValueError("Heel strikes must be strictly increasing sample indices")
+    if len(strikes) and (strikes[0] < 0 or strikes[-1] >= len(signals)):
+        raise ValueError("Heel strikes must index into the signals")
+
+    starts, ends = strikes[:-1], strikes[1:]
+    keep = ends - starts + 1 >= min_samples
+    starts, ends = starts[keep], ends[keep]
+    if not len(starts):
+        return np.empty((0, signals.shape[1], phase_count))
+
+    # Fractional sample position of every (cycle, phase)
+    grid = np.linspace(0.0, 1.0, phase_count)
+    positions = starts[:, None] + (ends - starts)[:, None] * grid[None, :]
+    lower = np.minimum(np.floor(positions).astype(np.int64), len(signals) - 2)
+    weight = (positions - lower)[..., None]
+
+    # (cycles, phases, channels) -> (cycles, channels, phases)
+    resampled = signals[lower] * (1.0 - weight) + signals[lower + 1] * weight
+    return resampled.transpose(0, 2, 1)
+
+
+def cycle_curves(cycles: np.ndarray, ddof: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ave and Std curves over normalised cycles, ignoring NaN samples.
+    :param cycles: Array of shape (cycles, channels, phases).
+    :param ddof: Delta degrees of freedom of the Std curves (1: sample standard deviation).
+    :return: (mean, std), each of shape (channels, phases).
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nanmean(cycles, axis=0), np.nanstd(cycles, axis=0, ddof=ddof)
+
+
+def normalize_trial_curves(
+    signals: Dict[str, np.ndarray],
+    heel_strikes: Sequence[int],
+    phase_count: int = PHASE_COUNT,
+) -> Dict[str, np.ndarray]:
+    """
+    Turn raw channel recordings into the Ave/Std curves the curve tables expect.
+    :param signals: Base channel key (e.g. "knee.left_side.angle") -> raw samples;
+        all channels share the same sample clock.
+    :param heel_strikes: Sample indices of consecutive heel strikes.
+    :return: "<channel>_avg" and "<channel>_std" -> phase_count curve.
+    """
+    channels = list(signals)
+    cycles = normalize_cycles(np.column_stack([signals[key] for key in channels]), heel_strikes, phase_count)
+    mean, std = cycle_curves(cycles)
+
+    curves = {}
+    for channel, channel_mean, channel_std in zip(channels, mean, std):
+        curves[f"{channel}_avg"] = channel_mean.astype(np.float32)
+        curves[f"{channel}_std"] = channel_std.astype(np.float32)
+    return curves
+
+
+def normalized_trial(
+    exercise: str,
+    speed: Optional[float],
+    signals: Dict[str, np.ndarray],
+    heel_strikes: Sequence[int],
+) -> ParsedTrial:
+    """Build a ParsedTrial from raw recordings, ready for SessionWriter."""
+    return ParsedTrial(exercise=exercise, speed=speed, curves=normalize_trial_curves(signals, heel_strikes))
@@ -0,0 +1,115 @@
+"""
+Parsing of sessions (see services.ingest.sources) into per-trial channel curves.
+
+Kept free of Django imports so sessions can be parsed in worker processes
+while the parent process owns the database connection.
+"""
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Collection, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from services.ingest.channel_map import trial_channels
+from services.ingest.sources import SessionSource
+from services.ingest.validation import SessionReport, TrialFileReport, session_report, validate_trial_file
+
+# Data types whose channels are loaded; other trial files are ignored
+INGESTED_DATA_TYPES = ('ikAng', 'idTrq', 'musFor')
+
+# (exercise, speed), identifying a trial within a session
+TrialKey = Tuple[str, Optional[float]]
+
+# Parser processes are spawned rather than forked: the parent may run several
+# ingest threads (cohort ingest) holding logging or database locks that a forked
+# child would inherit locked
+_PROCESS_CONTEXT = multiprocessing.get_context('spawn')
+
+
+class ParsedTrial(NamedTuple):
+    exercise: str
+    speed: Optional[float]
+    # channel key -> curve over the gait phases
+    curves: Dict[str, np.ndarray]
+
+
+class ParsedSession(NamedTuple):
+    day: int
+    path: str
+    # Valid trials only; rejected ones are listed in the report
+    trials: List[ParsedTrial]
+    report: SessionReport
+
+
+def parse_session(
+    source: SessionSource,
+    trials: Optional[Collection[TrialKey]] = None,
+    cache: bool = False,
+) -> ParsedSession:
+    """
+    Parse every joint angle, joint moment and muscle force file of a session into
+    per-trial channel curves, dropping trials with a file that fails validation.
+    :param trials: Only parse these trials; all when None.
+    :param cache: Reuse/keep the .npy parse cache of each file (see read_trial_file).
+    """
+    curves_by_trial = defaultdict(dict)
+    reports = []
+    for trial_file in source.trial_files():
+        if trial_file.data_type not in INGESTED_DATA_TYPES:
+            continue
+        if trials is not None and trial_file.trial not in trials:
+            continue
+
+        try:
+            table = source.read_table(trial_file.path, cache=cache)
+        except (ValueError, UnicodeDecodeError) as e:
+            reports.append((trial_file, TrialFileReport.unreadable(trial_file.path, e)))
+            continue
+        reports.append((trial_file, validate_trial_file(trial_file, table)))
+
+        channels = trial_channels(trial_file.data_type, trial_file.mode, trial_file.side, table.columns)
+        curves = curves_by_trial[trial_file.trial]
+        for key, index in channels.items():
+            curves[key] = table.values[:, index]
+
+    report = session_report(source.day, source.location, reports)
+    trials = [
+        ParsedTrial(exercise=exercise, speed=speed, curves=curves)
+        for (exercise, speed), curves in curves_by_trial.items()
+        if (exercise, speed) not in report.rejected_trials
+    ]
+    return ParsedSession(day=source.day, path=source.location, trials=trials, report=report)
+
+
+def iter_parsed_sessions(
+    sessions: Iterable[tuple],
+    workers: int = 1,
+    cache: bool = False,
+) -> Iterator[ParsedSession]:
+    """
+    Parse sessions in a process pool, yielding them in input order.
+    At most 2 * workers parsed sessions wait in memory for the consumer.
+    :param sessions: parse_session positional arguments: a SessionSource,
+        optionally followed by the trials to parse.
+    :param workers: Number of parser processes; 1 or fewer parses in this process.
+    :param cache: Passed on to parse_session.
+    """
+    if workers <= 1:
+        for args in sessions:
+            yield parse_session(*args, cache=cache)
+        return
+
+    sessions = iter(sessions)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_PROCESS_CONTEXT) as pool:
+        pending = deque()
+        for args in sessions:
+            pending.append(pool.submit(parse_session, *args, cache=cache))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            session = pending.popleft().result()
+            next_args = next(sessions, None)
+            if next_args is not None:
+                pending.append(pool.submit(parse_session, *next_args, cache=cache))
+            yield session
@@ -0,0 +1,264 @@
+"""
+Session sources: where the trial files of a day_<N> session are read from.
+
+A subject can be an unpacked folder of day_<N> directories, or a .zip/.tar.gz
+bundle of them (the subject folder itself, or one day_<N>.zip per session).
+Archives are listed in a single streaming pass and never extracted to disk.
+Members of .zip and uncompressed .tar archives are read one at a time, when
+a file is digested or parsed, so a session holds only member names and
+offsets. A compressed tar cannot be seeked into, so each of its sessions is
+decompressed into memory as it is listed instead. Like parsing, this module
+has no Django imports so sources can be shipped to parser processes.
+"""
+import hashlib
+import os
+import re
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from services.ingest.trial_files import GaitPhaseTable, parse_trial_filename, read_trial_bytes, read_trial_file
+
+SESSION_DIR_PATTERN = re.compile(r'day_(\d+)')
+ARCHIVE_SUFFIXES = ('.zip', '.tar.gz', '.tgz', '.tar')
+
+
+def is_archive(path: str) -> bool:
+    return os.path.isfile(path) and path.endswith(ARCHIVE_SUFFIXES)
+
+
+class SessionSource(ABC):
+    """The trial files of one session."""
+    day: int
+    # Folder path, or "<archive>!day_<N>" for archive members
+    location: str
+
+    @abstractmethod
+    def file_names(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def stat(self, name: str) -> Tuple[int, int]:
+        """:return: (size in bytes, mtime in ns) of a file."""
+
+    @abstractmethod
+    def digest(self, name: str) -> str:
+        """:return: sha256 hex digest of a file's contents."""
+
+    @abstractmethod
+    def read_table(self, name: str, cache: bool = False) -> GaitPhaseTable:
+        ...
+
+    def trial_files(self):
+        """The recognised trial files of the session, ordered by name."""
+        for name in self.file_names():
+            trial_file = parse_trial_filename(name)
+            if trial_file is not None:
+                yield trial_file
+
+
+class DirectorySession(SessionSource):
+    def __init__(self, day: int, path: str):
+        self.day = day
+        self.location = path
+
+    def file_names(self) -> List[str]:
+        return sorted(os.listdir(self.location))
+
+    def stat(self, name: str) -> Tuple[int, int]:
+        stat = os.stat(os.path.join(self.location, name))
+        return stat.st_size, stat.st_mtime_ns
+
+    def digest(self, name: str) -> str:
+        sha = hashlib.sha256()
+        with open(os.path.join(self.location, name), 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def read_table(self, name: str, cache: bool = False) -> GaitPhaseTable:
+        return read_trial_file(os.path.join(self.location, name), cache=cache)
+
+
+class ArchiveMember(NamedTuple):
+    # Path of the member inside the archive
+    path: str
+    size: int
+    mtime_ns: int
+    # Start of the member's data in an uncompressed tar
+    offset: Optional[int] = None
+    # Contents, for members of compressed tars only
+    data: Optional[bytes] = None
+
+
+class ArchiveSession(SessionSource):
+    """A session inside an archive; members are read on demand (see the module docstring)."""
+
+    def __init__(self, day: int, archive: str, members: Dict[str, ArchiveMember]):
+        self.day = day
+        self.archive = archive
+        self.location = f"{archive}!day_{day}"
+        self.members = members
+
+    def file_names(self) -> List[str]:
+        return sorted(self.members)
+
+    def stat(self, name: str) -> Tuple[int, int]:
+        member = self.members[name]
+        return member.size, member.mtime_ns
+
+    def digest(self, name: str) -> str:
+        sha = hashlib.sha256()
+        for chunk in self._chunks(name):
+            sha.update(chunk)
+        return sha.hexdigest()
+
+    def read_table(self, name: str, cache: bool = False) -> GaitPhaseTable:
+        # There is no file to keep a parse cache sidecar next to
+        return read_trial_bytes(b''.join(self._chunks(name)), f"{self.location}/{name}")
+
+    def _chunks(self, name: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        member = self.members[name]
+        if member.data is not None:
+            yield member.data
+        elif member.offset is None:
+            with zipfile.ZipFile(self.archive) as archive, archive.open(member.path) as file:
+                yield from iter(lambda: file.read(chunk_size), b'')
+        else:
+            with open(self.archive, 'rb') as file:
+                file.seek(member.offset)
+                remaining = member.size
+                while remaining:
+                    chunk = file.read(min(chunk_size, remaining))
+                    if not chunk:
+                        raise ValueError(f"{self.location}/{name}: archive is truncated")
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+def _archive_day(path: str) -> Optional[int]:
+    name = os.path.basename(path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            match = SESSION_DIR_PATTERN.fullmatch(name[:-len(suffix)])
+            return int(match[1]) if match else None
+    return None
+
+
+def _iter_archive_members(path: str) -> Iterator[ArchiveMember]:
+    """Yield every regular file of an archive, in archive order."""
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                mtime_ns = int(datetime(*info.date_time).timestamp()) * 10**9
+                yield ArchiveMember(info.filename, info.file_size, mtime_ns)
+    else:
+        compressed = not path.endswith('.tar')
+        # 'r|*' reads the (possibly compressed) tar as a forward-only stream
+        with tarfile.open(path, 'r|*') as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                member = ArchiveMember(info.name, info.size, int(info.mtime) * 10**9)
+                if compressed:
+                    member = member._replace(data=archive.extractfile(info).read())
+                else:
+                    member = member._replace(offset=info.offset_data)
+                yield member
+
+
+def iter_archive_sessions(path: str) -> Iterator[ArchiveSession]:
+    """
+    Stream the sessions of an archive, one at a time, in archive order.
+    Trial files are grouped by their enclosing day_<N> folder; an archive named
+    day_<N>.zip (or .tar.gz) may also hold one session's files at its root.
+    Each session's files must be stored contiguously, as archivers write folders.
+    """
+    default_day = _archive_day(path)
+    done = set()
+    day, members = None, {}
+    for member in _iter_archive_members(path):
+        *folders, name = member.path.strip('/').split('/')
+        if parse_trial_filename(name) is None:
+            continue
+        matches = [SESSION_DIR_PATTERN.fullmatch(folder) for folder in folders]
+        days = [int(match[1]) for match in matches if match]
+        member_day = days[-1] if days else default_day
+        if member_day is None:
+            continue
+
+        if member_day != day:
+            if day is not None:
+                done.add(day)
+                yield ArchiveSession(day, path, members)
+            if member_day in done:
+                raise ValueError(f"{path}: files of day_{member_day} are not stored contiguously")
+            day, members = member_day, {}
+        members[name] = member
+
+    if day is not None:
+        yield ArchiveSession(day, path, members)
+
+
+def find_sessions(path: str) -> Iterator[SessionSource]:
+    """
+    Yield the sessions of a subject: a folder of day_<N> folders and/or day_<N>
+    archives (in day order), or a single archive of the subject's sessions.
+    Archive sessions are read lazily, as the iterator is consumed.
+    """
+    if is_archive(path):
+        yield from iter_archive_sessions(path)
+        return
+
+    entries = []
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        match = SESSION_DIR_PATTERN.fullmatch(name)
+        if match and os.path.isdir(entry):
+            entries.append((int(match[1]), entry))
+        elif is_archive(entry) and _archive_day(entry) is not None:
+            entries.append((_archive_day(entry), entry))
+
+    for day, entry in sorted(entries):
+        if os.path.isdir(entry):
+            yield DirectorySession(day, entry)
+        else:
+            yield from iter_archive_sessions(entry)
+
+
+def _archive_stem(path: str) -> str:
+    name = os.path.basename(path)
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _has_sessions(path: str) -> bool:
+    for name in os.listdir(path):
+        entry = os.path.join(path, name)
+        if SESSION_DIR_PATTERN.fullmatch(name) and os.path.isdir(entry):
+            return True
+        if is_archive(entry) and _archive_day(entry) is not None:
+            return True
+    return False
+
+
+def find_subjects(root: str) -> List[Tuple[str, str]]:
+    """
+    List the subjects of a cohort root: sub-folders holding day_<N> sessions,
+    and subject archives (named after the subject, e.g. User7.tar.gz).
+    :return: (subject name, path) pairs, ordered by name.
+    """
+    subjects = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and _has_sessions(path):
+            subjects.append((name, path))
+        elif is_archive(path) and _archive_day(path) is None:
+            subjects.append((_archive_stem(path), path))
+    return sorted(subjects)
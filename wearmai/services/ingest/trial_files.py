@@ -0,0 +1,138 @@
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+EXERCISE_TYPES = ('run', 'walk', 'jump', 'squat', 'land', 'lunge')
+FILE_SIDES = {'l': 'left_side', 'r': 'right_side'}
+
+# e.g. "Subj04_run_81_musForAve_l.txt" or "Subj04_squat_idTrqStd_r.txt"
+TRIAL_FILE_PATTERN = re.compile(
+    r'^(?P<subject>[^_]+)_(?P<exercise>[a-z]+)(?:_(?P<speed>\d+))?_'
+    r'(?P<data_type>ikAng|idTrq|musFor)(?P<mode>Ave|Std)_(?P<side>[lr])\.txt$'
+)
+
+# Sidecar directory, next to the text files, holding parsed .npy copies
+PARSE_CACHE_DIR = '.parse_cache'
+
+
+class TrialFile(NamedTuple):
+    path: str
+    subject: str
+    exercise: str
+    # km/h; the file name encodes it in tenths ("81" -> 8.1 km/h)
+    speed: Optional[float]
+    data_type: str
+    mode: str
+    side: str
+
+    @property
+    def trial(self) -> Tuple[str, Optional[float]]:
+        return self.exercise, self.speed
+
+
+class GaitPhaseTable(NamedTuple):
+    columns: List[str]
+    # column name -> index into values' second axis
+    index: Dict[str, int]
+    # float32, shape (rows, columns); rows are the gait phases
+    values: np.ndarray
+
+    def channel(self, column: str) -> np.ndarray:
+        return self.values[:, self.index[column]]
+
+
+def parse_trial_filename(path: str) -> Optional[TrialFile]:
+    """
+    Parse a trial file name into its parts.
+    :param path: Path (or bare name) of the file.
+    :return: A TrialFile, or None if the name does not follow the export convention.
+    """
+    match = TRIAL_FILE_PATTERN.match(os.path.basename(path))
+    if not match or match['exercise'] not in EXERCISE_TYPES:
+        return None
+
+    speed = match['speed']
+    return TrialFile(
+        path=path,
+        subject=match['subject'],
+        exercise=match['exercise'],
+        speed=int(speed) / 10 if speed else None,
+        data_type=match['data_type'],
+        mode=match['mode'],
+        side=match['side'],
+    )
+
+
+def _cache_path(path: str, stat: os.stat_result) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, PARSE_CACHE_DIR, f"{name}.{stat.st_size}.{stat.st_mtime_ns}.npy")
+
+
+def _write_cache(cache_path: str, values: np.ndarray) -> None:
+    directory, name = os.path.split(cache_path)
+    stem = name.rsplit('.', 3)[0]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so concurrent parsers never see a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, values)
+        os.replace(tmp_path, cache_path)
+        for stale in os.listdir(directory):
+            if stale.rsplit('.', 3)[0] == stem and stale.endswith('.npy') and stale != name:
+                os.remove(os.path.join(directory, stale))
+    except OSError:
+        # Read-only datasets simply go uncached
+        pass
+
+
+def read_trial_file(path: str, cache: bool = False, mmap: bool = False) -> GaitPhaseTable:
+    """
+    Read a tab separated gait-phase file into a float32 table.
+    :param path: The path to the text file.
+    :param cache: Keep the parsed values in a .npy sidecar (under PARSE_CACHE_DIR),
+        keyed on the file's size and mtime, and reuse it while the file is unchanged.
+    :param mmap: Memory-map the cached values instead of loading them (needs cache).
+    :return: The parsed GaitPhaseTable.
+    """
+    with open(path, 'r') as file:
+        header = file.readline()
+        columns = header.split()
+
+        cache_path = None
+        if cache:
+            cache_path = _cache_path(path, os.fstat(file.fileno()))
+            if os.path.exists(cache_path):
+                values = np.load(cache_path, mmap_mode='r' if mmap else None)
+                return GaitPhaseTable(columns, {column: i for i, column in enumerate(columns)}, values)
+
+        table = _parse_values(path, columns, file.read())
+
+    if cache_path is not None:
+        _write_cache(cache_path, table.values)
+    return table
+
+
+def read_trial_bytes(data: bytes, name: str = '<bytes>') -> GaitPhaseTable:
+    """
+    Parse the contents of a gait-phase file, e.g. an archive member read in memory.
+    :param data: The raw file contents.
+    :param name: Name used in error messages.
+    """
+    header, _, body = data.decode().partition('\n')
+    return _parse_values(name, header.split(), body)
+
+
+def _parse_values(name: str, columns: List[str], body: str) -> GaitPhaseTable:
+    if not columns:
+        raise ValueError(f"{name}: no column header")
+    try:
+        values = np.array(body.split(), dtype=np.float32)
+    except ValueError as e:
+        raise ValueError(f"{name}: {e}") from e
+    if values.size % len(columns):
+        raise ValueError(f"{name}: {values.size} values do not fill {len(columns)} columns")
+    index = {column: i for i, column in enumerate(columns)}
+    return GaitPhaseTable(columns, index, values.reshape(-1, len(columns)))
@@ -0,0 +1,109 @@
+"""
+Validation of parsed trial files before they are written.
+
+Each file is checked with whole-array operations over its ingested channel
+columns; a trial with any failing file is rejected as a whole and quarantined
+(its files are recorded in the manifest with their errors) instead of being
+written, so a bad file never aborts a bulk load halfway through.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from services.ingest.channel_map import missing_file_columns, trial_channels
+from services.ingest.trial_files import GaitPhaseTable, TrialFile
+
+EXPECTED_PHASES = 100
+# Joint angles (degrees) beyond this are export errors, not movement
+ANGLE_LIMIT = 180.0
+
+
+class TrialFileReport(NamedTuple):
+    name: str
+    rows: int
+    missing_channels: List[str]
+    nan_count: int
+    inf_count: int
+    # Angles beyond ANGLE_LIMIT, or negative standard deviations
+    out_of_range_count: int
+    parse_error: Optional[str] = None
+
+    @classmethod
+    def unreadable(cls, name: str, error: Exception) -> "TrialFileReport":
+        return cls(name, 0, [], 0, 0, 0, parse_error=str(error))
+
+    @property
+    def errors(self) -> List[str]:
+        if self.parse_error is not None:
+            return [f"unreadable: {self.parse_error}"]
+        errors = []
+        if self.rows != EXPECTED_PHASES:
+            errors.append(f"expected {EXPECTED_PHASES} phase rows, found {self.rows}")
+        if self.missing_channels:
+            errors.append(f"missing channels: {', '.join(self.missing_channels)}")
+        if self.nan_count:
+            errors.append(f"{self.nan_count} NaN values")
+        if self.inf_count:
+            errors.append(f"{self.inf_count} infinite values")
+        if self.out_of_range_count:
+            errors.append(f"{self.out_of_range_count} values out of range")
+        return errors
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class SessionReport(NamedTuple):
+    day: int
+    path: str
+    files: List[TrialFileReport]
+    # Trial (exercise, speed) -> names of its failing files
+    rejected_trials: Dict[Tuple[str, Optional[float]], List[str]]
+
+    @property
+    def errors(self) -> Dict[str, List[str]]:
+        return {report.name: report.errors for report in self.files if not report.ok}
+
+    def to_dict(self) -> dict:
+        return {
+            'day': self.day,
+            'path': self.path,
+            'files': len(self.files),
+            'rejected_trials': [
+                {'exercise': exercise, 'speed': speed, 'files': names}
+                for (exercise, speed), names in self.rejected_trials.items()
+            ],
+            'errors': self.errors,
+        }
+
+
+def validate_trial_file(trial_file: TrialFile, table: GaitPhaseTable) -> TrialFileReport:
+    """Check one parsed file: phase rows, required channels, finiteness and value ranges."""
+    indexes = list(trial_channels(trial_file.data_type, trial_file.mode, trial_file.side, table.columns).values())
+    block = np.asarray(table.values)[:, indexes]
+
+    finite = np.isfinite(block)
+    if trial_file.mode == 'Std':
+        out_of_range = finite & (block < 0)
+    elif trial_file.data_type == 'ikAng':
+        out_of_range = finite & (np.abs(block) > ANGLE_LIMIT)
+    else:
+        out_of_range = np.zeros_like(finite)
+
+    return TrialFileReport(
+        name=trial_file.path,
+        rows=block.shape[0],
+        missing_channels=missing_file_columns(trial_file.data_type, table.columns),
+        nan_count=int(np.isnan(block).sum()),
+        inf_count=int(np.isinf(block).sum()),
+        out_of_range_count=int(out_of_range.sum()),
+    )
+
+
+def session_report(day: int, path: str, files: List[Tuple[TrialFile, TrialFileReport]]) -> SessionReport:
+    rejected = {}
+    for trial_file, report in files:
+        if not report.ok:
+            rejected.setdefault(trial_file.trial, []).append(report.name)
+    return SessionReport(day=day, path=path, files=[report for _, report in files], rejected_trials=rejected)
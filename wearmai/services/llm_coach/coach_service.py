@@ -3,6 +3,7 @@ from infrastructure.llm_clients.factory import LLMClientFactory, LLModels
 from box import Box
 from core.serializers import RunDetailSerializer
 from core.models import Run
+from core.sharding import user_shard
 from services.prompts.structured_outputs import ConversationSummaryOutput, RunSummaryOutput, function_determinant_json_format, plotly_visualisation_output_format
 from services.prompts.llm_prompts import LLMPrompts, PromptType
 import json
@@ -33,14 +34,16 @@ class CoachService():
         self.history_summarisation_threshold = 5
 
     def get_raw_run_data(self,run_ids: list[int]) -> dict:
-        runs = Run.objects.filter(id__in=run_ids)
-        run_data = RunDetailSerializer(runs, many=True).data
+        with user_shard(self.user_profile['id']):
+            runs = Run.objects.filter(user_id=self.user_profile['id'], id__in=run_ids)
+            run_data = RunDetailSerializer(runs, many=True).data
 
         return json.dumps(run_data, indent=4)
 
     def get_run_summary(self, run_ids: list[int]) -> str:
-        runs = Run.objects.filter(id__in=run_ids)
-        run_data = RunDetailSerializer(runs, many=True).data
+        with user_shard(self.user_profile['id']):
+            runs = Run.objects.filter(user_id=self.user_profile['id'], id__in=run_ids)
+            run_data = RunDetailSerializer(runs, many=True).data
 
         system_prompt = LLMPrompts.get_prompt(PromptType.RUN_SUMMARY_GENERATOR_PROMPT, {"run_data": run_data,"user_profile": self.user_profile})
         client = self.llm_factory.get(LLModels.GEMINI_20_FLASH)
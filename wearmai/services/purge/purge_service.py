@@ -0,0 +1,146 @@
+"""
+Set-based deletion of exercise data.
+
+QuerySet.delete() collects every related row into memory before deleting it
+in chunks, which for a user means millions of gait phase and side rows.
+BulkPurgeService instead issues one DELETE per table, children first, each
+filtered by a subquery on its parent's rows, e.g.
+
+    DELETE FROM core_kneerightside WHERE knee_id IN
+        (SELECT id FROM core_knee WHERE gait_phase_id IN
+            (SELECT id FROM core_gaitphase WHERE exercise_unit_id IN (...)))
+
+so memory stays bounded and the time is that of the index lookups. Foreign
+keys are followed by their on_delete like the collector does (CASCADE deletes,
+SET_NULL clears); no delete signals are sent, as in the collector's own fast
+path.
+"""
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import QuerySet
+
+from core.archive import archive_path
+from core.models import ExerciseArchive, UserProfile
+from core.sharding import is_sharded, user_shard
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class PurgeReport(NamedTuple):
+    # Model label (as in QuerySet.delete()'s result) to rows deleted, tables without deletions left out
+    rows: Dict[str, int]
+    seconds: float
+
+    @property
+    def total(self) -> int:
+        return sum(self.rows.values())
+
+
+def _dependents(model) -> Iterator[models.ForeignKey]:
+    """Foreign keys pointing at model, those of M2M tables included."""
+    target = model._meta.concrete_model
+    for candidate in apps.get_models(include_auto_created=True):
+        if candidate._meta.proxy:
+            continue
+        for field in candidate._meta.local_fields:
+            if field.is_relation and (field.many_to_one or field.one_to_one) and field.related_model is target:
+                yield field
+
+
+def _write_db(queryset: QuerySet) -> str:
+    # Routed for writing, as QuerySet.delete() does
+    queryset = queryset.all()
+    queryset._for_write = True
+    return queryset.db
+
+
+class BulkPurgeService():
+    def purge(self, *querysets: QuerySet) -> PurgeReport:
+        """
+        Delete the rows of the querysets and every row depending on them, in one transaction.
+        The querysets must all use one database and should filter on the rows' own (or
+        their parents') columns: dependent rows are gone by the time a queryset is deleted.
+        """
+        using = {_write_db(queryset) for queryset in querysets}
+        if len(using) != 1:
+            raise ValueError(f"Querysets to purge must use one database, not {sorted(using)}")
+        alias = using.pop()
+
+        rows = Counter()
+        start = time.perf_counter()
+        with transaction.atomic(using=alias):
+            for queryset in querysets:
+                for action, step, field in self._plan(queryset.using(alias)):
+                    if action == 'null':
+                        step.update(**{field.attname: None})
+                        continue
+                    deleted = step._raw_delete(alias)
+                    if deleted:
+                        rows[step.model._meta.label] += deleted
+        report = PurgeReport(rows=dict(rows), seconds=time.perf_counter() - start)
+        log.info("bulk_purge_done", database=alias, rows=report.total, tables=len(report.rows), seconds=round(report.seconds, 3))
+        return report
+
+    def _plan(self, queryset: QuerySet, depth: int = 0) -> List[Tuple[str, QuerySet, models.Field]]:
+        """('delete' | 'null', queryset, field) steps that purge queryset, dependents first."""
+        if depth > 16:
+            raise ValueError(f"Foreign keys nested too deep below {queryset.model.__name__}")
+        parents = queryset.values('pk')
+        steps = []
+        for field in _dependents(queryset.model):
+            dependent = field.model._base_manager.using(queryset.db).filter(**{f"{field.name}__in": parents})
+            on_delete = field.remote_field.on_delete
+            if on_delete is models.CASCADE:
+                steps.extend(self._plan(dependent, depth + 1))
+            elif on_delete is models.SET_NULL:
+                steps.append(('null', dependent, field))
+            elif on_delete is not models.DO_NOTHING:
+                raise ValueError(
+                    f"Cannot purge {queryset.model.__name__}: {field.model.__name__}.{field.name} is {on_delete.__name__}"
+                )
+        steps.append(('delete', queryset, None))
+        return steps
+
+    def user_querysets(self, user, alias: str) -> List[QuerySet]:
+        """The exercise data of a user on one database, as the querysets to purge."""
+        user_id = getattr(user, 'pk', user)
+        return [
+            field.model._base_manager.using(alias).filter(**{field.attname: user_id})
+            for field in _dependents(UserProfile) if is_sharded(field.model)
+        ]
+
+    def purge_user(self, user: UserProfile, keep_profile: bool = False) -> PurgeReport:
+        """
+        Delete a user's exercise data, archive bundles included, e.g. for erasure or before a re-ingest.
+        :param keep_profile: Keep the profile, its shard placement and its conversations.
+        """
+        with user_shard(user) as alias:
+            paths = list(ExerciseArchive.objects.filter(user=user).values_list('path', flat=True))
+            with transaction.atomic(using=alias):
+                if keep_profile:
+                    report = self.purge(*self.user_querysets(user, alias))
+                else:
+                    # On a shard this is the shard's copy of the profile
+                    report = self.purge(UserProfile.objects.using(alias).filter(pk=user.pk))
+
+                def remove_bundles():
+                    for path in paths:
+                        if os.path.exists(archive_path(path)):
+                            os.remove(archive_path(path))
+
+                transaction.on_commit(remove_bundles, using=alias)
+
+        if not keep_profile and alias != DEFAULT_DB_ALIAS:
+            # The profile and the global rows
+            rows = Counter(report.rows)
+            global_rows = self.purge(UserProfile.objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk))
+            rows.update(global_rows.rows)
+            report = PurgeReport(rows=dict(rows), seconds=report.seconds + global_rows.seconds)
+        log.info("user_purged", user_id=user.pk, database=alias, rows=report.total, keep_profile=keep_profile)
+        return report
@@ -0,0 +1,145 @@
+"""
+Moving users' exercise data between shards (see core.sharding).
+
+A move copies every sharded row of the user to the target shard, parents
+first, in batches; each row gets a new id from the target's id range and the
+foreign keys pointing at it are remapped. The placement is then switched and
+the source rows deleted. An interrupted move leaves the user on the source
+and is simply run again. Writes for the user are not blocked during a move,
+so move users that are not ingesting.
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.models import UserProfile, UserShard
+from core.sharding import (
+    copy_profile, initial_shard, policy_shard, shard_aliases, shard_for, sharded_models, user_lookup,
+)
+from services.purge.purge_service import BulkPurgeService
+import structlog
+
+log = structlog.get_logger(__name__)
+
+
+class ShardMove(NamedTuple):
+    user_id: int
+    source: str
+    target: str
+
+
+class ShardRebalanceService():
+    def __init__(self, batch_size: int = 2000):
+        self.batch_size = batch_size
+
+    def plan(self) -> List[ShardMove]:
+        """
+        Users not on their policy_shard(), e.g. after shards were added. Read-only, so
+        unplaced users are left unplaced and planned from their initial_shard().
+        """
+        placements = dict(UserShard.objects.values_list('user_id', 'shard'))
+        moves = []
+        for user_id in UserProfile.objects.order_by('id').values_list('id', flat=True):
+            source = placements.get(user_id) or initial_shard(user_id)
+            if source != policy_shard(user_id):
+                moves.append(ShardMove(user_id, source, policy_shard(user_id)))
+        return moves
+
+    def plan_user(self, user_id: int, target: Optional[str] = None) -> Optional[ShardMove]:
+        """
+        The move of one user to target (default: its policy_shard()), or None when it is
+        already there. Read-only, like plan().
+        """
+        source = UserShard.objects.filter(user_id=user_id).values_list('shard', flat=True).first() or initial_shard(user_id)
+        target = target or policy_shard(user_id)
+        return ShardMove(user_id, source, target) if source != target else None
+
+    def move_user(self, user, target: str) -> int:
+        """
+        Move a user's exercise data to the target shard.
+        :param user: UserProfile or its id.
+        :return: Number of rows moved.
+        """
+        if target not in shard_aliases():
+            raise ValueError(f"Unknown shard: {target}")
+        if not connections[target].features.can_return_rows_from_bulk_insert:
+            raise ValueError(f"Shard {target} cannot return the ids of bulk inserts")
+        user_id = getattr(user, 'pk', user)
+        source = shard_for(user_id)
+        if source == target:
+            return 0
+
+        models = sharded_models()
+        copy_profile(user_id, target)
+        with transaction.atomic(using=target):
+            # Rows left by an interrupted move
+            self._delete(user_id, target)
+            rows = self._copy(models, user_id, source, target)
+        UserShard.objects.filter(user_id=user_id).update(shard=target, updated_at=timezone.now())
+        with transaction.atomic(using=source):
+            self._delete(user_id, source)
+            if source != DEFAULT_DB_ALIAS:
+                UserProfile.objects.using(source).filter(pk=user_id).delete()
+
+        log.info("user_shard_moved", user_id=user_id, source=source, target=target, rows=rows)
+        return rows
+
+    def _copy(self, models: List[type], user_id: int, source: str, target: str) -> int:
+        # Source id -> target id, for the models other sharded models point at
+        id_maps: Dict[type, Dict[int, int]] = {}
+        referenced = {
+            field.related_model
+            for model in models for field in model._meta.concrete_fields if field.is_relation
+        }
+        rows = 0
+        for model in models:
+            fields = model._meta.concrete_fields
+            queryset = (
+                model._base_manager.using(source)
+                .filter(**{user_lookup(model): user_id})
+                .order_by(model._meta.pk.attname)
+                .values_list(*[field.attname for field in fields])
+            )
+            if model in referenced:
+                id_maps[model] = {}
+            batch = []
+            for values in queryset.iterator(chunk_size=self.batch_size):
+                batch.append(values)
+                if len(batch) == self.batch_size:
+                    rows += self._insert(model, batch, id_maps, target)
+                    batch = []
+            if batch:
+                rows += self._insert(model, batch, id_maps, target)
+        return rows
+
+    def _insert(self, model, batch: List[tuple], id_maps: Dict[type, Dict[int, int]], target: str) -> int:
+        fields = model._meta.concrete_fields
+        pk_name = model._meta.pk.attname
+        remapped = [field for field in fields if field.is_relation and field.related_model in id_maps]
+        # bulk_create stamps auto_now(_add) fields; they are written back below
+        stamped = [field for field in fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+
+        source_ids, objs, stamps = [], [], []
+        for values in batch:
+            row = dict(zip([field.attname for field in fields], values))
+            source_ids.append(row.pop(pk_name))
+            for field in remapped:
+                if row[field.attname] is not None:
+                    row[field.attname] = id_maps[field.related_model][row[field.attname]]
+            objs.append(model(**row))
+            stamps.append([row[field.attname] for field in stamped])
+
+        model._base_manager.using(target).bulk_create(objs)
+        if stamped:
+            for obj, values in zip(objs, stamps):
+                for field, value in zip(stamped, values):
+                    setattr(obj, field.attname, value)
+            model._base_manager.using(target).bulk_update(objs, [field.name for field in stamped])
+        if model in id_maps:
+            id_maps[model].update(zip(source_ids, (obj.pk for obj in objs)))
+        return len(objs)
+
+    def _delete(self, user_id: int, alias: str) -> None:
+        purger = BulkPurgeService()
+        purger.purge(*purger.user_querysets(user_id, alias))
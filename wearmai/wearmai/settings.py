@@ -54,10 +54,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RoutingScopeMiddleware',
 ]
 
 ROOT_URLCONF = 'wearmai.urls'
 
+# API views are closed unless they say otherwise; per-user data also checks
+# ownership (core.permissions.IsProfileOwner)
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -80,12 +87,105 @@ WSGI_APPLICATION = 'wearmai.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE selects 'sqlite' (single node, default) or 'postgresql' (production)
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
+# Seconds a connection is kept open and reused; health checks drop broken ones before reuse
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', '60'))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'wearmai'),
+            'USER': os.getenv('DATABASE_USER', ''),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', 'localhost'),
+            'PORT': os.getenv('DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    # psycopg connection pool (needs psycopg[pool]); replaces persistent connections
+    if os.getenv('DATABASE_POOL', 'true').lower() in ('1', 'true', 'yes'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DATABASE_POOL_TIMEOUT', '10')),
+        }
+elif DATABASE_ENGINE == 'sqlite':
+    # WAL lets readers run alongside the single writer; IMMEDIATE transactions take the
+    # write lock up front so concurrent writers wait on the busy timeout instead of
+    # failing with "database is locked" when a read lock cannot be upgraded
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))};"
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                # Busy timeout, in seconds
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+            },
+        }
+    }
+else:
+    raise ValueError(f"Unsupported DATABASE_ENGINE: {DATABASE_ENGINE}")
+
+# Extra databases for per-user sharding of exercise data (see core.sharding); 'default'
+# stays shard 0 and keeps the global tables. Only ever add shards: a shard's position
+# fixes the range its ids are allocated from.
+DATABASE_SHARDS = ['default']
+for index in range(1, int(os.getenv('DATABASE_SHARDS', '0')) + 1):
+    alias = f'shard_{index}'
+    if DATABASE_ENGINE == 'sqlite':
+        default_path = Path(DATABASES['default']['NAME'])
+        shard_name = default_path.with_name(f'{default_path.stem}_shard_{index}{default_path.suffix}')
+    else:
+        shard_name = f"{DATABASES['default']['NAME']}_shard_{index}"
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.getenv(f'DATABASE_SHARD_{index}_NAME', shard_name),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+    }
+    for key in ('USER', 'PASSWORD', 'HOST', 'PORT'):
+        if os.getenv(f'DATABASE_SHARD_{index}_{key}'):
+            DATABASES[alias][key] = os.getenv(f'DATABASE_SHARD_{index}_{key}')
+    DATABASE_SHARDS.append(alias)
+
+# Optional replica / analytics copy of the primary. Summary, serializer and export
+# reads go there (see core.routers) until the request writes something.
+if os.getenv('DATABASE_ANALYTICS_NAME') or os.getenv('DATABASE_ANALYTICS_HOST'):
+    DATABASES['analytics'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DATABASE_ANALYTICS_NAME', DATABASES['default']['NAME']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    for key in ('USER', 'PASSWORD', 'HOST', 'PORT'):
+        if os.getenv(f'DATABASE_ANALYTICS_{key}'):
+            DATABASES['analytics'][key] = os.getenv(f'DATABASE_ANALYTICS_{key}')
+
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.AnalyticsRouter']
+
+# How gait curves are written at ingest: 'curves' (packed ExerciseUnitCurves only),
+# 'tables' (GaitPhase + joint/muscle rows) or 'both'. The tables are only needed by
+# the admin's gait phase inlines and are slow to fill, so they are opt-in
+GAIT_CURVE_STORAGE = os.getenv('GAIT_CURVE_STORAGE', 'curves')
+
+# Cold tier: the archive_units command moves the curves of units older than
+# EXERCISE_ARCHIVE_AFTER_DAYS into zstd bundles under EXERCISE_ARCHIVE_DIR (see core.archive)
+EXERCISE_ARCHIVE_DIR = os.getenv('EXERCISE_ARCHIVE_DIR', BASE_DIR / 'archive')
+EXERCISE_ARCHIVE_AFTER_DAYS = int(os.getenv('EXERCISE_ARCHIVE_AFTER_DAYS', '180'))
+EXERCISE_ARCHIVE_ZSTD_LEVEL = int(os.getenv('EXERCISE_ARCHIVE_ZSTD_LEVEL', '10'))
 
 
 # Password validation